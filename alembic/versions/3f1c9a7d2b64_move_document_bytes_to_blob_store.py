@@ -0,0 +1,68 @@
+"""Move document bytes from documents.file_content to the blob store
+
+Revision ID: 3f1c9a7d2b64
+Revises: 0edbbbef8fb5
+Created: 2025-09-22 09:15:00.000000
+"""
+
+import io
+import mimetypes
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import BYTEA
+
+revision = '3f1c9a7d2b64'
+down_revision = '0edbbbef8fb5'
+
+def upgrade():
+    op.add_column('documents', sa.Column('file_hash', sa.String(64), nullable=True))
+    op.add_column('documents', sa.Column('file_size', sa.BigInteger(), nullable=True))
+    op.add_column('documents', sa.Column('mime_type', sa.String(255), nullable=True))
+    op.create_index('ix_documents_file_hash', 'documents', ['file_hash'])
+
+    # Chuyển bytes hiện có sang blob store, row chỉ giữ hash/size/mime
+    from app.services.blob_store import get_blob_store
+    store = get_blob_store()
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(
+        "SELECT id, filename FROM documents WHERE file_content IS NOT NULL"
+    )).fetchall()
+    for doc_id, filename in rows:
+        content = conn.execute(
+            sa.text("SELECT file_content FROM documents WHERE id = :id"), {"id": doc_id}
+        ).scalar()
+        blob = store.save_stream(io.BytesIO(bytes(content)))
+        conn.execute(
+            sa.text("UPDATE documents SET file_hash = :h, file_size = :s, mime_type = :m WHERE id = :id"),
+            {
+                "h": blob.sha256,
+                "s": blob.size,
+                "m": mimetypes.guess_type(filename or "")[0] or "application/octet-stream",
+                "id": doc_id,
+            },
+        )
+
+    op.drop_column('documents', 'file_content')
+
+def downgrade():
+    op.add_column('documents', sa.Column('file_content', BYTEA(), nullable=True))
+
+    from app.services.blob_store import get_blob_store
+    store = get_blob_store()
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(
+        "SELECT id, file_hash FROM documents WHERE file_hash IS NOT NULL"
+    )).fetchall()
+    for doc_id, file_hash in rows:
+        with store.open_local(file_hash) as path:
+            content = path.read_bytes()
+        conn.execute(
+            sa.text("UPDATE documents SET file_content = :c WHERE id = :id"),
+            {"c": content, "id": doc_id},
+        )
+
+    op.drop_index('ix_documents_file_hash', table_name='documents')
+    op.drop_column('documents', 'mime_type')
+    op.drop_column('documents', 'file_size')
+    op.drop_column('documents', 'file_hash')
@@ -0,0 +1,38 @@
+"""Add documents.parsed_content and document_chunks table
+
+Revision ID: 8b2e4d6f1a93
+Revises: 3f1c9a7d2b64
+Created: 2025-09-23 10:05:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '8b2e4d6f1a93'
+down_revision = '3f1c9a7d2b64'
+
+def upgrade():
+    op.add_column('documents', sa.Column('parsed_content', sa.Text(), nullable=True))
+
+    op.create_table(
+        'document_chunks',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('document_id', sa.Integer(), sa.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('level', sa.String(20), nullable=False),
+        sa.Column('path', sa.String(512), nullable=False, server_default=''),
+        sa.Column('heading', sa.String(255), nullable=True),
+        sa.Column('start_offset', sa.Integer(), nullable=False),
+        sa.Column('end_offset', sa.Integer(), nullable=False),
+        sa.Column('token_count', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.UniqueConstraint('document_id', 'chunk_index', name='uq_document_chunks_document_index'),
+    )
+    op.create_index('ix_document_chunks_id', 'document_chunks', ['id'])
+    op.create_index('ix_document_chunks_document_id', 'document_chunks', ['document_id'])
+
+def downgrade():
+    op.drop_index('ix_document_chunks_document_id', table_name='document_chunks')
+    op.drop_index('ix_document_chunks_id', table_name='document_chunks')
+    op.drop_table('document_chunks')
+    op.drop_column('documents', 'parsed_content')
@@ -0,0 +1,20 @@
+"""Add chat_messages.idempotency_key for deduplicated batched writes
+
+Revision ID: a7c9e1b3d5f6
+Revises: f4c6e8a0b2d3
+Created: 2025-10-11 16:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'a7c9e1b3d5f6'
+down_revision = 'f4c6e8a0b2d3'
+
+def upgrade():
+    op.add_column('chat_messages', sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+    op.create_unique_constraint('uq_chat_messages_idempotency_key', 'chat_messages', ['idempotency_key'])
+
+def downgrade():
+    op.drop_constraint('uq_chat_messages_idempotency_key', 'chat_messages', type_='unique')
+    op.drop_column('chat_messages', 'idempotency_key')
@@ -0,0 +1,29 @@
+"""Add index_events outbox table
+
+Revision ID: c5d7e9f1a2b4
+Revises: 8b2e4d6f1a93
+Created: 2025-09-30 09:20:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'c5d7e9f1a2b4'
+down_revision = '8b2e4d6f1a93'
+
+index_action = sa.Enum('add', 'remove', name='indexaction')
+
+def upgrade():
+    op.create_table(
+        'index_events',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('document_id', sa.Integer(), nullable=False),
+        sa.Column('action', index_action, nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index('ix_index_events_id', 'index_events', ['id'])
+
+def downgrade():
+    op.drop_index('ix_index_events_id', table_name='index_events')
+    op.drop_table('index_events')
+    index_action.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,31 @@
+"""Add documents.created_at and indexes for the keyset-paginated review queue
+
+Revision ID: d2a4c6e8f0b1
+Revises: c5d7e9f1a2b4
+Created: 2025-10-02 14:30:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'd2a4c6e8f0b1'
+down_revision = 'c5d7e9f1a2b4'
+
+def upgrade():
+    op.add_column('documents', sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()))
+
+    # Keyset theo (cột, id) cần cột không NULL; upload luôn gửi 2 trường này
+    op.execute("UPDATE documents SET issuer_agency = '' WHERE issuer_agency IS NULL")
+    op.execute("UPDATE documents SET document_type = '' WHERE document_type IS NULL")
+
+    op.create_index('ix_documents_status_id', 'documents', ['status', 'id'])
+    op.create_index('ix_documents_status_created_at_id', 'documents', ['status', 'created_at', 'id'])
+    op.create_index('ix_documents_status_issuer_agency_id', 'documents', ['status', 'issuer_agency', 'id'])
+    op.create_index('ix_documents_status_document_type_id', 'documents', ['status', 'document_type', 'id'])
+
+def downgrade():
+    op.drop_index('ix_documents_status_document_type_id', table_name='documents')
+    op.drop_index('ix_documents_status_issuer_agency_id', table_name='documents')
+    op.drop_index('ix_documents_status_created_at_id', table_name='documents')
+    op.drop_index('ix_documents_status_id', table_name='documents')
+    op.drop_column('documents', 'created_at')
@@ -0,0 +1,24 @@
+"""Add a (session_id, timestamp, id) index for paginated chat history
+
+Revision ID: e3b5d7f9a1c2
+Revises: d2a4c6e8f0b1
+Created: 2025-10-09 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'e3b5d7f9a1c2'
+down_revision = 'd2a4c6e8f0b1'
+
+def upgrade():
+    # Keyset theo (timestamp, id) cần timestamp không NULL; lấy thời điểm tạo session
+    op.execute(
+        "UPDATE chat_messages SET timestamp = COALESCE("
+        "(SELECT created_at FROM chat_sessions WHERE chat_sessions.id = chat_messages.session_id), "
+        "CURRENT_TIMESTAMP) WHERE timestamp IS NULL"
+    )
+    op.create_index('ix_chat_messages_session_timestamp_id', 'chat_messages', ['session_id', 'timestamp', 'id'])
+
+def downgrade():
+    op.drop_index('ix_chat_messages_session_timestamp_id', table_name='chat_messages')
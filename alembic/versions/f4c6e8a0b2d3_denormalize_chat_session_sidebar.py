@@ -0,0 +1,32 @@
+"""Denormalize message_count / last_message_preview on chat_sessions and index the sidebar
+
+Revision ID: f4c6e8a0b2d3
+Revises: e3b5d7f9a1c2
+Created: 2025-10-10 09:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'f4c6e8a0b2d3'
+down_revision = 'e3b5d7f9a1c2'
+
+def upgrade():
+    op.add_column('chat_sessions', sa.Column('message_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('chat_sessions', sa.Column('last_message_preview', sa.String(length=255), nullable=True))
+
+    # updated_at = thời điểm tin nhắn cuối (trước đây chỉ đổi khi đổi tên)
+    op.execute(
+        "UPDATE chat_sessions SET "
+        "message_count = (SELECT COUNT(*) FROM chat_messages m WHERE m.session_id = chat_sessions.id), "
+        "last_message_preview = (SELECT SUBSTR(m.content, 1, 160) FROM chat_messages m "
+        "WHERE m.session_id = chat_sessions.id ORDER BY m.timestamp DESC, m.id DESC LIMIT 1), "
+        "updated_at = COALESCE((SELECT MAX(m.timestamp) FROM chat_messages m WHERE m.session_id = chat_sessions.id), "
+        "updated_at, created_at, CURRENT_TIMESTAMP)"
+    )
+    op.create_index('ix_chat_sessions_user_updated_at_id', 'chat_sessions', ['user_id', 'updated_at', 'id'])
+
+def downgrade():
+    op.drop_index('ix_chat_sessions_user_updated_at_id', table_name='chat_sessions')
+    op.drop_column('chat_sessions', 'last_message_preview')
+    op.drop_column('chat_sessions', 'message_count')
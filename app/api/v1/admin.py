@@ -2,6 +2,10 @@ from fastapi import APIRouter, Request, Depends, HTTPException, status
 from user_agents import parse as parse_user_agent
 from app.core.dependencies import get_current_user
 from app.schemas.user import User
+from app.core import metrics
+from app.core.http_clients import http_client_stats
+from app.services.ai_guard import ai_backend_state
+from app.services.parse_cache import get_parse_cache, PARSER_VERSION
 
 router = APIRouter()
 
@@ -40,3 +44,31 @@ async def get_client_info(
             "role": user.role
         }
     }
+
+
+def _hit_ratios(counters: dict) -> dict:
+    """Tỉ lệ hit cho mọi cặp bộ đếm "<cache>.hit" / "<cache>.miss"."""
+    ratios = {}
+    for name in counters:
+        if name.endswith(".hit"):
+            cache = name[:-len(".hit")]
+            total = counters[name] + counters.get(f"{cache}.miss", 0)
+            ratios[cache] = round(counters[name] / total, 4) if total else None
+    return ratios
+
+
+@router.get("/admin/metrics", tags=["Admin"])
+def get_metrics(user: User = Depends(is_admin)):
+    counters = metrics.snapshot()
+    return {
+        "counters": counters,
+        "hit_ratios": _hit_ratios(counters),
+        "parse_cache": {
+            "parser_version": PARSER_VERSION,
+            "size_bytes": get_parse_cache().size(),
+        },
+        # Pool HTTP của process API đang xử lý request này
+        "http_clients": http_client_stats(),
+        # Giới hạn đồng thời và circuit breaker của AI backend
+        "ai_backend": ai_backend_state(),
+    }
@@ -1,19 +1,40 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
-import httpx, traceback
+import asyncio, httpx, traceback, uuid
+from starlette.concurrency import run_in_threadpool
 
+from app.core.celery_app import celery_app
 from app.core.config import get_settings
-from app.database import get_db
+from app.core.http_clients import get_async_http_client
+from app.database import get_async_db, get_db
 from app.models.chat import ChatSession, ChatMessage
 from app.models.user import User
-from app.core.dependencies import get_current_user
+from app.core.dependencies import get_current_user, get_current_user_async
+from app.core.pagination import NEXT_CURSOR_HEADER
 from app.schemas.chat import ChatSessionSummary, ChatSessionRenameRequest
-from app.utils import generate_session_title
+from app.utils import fallback_session_title
+from app.services.session_titles import title_request
+from app.services.chat_stream import start_stream, get_stream_meta, sse_events
+from app.services.chat_history import get_history_window_async, record_message, drop_history
+from app.services.chat_service import (
+    finish_chat_turn,
+    list_chat_sessions,
+    list_session_messages,
+    save_bot_message_async,
+    touch_session,
+)
+from app.services.admission import admit_chat
+from app.services.ai_guard import ai_call_guard_async
+from app.services.answer_cache import answer_cache_key, get_cached_answer
+from app.services.single_flight import run_single_flight_async
 
-from app.tasks.chat_tasks import call_ai_task
+from app.tasks.chat_tasks import call_ai_task, complete_chat_turn_task, schedule_session_title
 # from app.tasks.chat_tasks import fetch_ai_task
 
 settings = get_settings()
@@ -34,6 +55,7 @@ class RAGResponse(BaseModel):
 class ChatMessageCreate(BaseModel):
     session_id: Optional[int] = None
     content: str
+    bypass_cache: bool = False  # bỏ qua cache câu trả lời, luôn hỏi AI
 
 class ChatMessageResponse(BaseModel):
     session_id: int
@@ -55,37 +77,44 @@ def should_use_async(question: str, settings) -> bool:
 # ==== AI Backend (direct call, sync mode) ====
 async def call_rag_backend(payload: QueryInput) -> RAGResponse:
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(settings.AI_API_URL, json=payload.dict())
-        response.raise_for_status()
+        client = get_async_http_client("ai")
+        # Cùng timeout với worker: lượt chat quá hạn sync vẫn chạy tiếp trên request này
+        async with ai_call_guard_async():
+            response = await client.post(
+                settings.AI_API_URL,
+                json=payload.dict(),
+                timeout=httpx.Timeout(settings.AI_REQUEST_TIMEOUT_SECONDS, connect=settings.HTTP_CONNECT_TIMEOUT),
+            )
+            response.raise_for_status()
         data = response.json()
         return RAGResponse(**data)
     except Exception:
         print("❌ Lỗi khi gọi AI backend:\n", traceback.format_exc())
         raise HTTPException(status_code=500, detail="Lỗi kết nối AI backend")
 
-# ==== POST /chat/ (alway async to Celery orchestrator) ====
-@router.post("/", response_model=dict)
-async def chat(
-    message_in: ChatMessageCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
+# ==== Helper: session + tin nhắn user cho một lượt chat ====
+async def _open_turn(message_in: ChatMessageCreate, db: AsyncSession, current_user: User):
+    """
+    Lấy (hoặc tạo) session, dựng cửa sổ lịch sử (trước câu hỏi hiện tại) và lưu
+    tin nhắn user; trả về (session, is_new_session, chat_history).
+    """
     is_new_session = False
+    history = []
 
     if not message_in.session_id:
-        session = ChatSession(user_id=current_user.id, title="Untitled")
+        # Tiêu đề tạm ngay lập tức; tiêu đề do LLM đặt được cập nhật ở nền
+        session = ChatSession(user_id=current_user.id, title=fallback_session_title([message_in.content]))
         db.add(session)
-        db.commit()
-        db.refresh(session)
+        await db.flush()  # lấy id; commit chung với tin nhắn user bên dưới
         is_new_session = True
     else:
-        session = db.query(ChatSession).filter_by(
+        session = await db.scalar(select(ChatSession).filter_by(
             id=message_in.session_id,
             user_id=current_user.id
-        ).first()
+        ))
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
+        history = await get_history_window_async(db, session.id, session.message_count)
 
     # Save messages user
     user_msg = ChatMessage(
@@ -95,68 +124,283 @@ async def chat(
         timestamp=datetime.utcnow()
     )
     db.add(user_msg)
-    db.commit()
+    await db.flush()
+    user_msg_id = user_msg.id
+    await db.execute(touch_session(session.id, message_in.content, user_msg.timestamp))
+    await db.commit()
+    # Redis client sync: chạy trong threadpool để không chặn event loop
+    await run_in_threadpool(record_message, session.id, user_msg_id, "user", message_in.content)
+    return session, is_new_session, history
+
+
+def _lookup_answer(message_in: ChatMessageCreate, history: list) -> Tuple[str, Optional[dict]]:
+    """Key cache câu trả lời (đọc version corpus từ manifest) và câu trả lời đã cache; gọi trong threadpool."""
+    cache_key = answer_cache_key(message_in.content, history)
+    return cache_key, get_cached_answer(cache_key, bypass=message_in.bypass_cache)
+
+
+def _schedule_title(session: ChatSession, message_in: ChatMessageCreate):
+    try:
+        schedule_session_title(title_request(session.id, [message_in.content], session.title))
+    except Exception as e:
+        # Không đặt được lịch thì giữ tiêu đề tạm, không làm hỏng lượt chat
+        print(f"[chat] could not schedule title for session {session.id}: {e}")
+
+
+# ==== Sync có hạn chờ, quá hạn thì chuyển sang Celery ====
+_handoffs = set()  # giữ tham chiếu tới các lời gọi AI đã chuyển giao
+
+
+async def _ask_ai(payload: dict) -> dict:
+    try:
+        response = await call_rag_backend(QueryInput(
+            question=payload["question"], chat_history=payload["chat_history"],
+        ))
+        return {"answer": response.answer}
+    except Exception:
+        return {"error": "AI service unavailable, please try later."}
+
+
+def _fail_handoff(task_id: str, reason: str) -> None:
+    """Ghi trạng thái kết thúc cho task_id đã trả cho client, để client không poll PENDING mãi."""
+    try:
+        celery_app.backend.store_result(task_id, RuntimeError("AI service unavailable, please try later."), "FAILURE")
+    except Exception as e:
+        print(f"[chat] could not mark handoff {task_id} as failed: {e}")
+    print(f"[chat] handoff {task_id} failed: {reason}")
+
+
+def _save_handoff_inline(task_id: str, payload: dict, result: dict) -> None:
+    """Broker lỗi: tự lưu câu trả lời trong process API và ghi kết quả cho task_id."""
+    result = finish_chat_turn(payload, result)
+    celery_app.backend.store_result(task_id, result, "SUCCESS")
+
+
+async def _hand_off(task_id: str, payload: dict, ai_call: asyncio.Task):
+    """
+    Chờ nốt lời gọi AI đang chạy rồi giao kết quả cho Celery lưu (không gọi lại AI).
+    Mọi đường lỗi đều ghi FAILURE cho task_id. Process API bị kill (không qua lifespan)
+    thì task_id ở PENDING: client nên coi là lỗi sau AI_REQUEST_TIMEOUT_SECONDS.
+    """
+    try:
+        result, _ = await ai_call
+    except asyncio.CancelledError:
+        await run_in_threadpool(_fail_handoff, task_id, "interrupted by server shutdown")
+        raise
+    except Exception as e:
+        await run_in_threadpool(_fail_handoff, task_id, str(e))
+        return
+    try:
+        await run_in_threadpool(
+            complete_chat_turn_task.apply_async, args=[payload, result], task_id=task_id
+        )
+        return
+    except Exception as e:
+        print(f"[chat] could not hand off task {task_id}, saving inline: {e}")
+    try:
+        await run_in_threadpool(_save_handoff_inline, task_id, payload, result)
+    except Exception as e:
+        await run_in_threadpool(_fail_handoff, task_id, str(e))
+
+
+async def drain_handoffs(timeout: float) -> None:
+    """Khi tắt server: chờ các lượt chat đã chuyển giao tối đa `timeout` giây, còn lại ghi FAILURE."""
+    if not _handoffs:
+        return
+    _, pending = await asyncio.wait(set(_handoffs), timeout=timeout)
+    for handoff in pending:
+        handoff.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def _answer_inline(payload: dict) -> Optional[dict]:
+    """
+    Gọi AI ngay trong request, chờ tối đa CHAT_SYNC_DEADLINE_SECONDS.
+    Quá hạn: lời gọi vẫn chạy tiếp, client nhận task_id để poll /tasks như đường async.
+    Câu hỏi trùng đang được hỏi ở request khác thì chờ chung kết quả (single-flight).
+    """
+    ai_call = asyncio.create_task(
+        run_single_flight_async(
+            payload["cache_key"], lambda: _ask_ai(payload), bypass=payload.get("bypass_cache", False),
+        )
+    )
+    try:
+        result, _ = await asyncio.wait_for(asyncio.shield(ai_call), settings.CHAT_SYNC_DEADLINE_SECONDS)
+    except asyncio.TimeoutError:
+        task_id = str(uuid.uuid4())
+        handoff = asyncio.create_task(_hand_off(task_id, payload, ai_call))
+        _handoffs.add(handoff)
+        handoff.add_done_callback(_handoffs.discard)
+        return {"session_id": payload["session_id"], "task_id": task_id, "mode": "handoff"}
+
+    if "answer" not in result:
+        # AI lỗi ngay (chưa có câu trả lời nào) => để worker thử lại
+        return None
 
+    try:
+        result = await run_in_threadpool(finish_chat_turn, payload, result)
+    except Exception as db_err:
+        # Người dùng vẫn nhận câu trả lời; chỉ thiếu tin nhắn trong lịch sử
+        print(f"[chat] could not save bot message for session {payload['session_id']}: {db_err}")
+    return {
+        "session_id": payload["session_id"],
+        "mode": "sync",
+        "answer": result["answer"],
+        "message_id": result.get("message_id"),
+    }
+
+
+# ==== POST /chat/ (cache / sync có hạn chờ / async qua Celery orchestrator) ====
+@router.post("/", response_model=dict)
+async def chat(
+    message_in: ChatMessageCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    # Từ chối sớm (429) trước khi lưu gì vào DB
+    await admit_chat(current_user.id, enqueue=should_use_async(message_in.content, settings))
+    session, is_new_session, history = await _open_turn(message_in, db, current_user)
+
+    cache_key, cached = await run_in_threadpool(_lookup_answer, message_in, history)
     payload = {
         "session_id": session.id,
         "question": message_in.content,
-        "chat_history": []
+        "chat_history": history,
+        "cache_key": cache_key,
+        "bypass_cache": message_in.bypass_cache,
     }
 
-    # Send Celery orchestrator task
-    async_result = call_ai_task.apply_async(args=[payload], queue="celery")
-    print(f"[DEBUG] Sent Celery fetch_ai task_id={async_result.id}")
+    response = None
+    if cached:
+        # Trả lời ngay, không qua Celery
+        message_id = await save_bot_message_async(db, session.id, cached["answer"])
+        response = {
+            "session_id": session.id,
+            "mode": "cache",
+            "answer": cached["answer"],
+            "message_id": message_id,
+        }
+    elif not should_use_async(message_in.content, settings):
+        response = await _answer_inline(payload)
+
+    if response is None:
+        # Send Celery orchestrator task
+        # Publish lên broker là I/O sync -> threadpool
+        async_result = await run_in_threadpool(call_ai_task.apply_async, args=[payload])
+        print(f"[DEBUG] Sent Celery fetch_ai task_id={async_result.id}")
+
+        response = {
+            "session_id": session.id,
+            "task_id": async_result.id,
+            "mode": "async"
+        }
+
+    # New sessions => auto create name (ở nền, không chặn response)
+    if is_new_session:
+        await run_in_threadpool(_schedule_title, session, message_in)
+
+    return response
+
+# ==== POST /chat/stream (SSE: stream token câu trả lời) ====
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # tắt buffer của nginx
+}
+
+@router.post("/stream")
+async def chat_stream(
+    message_in: ChatMessageCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """
+    Gửi câu hỏi và nhận câu trả lời dạng text/event-stream.
+    Sự kiện đầu tiên (`meta`) chứa stream_id; mất kết nối thì gọi
+    GET /chat/stream/{stream_id} với header Last-Event-ID để nhận tiếp.
+    """
+    await admit_chat(current_user.id, enqueue=False)
+    session, is_new_session, history = await _open_turn(message_in, db, current_user)
 
-    response = {
+    cache_key, cached = await run_in_threadpool(_lookup_answer, message_in, history)
+    payload = {
         "session_id": session.id,
-        "task_id": async_result.id,
-        "mode": "async"
+        "question": message_in.content,
+        "chat_history": history,
+        "cache_key": cache_key,
     }
+    stream_id = await start_stream(
+        session.id, current_user.id, payload,
+        cached_answer=cached["answer"] if cached else None,
+    )
 
-    # New sessions => auto create name
     if is_new_session:
-        title = await generate_session_title([message_in.content])
-        session.title = title or "Untitled"
-        db.add(session)
-        db.commit()
+        await run_in_threadpool(_schedule_title, session, message_in)
+    return StreamingResponse(
+        sse_events(stream_id),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
 
-    return response
+# ==== GET /chat/stream/{stream_id} (reconnect) ====
+@router.get("/stream/{stream_id}")
+async def resume_chat_stream(
+    stream_id: str,
+    request: Request,
+    last_event_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user_async),
+):
+    meta = await get_stream_meta(stream_id)
+    if not meta or meta["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+
+    return StreamingResponse(
+        sse_events(stream_id, request.headers.get("last-event-id") or last_event_id),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
 
 # ==== GET /chat/sessions ====
 @router.get("/sessions", response_model=List[ChatSessionSummary])
-def list_chat_sessions(
+def get_chat_sessions(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    sessions = db.query(ChatSession)\
-        .filter_by(user_id=current_user.id)\
-        .order_by(ChatSession.updated_at.desc())\
-        .all()
+    """
+    Sidebar: session mới hoạt động nhất trước, kèm số tin nhắn và đoạn trích tin cuối.
+    Trang tiếp theo: gửi lại header X-Next-Cursor trong tham số `cursor`.
+    """
+    sessions, next_cursor = list_chat_sessions(db, current_user.id, cursor=cursor, limit=limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return sessions
 
 # ==== GET /chat/session/{session_id} ====
 @router.get("/session/{session_id}", response_model=List[FullChatMessage])
 async def get_chat_history(
     session_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    response: Response,
+    before: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
-    session = db.query(ChatSession).filter_by(id=session_id, user_id=current_user.id).first()
-    if not session:
+    """
+    Tin nhắn mới nhất của session theo thứ tự thời gian, phân trang keyset.
+    Tải tin cũ hơn: gửi lại giá trị header X-Next-Cursor trong tham số `before`
+    (không có header nghĩa là đã tới đầu hội thoại).
+    """
+    messages, next_cursor = await list_session_messages(
+        db, current_user.id, session_id, before=before, limit=limit,
+    )
+    if messages is None:
         raise HTTPException(status_code=404, detail="Session not found")
-
-    messages = db.query(ChatMessage)\
-        .filter_by(session_id=session_id)\
-        .order_by(ChatMessage.timestamp.asc())\
-        .all()
-
-    return [
-        FullChatMessage(
-            sender=msg.sender,
-            content=msg.content,
-            timestamp=msg.timestamp
-        ) for msg in messages
-    ]
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return messages
 
 # ==== PATCH /chat/session/{session_id} ====
 @router.patch("/session/{session_id}")
@@ -194,4 +438,5 @@ def delete_session(
     db.query(ChatMessage).filter(ChatMessage.session_id == session_id).delete()
     db.delete(session)
     db.commit()
+    drop_history(session_id)
     return {"message": "Session deleted successfully"}
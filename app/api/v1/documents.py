@@ -1,24 +1,53 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models.document import Document, DocumentStatus
-
-from app.schemas.document import DocumentOut
-from app.core.dependencies import get_current_user
+from app.models.document import Document, DocumentChunk, DocumentStatus, IndexAction
+
+from app.schemas.document import (
+    DocumentOut,
+    BatchUploadOut,
+    BatchUploadRejected,
+    BatchProgressOut,
+    DocumentChunkOut,
+    DocumentSearchHit,
+    DocumentSearchResponse,
+    ChunkSearchHit,
+    ChunkSearchResponse,
+    IndexVersionOut,
+)
+from app.core.dependencies import get_current_user, require_admin
+from app.core.pagination import NEXT_CURSOR_HEADER
 from app.models.user import User
-from typing import List
-from app.services.content_service import parse_file_content, convert_doc_to_pdf
-
-import os, tempfile, mimetypes
-from pathlib import Path
-from app.core.celery_app import celery_app
+from typing import List, Optional, Tuple
+from datetime import datetime
+
+import os, mimetypes, time
+from collections import Counter
+from celery import group
+from celery.result import GroupResult
+from app.core.celery_app import PRIORITY_LOW, celery_app
+from app.core.config import get_settings
+from app.services.admission import admit_documents
+from app.services.blob_store import get_blob_store, BlobTooLargeError
+from app.services.batch_upload import batch_owner, save_batch_owner, store_uploads
+from app.services.document_service import list_pending_documents
+from app.services.preview_service import get_preview, PreviewNotAvailable
+from app.services.search_index import get_search_index
+from app.services.task_status import read_task_states
+from app.services.vector_index import get_vector_index
 from app.tasks.document_tasks import process_document_task
-
+from app.services.index_events import record_index_event, pending_index_events, index_versions, corpus_version
+from app.tasks.search_tasks import (
+    rebuild_search_index_task,
+    rebuild_vector_index_task,
+    schedule_index_update,
+)
+
+settings = get_settings()
 router = APIRouter(prefix="/documents", tags=["Documents"])
 
-UPLOAD_DIR = os.path.join("rag-legal-backend", "uploads")
-
 
 # -------------------- DEPENDENCIES -------------------- #
 def is_uploader(user: User = Depends(get_current_user)):
@@ -42,16 +71,21 @@ def upload_document(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-    file_content = file.file.read(MAX_FILE_SIZE + 1)
-    if len(file_content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
+    admit_documents(current_user.id, 1)
+
+    # Stream file vào blob store theo chunk (key = SHA-256, trùng nội dung thì dedup)
+    try:
+        blob = get_blob_store().save_stream(file.file, max_size=settings.UPLOAD_MAX_FILE_SIZE)
+    except BlobTooLargeError:
+        raise HTTPException(status_code=400, detail=f"File size exceeds {settings.UPLOAD_MAX_FILE_SIZE // (1024 * 1024)}MB limit")
 
     new_doc = Document(
         uploader_id=current_user.id,
         filename=file.filename,
         type=os.path.splitext(file.filename)[1],
-        file_content=file_content if len(file_content) <= MAX_FILE_SIZE else None,
+        file_hash=blob.sha256,
+        file_size=blob.size,
+        mime_type=file.content_type or mimetypes.guess_type(file.filename)[0] or "application/octet-stream",
         issuer_agency=issuer_agency,
         document_type=document_type,
         status=DocumentStatus.pending,
@@ -60,29 +94,280 @@ def upload_document(
     db.commit()
     db.refresh(new_doc)
 
-    temp_file_path = os.path.join(tempfile.gettempdir(), f"{new_doc.id}_{file.filename}")
-    with open(temp_file_path, "wb") as f:
-        f.write(file_content)
-
-    # Gửi task xử lý document
-    process_document_task.delay(temp_file_path, new_doc.id)
+    # Gửi task xử lý document (worker tự lấy file từ blob store)
+    process_document_task.delay(new_doc.id)
 
     return new_doc
 
 
+@router.post("/upload/batch", response_model=BatchUploadOut)
+def upload_documents_batch(
+    files: List[UploadFile] = File(...),
+    issuer_agency: str = Form(...),
+    document_type: str = Form(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Upload nhiều file và/hoặc file ZIP; trả về batch_id để theo dõi tiến độ xử lý."""
+    # Tính quota theo số phần upload (file ZIP tính là một), trước khi đọc nội dung
+    admit_documents(current_user.id, len(files))
+    stored, rejected = store_uploads(files, max_files=settings.UPLOAD_BATCH_MAX_FILES)
+
+    new_docs = [
+        Document(
+            uploader_id=current_user.id,
+            filename=item.filename,
+            type=os.path.splitext(item.filename)[1],
+            file_hash=item.blob.sha256,
+            file_size=item.blob.size,
+            mime_type=item.content_type,
+            issuer_agency=issuer_agency,
+            document_type=document_type,
+            status=DocumentStatus.pending,
+        )
+        for item in stored
+    ]
+    batch_id = None
+    document_ids = []
+    if new_docs:
+        # Một transaction cho cả lô; flush để lấy id trước khi commit
+        db.add_all(new_docs)
+        db.flush()
+        document_ids = [doc.id for doc in new_docs]
+        db.commit()
+
+        # Ưu tiên thấp hơn upload lẻ: một lô lớn không đẩy các file lẻ xuống cuối hàng đợi
+        result = group(process_document_task.s(doc_id) for doc_id in document_ids).apply_async(priority=PRIORITY_LOW)
+        result.save()
+        batch_id = result.id
+        save_batch_owner(batch_id, current_user.id)
+
+    return BatchUploadOut(
+        batch_id=batch_id,
+        document_ids=document_ids,
+        rejected=[BatchUploadRejected(filename=item.filename, reason=item.reason) for item in rejected],
+    )
+
+
+@router.get("/upload/batch/{batch_id}", response_model=BatchProgressOut)
+def get_upload_batch_progress(
+    batch_id: str,
+    current_user: User = Depends(get_current_user),
+):
+    # Batch của người khác trả 404 như batch không tồn tại
+    if batch_owner(batch_id) != current_user.id:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    result = GroupResult.restore(batch_id, app=celery_app)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    # Một MGET cho mọi task con thay vì một GET mỗi task
+    states = Counter(read_task_states([child.id for child in result.results]))
+    succeeded = states["SUCCESS"]
+    failed = states["FAILURE"] + states["REVOKED"]
+    running = states["STARTED"] + states["RETRY"]
+    total = len(result.results)
+    return BatchProgressOut(
+        batch_id=batch_id,
+        total=total,
+        pending=total - succeeded - failed - running,
+        running=running,
+        succeeded=succeeded,
+        failed=failed,
+        done=succeeded + failed == total,
+    )
+
+
 # -------------------- PENDING -------------------- #
 @router.get("/pending", response_model=List[DocumentOut])
 def get_pending_documents(
+    response: Response,
+    issuer_agency: Optional[str] = None,
+    document_type: Optional[str] = None,
+    uploaded_from: Optional[datetime] = None,
+    uploaded_to: Optional[datetime] = None,
+    sort: str = Query("id", pattern="^(id|created_at|issuer_agency|document_type)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
     db: Session = Depends(get_db),
     current_user: User = Depends(is_reviewer),
 ):
-    return db.query(Document).filter(Document.status == DocumentStatus.pending).all()
+    """
+    Hàng đợi văn bản chờ duyệt, phân trang keyset.
+    Trang tiếp theo: gửi lại giá trị header X-Next-Cursor trong tham số `cursor`
+    (không có header nghĩa là đã hết).
+    """
+    rows, next_cursor = list_pending_documents(
+        db,
+        issuer_agency=issuer_agency,
+        document_type=document_type,
+        uploaded_from=uploaded_from,
+        uploaded_to=uploaded_to,
+        sort=sort,
+        descending=order == "desc",
+        cursor=cursor,
+        limit=limit,
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return rows
+
+
+# -------------------- SEARCH -------------------- #
+@router.get("/search", response_model=DocumentSearchResponse)
+def search_documents(
+    q: str = Query(..., min_length=1),
+    issuer_agency: Optional[str] = None,
+    document_type: Optional[str] = None,
+    fold_diacritics: Optional[bool] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    index = get_search_index()
+    if index is None:
+        raise HTTPException(status_code=503, detail="Search index has not been built yet")
+
+    start = time.perf_counter()
+    hits = index.search(q, k=limit, issuer_agency=issuer_agency, document_type=document_type, fold=fold_diacritics)
+    took_ms = (time.perf_counter() - start) * 1000
+
+    docs = {}
+    if hits:
+        rows = db.query(Document.id, Document.filename, Document.issuer_agency, Document.document_type)\
+            .filter(Document.id.in_([hit.document_id for hit in hits]))\
+            .all()
+        docs = {row.id: row for row in rows}
+
+    return DocumentSearchResponse(
+        query=q,
+        index_version=index.version,
+        took_ms=round(took_ms, 3),
+        hits=[
+            DocumentSearchHit(
+                document_id=hit.document_id,
+                score=round(hit.score, 4),
+                filename=docs[hit.document_id].filename,
+                issuer_agency=docs[hit.document_id].issuer_agency,
+                document_type=docs[hit.document_id].document_type,
+            )
+            for hit in hits if hit.document_id in docs
+        ],
+    )
+
+
+@router.get("/search/semantic", response_model=ChunkSearchResponse)
+def semantic_search_chunks(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    index = get_vector_index()
+    if index is None:
+        raise HTTPException(status_code=503, detail="Vector index has not been built yet")
+
+    start = time.perf_counter()
+    hits = index.search([q], k=limit)[0]
+    took_ms = (time.perf_counter() - start) * 1000
+
+    chunks = {}
+    if hits:
+        rows = db.query(DocumentChunk.id, DocumentChunk.path, DocumentChunk.heading, DocumentChunk.content, Document.filename)\
+            .join(Document, Document.id == DocumentChunk.document_id)\
+            .filter(DocumentChunk.id.in_([hit.chunk_id for hit in hits]))\
+            .all()
+        chunks = {row.id: row for row in rows}
+
+    return ChunkSearchResponse(
+        query=q,
+        index_version=index.version,
+        took_ms=round(took_ms, 3),
+        hits=[
+            ChunkSearchHit(
+                chunk_id=hit.chunk_id,
+                document_id=hit.document_id,
+                score=round(hit.score, 4),
+                filename=chunks[hit.chunk_id].filename,
+                path=chunks[hit.chunk_id].path,
+                heading=chunks[hit.chunk_id].heading,
+                content=chunks[hit.chunk_id].content,
+            )
+            for hit in hits if hit.chunk_id in chunks
+        ],
+    )
+
+
+@router.post("/search/reindex")
+def reindex_documents(current_user: User = Depends(require_admin)):
+    task = rebuild_search_index_task.delay()
+    vector_task = rebuild_vector_index_task.delay()
+    return {"task_id": task.id, "vector_task_id": vector_task.id}
+
+
+@router.get("/search/version", response_model=IndexVersionOut)
+def get_index_version(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    versions = index_versions()
+    return IndexVersionOut(
+        version=corpus_version(),
+        bm25_version=versions["bm25"],
+        vector_version=versions["vector"],
+        pending_events=pending_index_events(db),
+    )
 
 
 # -------------------- PREVIEW -------------------- #
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse `Range: bytes=a-b` (một khoảng). Trả về (start, end) inclusive,
+    None nếu khoảng không thỏa được (416); ValueError nếu không hỗ trợ (trả cả file).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError("Unsupported range")
+    start_s, _, end_s = spec.strip().partition("-")
+    if start_s:
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    else:
+        # bytes=-N: N byte cuối
+        suffix = int(end_s)
+        if suffix <= 0:
+            return None
+        start, end = max(0, size - suffix), size - 1
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def _iter_file_range(path, start: int, end: int, chunk_size: int = 256 * 1024):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
 @router.get("/{doc_id}/preview")
 async def preview_document(
     doc_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(is_reviewer),
 ):
@@ -90,50 +375,68 @@ async def preview_document(
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    file_content = doc.file_content
-    if not file_content:
+    if not doc.file_hash:
         raise HTTPException(status_code=404, detail="File content not found")
 
-    temp_file_path = tempfile.NamedTemporaryFile(delete=False, suffix=doc.type).name
-    converted_path = None
     try:
-        with open(temp_file_path, 'wb') as temp_file:
-            temp_file.write(file_content)
-            temp_file.flush()
-            os.fsync(temp_file.fileno())
-
-        if doc.type.lower() == ".doc":
-            converted_path = convert_doc_to_pdf(Path(temp_file_path))
-            if not converted_path or not converted_path.exists():
-                raise HTTPException(status_code=500, detail="Could not convert .doc to PDF")
-            file_path = converted_path
-        else:
-            file_path = temp_file_path
-
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=500, detail=f"File not found at {file_path} before sending")
-
-        mime_type, _ = mimetypes.guess_type(file_path)
-        if not mime_type:
-            mime_type = "application/octet-stream"
-
-        async def cleanup():
-            for path in [temp_file_path, converted_path]:
-                if path and os.path.exists(path):
-                    os.unlink(path)
-
-        return FileResponse(
-            path=file_path,
-            filename=doc.filename,
-            media_type=mime_type,
-            background=cleanup
-        )
+        # Thường đã được sinh sẵn bởi process_document_task; nếu chưa thì sinh và cache lại
+        preview = await run_in_threadpool(get_preview, doc)
+    except PreviewNotAvailable as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    headers = {
+        "ETag": preview.etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), preview.etag):
+        return Response(status_code=304, headers=headers)
+
+    size = preview.path.stat().st_size
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == preview.etag):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            byte_range = False  # Range không hỗ trợ -> trả cả file
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range:
+            start, end = byte_range
+            headers.update({
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(end - start + 1),
+            })
+            return StreamingResponse(
+                _iter_file_range(preview.path, start, end),
+                status_code=206,
+                media_type=preview.media_type,
+                headers=headers,
+            )
+
+    return FileResponse(
+        path=preview.path,
+        filename=doc.filename,
+        media_type=preview.media_type,
+        headers=headers,
+    )
 
-    except Exception as e:
-        for path in [temp_file_path, converted_path]:
-            if path and os.path.exists(path):
-                os.unlink(path)
-        raise
+
+# -------------------- CHUNKS -------------------- #
+@router.get("/{doc_id}/chunks", response_model=List[DocumentChunkOut])
+def get_document_chunks(
+    doc_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(is_reviewer),
+):
+    if not db.query(Document.id).filter(Document.id == doc_id).first():
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    return db.query(DocumentChunk)\
+        .filter(DocumentChunk.document_id == doc_id)\
+        .order_by(DocumentChunk.chunk_index.asc())\
+        .all()
 
 
 # -------------------- APPROVE -------------------- #
@@ -154,8 +457,11 @@ def approve_document(
     doc.reviewer_id = current_user.id
 
     db.add(doc)
+    record_index_event(db, doc.id, IndexAction.add)
     db.commit()
     db.refresh(doc)
+
+    schedule_index_update()
     return doc
 
 
@@ -177,6 +483,9 @@ def reject_document(
     doc.reviewer_id = current_user.id
 
     db.add(doc)
+    record_index_event(db, doc.id, IndexAction.remove)
     db.commit()
     db.refresh(doc)
+
+    schedule_index_update()
     return doc
@@ -1,25 +1,33 @@
-from fastapi import APIRouter
-from celery.result import AsyncResult
-from app.core.celery_app import celery_app
+from typing import List
+
+from fastapi import APIRouter, Query
+from pydantic import BaseModel, Field
+
+from app.core.config import get_settings
+from app.services.task_status import get_task_status as read_task_status, get_task_statuses
+
+settings = get_settings()
 
 router = APIRouter(prefix="/tasks", tags=["Tasks"])
 
+
+class TaskStatusBatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=settings.TASK_STATUS_BATCH_MAX)
+
+
+@router.post("/status")
+async def get_task_status_batch(body: TaskStatusBatchRequest):
+    """Trạng thái của nhiều task trong một request (vd. dashboard theo dõi batch upload)."""
+    return await get_task_statuses(body.ids)
+
+
 @router.get("/{task_id}")
-def get_task_status(task_id: str):
-    res = AsyncResult(task_id, app=celery_app)
-
-    # Khi orchestrator trả về lỗi theo dạng dict {"error": "..."}
-    if res.status == "SUCCESS" and isinstance(res.result, dict):
-        answer = res.result.get("answer")
-        error = res.result.get("error")
-        return {
-            "task_id": task_id,
-            "status": res.status,
-            "answer": answer,
-            "error": error
-        }
-
-    return {
-        "task_id": task_id,
-        "status": res.status
-    }
+async def get_task_status(
+    task_id: str,
+    wait: float = Query(0, ge=0, le=settings.TASK_STATUS_MAX_WAIT_SECONDS),
+):
+    """
+    Trạng thái task. `wait` > 0: long-poll, giữ request tới khi task đổi trạng thái
+    hoặc hết `wait` giây (client gọi lại ngay sau khi nhận response).
+    """
+    return await read_task_status(task_id, wait=wait)
@@ -1,4 +1,5 @@
 from celery import Celery
+from kombu import Queue
 from app.core.config import get_settings
 
 settings = get_settings()
@@ -16,6 +17,26 @@ celery_app = Celery(
 
 celery_app.autodiscover_tasks(["app.tasks"])
 
+# Hàng đợi riêng cho từng loại việc: ingest hàng loạt không chiếm worker của chat
+CHAT_QUEUE = "chat-interactive"
+DOCUMENT_QUEUE = "document-parse"
+CONVERSION_QUEUE = "conversion"
+MAINTENANCE_QUEUE = "maintenance"
+
+# Ưu tiên trong cùng một hàng đợi. RabbitMQ: số lớn được lấy trước;
+# transport Redis của kombu thì ngược lại (0 được lấy trước).
+_REDIS_BROKER = BROKER_URL.startswith(("redis://", "rediss://"))
+
+
+def task_priority(level: int) -> int:
+    """level 0..9, 9 = gấp nhất -> giá trị priority đúng chiều của broker đang dùng."""
+    return 9 - level if _REDIS_BROKER else level
+
+
+PRIORITY_HIGH = task_priority(9)
+PRIORITY_NORMAL = task_priority(5)
+PRIORITY_LOW = task_priority(1)
+
 celery_app.conf.update(
     task_track_started=True,
     result_expires=3600,
@@ -23,7 +44,22 @@ celery_app.conf.update(
     result_serializer="json",
     accept_content=["json"],
     timezone="Asia/Ho_Chi_Minh",
-    task_default_queue="celery",
+    task_default_queue=MAINTENANCE_QUEUE,
+    task_queues=[Queue(name) for name in (CHAT_QUEUE, DOCUMENT_QUEUE, CONVERSION_QUEUE, MAINTENANCE_QUEUE)],
+    task_queue_max_priority=10,  # RabbitMQ: x-max-priority cho mọi hàng đợi
+    task_default_priority=PRIORITY_NORMAL,
+    task_routes={
+        "app.tasks.chat.call_ai": {"queue": CHAT_QUEUE, "priority": PRIORITY_HIGH},
+        "app.tasks.chat.complete_chat_turn": {"queue": CHAT_QUEUE, "priority": PRIORITY_HIGH},
+        "app.tasks.chat.fetch_ai": {"queue": CHAT_QUEUE, "priority": PRIORITY_HIGH},
+        "app.tasks.chat.save_message": {"queue": CHAT_QUEUE, "priority": PRIORITY_HIGH},
+        # Tiêu đề session không bao giờ được chen trước một câu trả lời
+        "app.tasks.chat.generate_session_titles": {"queue": CHAT_QUEUE, "priority": PRIORITY_LOW},
+        "app.tasks.document_tasks.process_document_task": {"queue": DOCUMENT_QUEUE},
+        "app.tasks.document_tasks.warm_preview_task": {"queue": CONVERSION_QUEUE},
+        "app.tasks.search_tasks.process_index_events_task": {"queue": MAINTENANCE_QUEUE},
+        "app.tasks.search_tasks.*": {"queue": MAINTENANCE_QUEUE, "priority": PRIORITY_LOW},
+    },
     worker_hijack_root_logger=False,
     task_always_eager=False,
     worker_send_task_events=True,
@@ -34,5 +70,26 @@ celery_app.conf.update(
     task_soft_time_limit=540,
     broker_connection_retry_on_startup=True,
     worker_prefetch_multiplier=1,
+    # Ack sau khi task xong (tin nhắn đã commit); worker chết giữa chừng thì task được giao lại
     task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    # Transport Redis: mỗi mức priority là một list riêng (RabbitMQ dùng x-max-priority ở trên)
+    broker_transport_options={"priority_steps": list(range(10))},
 )
+
+# Tác vụ định kỳ (chạy với `celery -A app.core.celery_app beat`)
+celery_app.conf.beat_schedule = {
+    "compact-vector-index": {
+        "task": "app.tasks.search_tasks.compact_vector_index_task",
+        "schedule": float(settings.VECTOR_COMPACT_INTERVAL_SECONDS),
+    },
+    "compact-search-index": {
+        "task": "app.tasks.search_tasks.compact_search_index_task",
+        "schedule": float(settings.VECTOR_COMPACT_INTERVAL_SECONDS),
+    },
+    # Quét sự kiện còn sót (ví dụ khi enqueue lúc approve bị lỗi)
+    "process-index-events": {
+        "task": "app.tasks.search_tasks.process_index_events_task",
+        "schedule": float(settings.INDEX_EVENT_SWEEP_INTERVAL_SECONDS),
+    },
+}
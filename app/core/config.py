@@ -10,9 +10,34 @@ class Settings(BaseSettings):
 
     # Database
     DATABASE_URL: Optional[str] = None 
+    ASYNC_DATABASE_URL: Optional[str] = None  # mặc định suy ra từ DATABASE_URL (aiomysql/asyncpg/aiosqlite)
 
     #AI API
     AI_API_URL: str
+    AI_STREAM_URL: Optional[str] = None  # endpoint stream token; mặc định = AI_API_URL
+    AI_STREAM_TIMEOUT: float = 120.0
+    AI_REQUEST_TIMEOUT_SECONDS: float = 120.0
+
+    # Bảo vệ AI backend: giới hạn đồng thời thích ứng (AIMD theo độ trễ) + circuit breaker
+    AI_LIMIT_INITIAL: int = 20
+    AI_LIMIT_MIN: int = 2
+    AI_LIMIT_MAX: int = 200
+    AI_LATENCY_TARGET_SECONDS: float = 20.0  # chậm hơn mức này được tính như quá tải
+    AI_LIMIT_DECREASE_FACTOR: float = 0.7
+    AI_LIMIT_DECREASE_COOLDOWN_SECONDS: float = 5.0  # giảm tối đa một lần trong khoảng này
+    AI_LIMITER_MAX_WAIT_SECONDS: float = 10.0  # chờ slot tối đa rồi báo AI bận
+    AI_LIMITER_POLL_SECONDS: float = 0.1
+    AI_BREAKER_FAILURE_THRESHOLD: int = 5  # số lỗi liên tiếp để mở breaker
+    AI_BREAKER_WINDOW_SECONDS: int = 60
+    AI_BREAKER_OPEN_SECONDS: int = 30
+    AI_RETRY_BACKOFF_BASE_SECONDS: float = 2.0
+    AI_RETRY_BACKOFF_MAX_SECONDS: float = 60.0
+
+    # HTTP client pool cho AI / Groq (mỗi process một pool cho mỗi upstream)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    HTTP_CONNECT_TIMEOUT: float = 10.0
 
     # SUMMARY TILTE API
     GROQ_API: str
@@ -22,7 +47,115 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
 
-    CHAT_MAX_SYNC_WORDS: int 
+    CHAT_MAX_SYNC_WORDS: int = 30  # câu hỏi ngắn hơn gọi AI trực tiếp; 0 = luôn qua Celery
+    CHAT_SYNC_DEADLINE_SECONDS: float = 8.0  # quá hạn thì chuyển lượt chat sang Celery
+    CHAT_HANDOFF_SHUTDOWN_SECONDS: float = 10.0  # khi tắt API: chờ các lượt đã chuyển giao tối đa chừng này
+    CHAT_STREAM_TTL_SECONDS: int = 600  # thời gian giữ token để client reconnect
+    CHAT_STREAM_HEARTBEAT_SECONDS: int = 15
+    CHAT_HISTORY_TOKEN_BUDGET: int = 1500  # token lịch sử tối đa gửi kèm câu hỏi
+    CHAT_HISTORY_MAX_MESSAGES: int = 40
+    CHAT_HISTORY_CACHE_TTL_SECONDS: int = 3600
+
+    # Gộp các lời gọi AI trùng câu hỏi đang chạy cùng lúc (single-flight)
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_LOCK_TTL_SECONDS: int = 140  # > chờ slot AI + timeout gọi AI; follower chờ tối đa chừng này
+    SINGLE_FLIGHT_RESULT_TTL_SECONDS: int = 15
+    SINGLE_FLIGHT_POLL_SECONDS: float = 0.1
+
+    # Ghi tin nhắn bot theo lô trong worker (write-behind)
+    MESSAGE_BUFFER_MAX_ROWS: int = 200
+    MESSAGE_BUFFER_FLUSH_MS: int = 50
+    MESSAGE_BUFFER_WAIT_SECONDS: float = 30.0
+
+    # API trạng thái task (long-poll / tra nhiều task)
+    TASK_STATUS_MAX_WAIT_SECONDS: float = 30.0
+    TASK_STATUS_BATCH_MAX: int = 200
+
+    # Kiểm soát nhận việc: quota mỗi user (token bucket) và ngưỡng hàng đợi -> 429 + Retry-After
+    CHAT_QUOTA_PER_MINUTE: float = 20  # 0 = không giới hạn
+    CHAT_QUOTA_BURST: int = 5
+    DOCUMENT_QUOTA_PER_MINUTE: float = 120  # số file upload
+    DOCUMENT_QUOTA_BURST: int = 1000  # >= UPLOAD_BATCH_MAX_FILES để một lô đầy vẫn qua được
+    CHAT_QUEUE_MAX_BACKLOG: int = 200  # message chờ trong hàng đợi chat-interactive; 0 = bỏ qua
+    DOCUMENT_QUEUE_MAX_BACKLOG: int = 5000
+    QUEUE_BACKLOG_CACHE_SECONDS: float = 2.0
+    QUEUE_SATURATED_RETRY_AFTER_SECONDS: int = 10
+
+    # Đặt tiêu đề session (Celery, gom lô)
+    SESSION_TITLE_BATCH_SIZE: int = 10
+    SESSION_TITLE_BATCH_DELAY_SECONDS: int = 2
+
+    # Cache câu trả lời (câu hỏi chuẩn hóa + lịch sử + version corpus)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_TTL_SECONDS: int = 86400
+    ANSWER_CACHE_MAX_ENTRIES: int = 10000
+
+    # Redis (cache / bộ đếm dùng chung); mặc định dùng result backend của Celery
+    REDIS_URL: Optional[str] = None
+    REDIS_SOCKET_TIMEOUT: float = 0.5
+    REDIS_RETRY_SECONDS: int = 30
+
+    # Upload / blob storage
+    UPLOAD_MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    UPLOAD_BATCH_MAX_FILES: int = 1000
+    BLOB_STORE_BACKEND: str = "local"  # local | s3
+    BLOB_STORE_DIR: str = "uploads/blobs"
+    S3_ENDPOINT_URL: Optional[str] = None  # MinIO / stand-in S3 local
+    S3_BUCKET: str = "rag-legal-documents"
+    S3_ACCESS_KEY_ID: Optional[str] = None
+    S3_SECRET_ACCESS_KEY: Optional[str] = None
+    S3_REGION: Optional[str] = None
+
+    # PDF extraction
+    PDF_EXTRACT_WORKERS: int = 0  # 0 = os.cpu_count()
+    PDF_EXTRACT_PAGES_PER_TASK: int = 16
+    PDF_EXTRACT_MIN_PARALLEL_PAGES: int = 64
+    PDF_EXTRACT_MEMORY_CAP_MB: int = 64
+
+    # LibreOffice conversion pool
+    LIBREOFFICE_PATH: str = r"C:\Program Files\LibreOffice\program\soffice.exe"
+    LIBREOFFICE_POOL_SIZE: int = 2
+    LIBREOFFICE_JOB_TIMEOUT: int = 120
+    LIBREOFFICE_STARTUP_TIMEOUT: int = 30
+    LIBREOFFICE_MAX_JOBS_PER_INSTANCE: int = 200
+    LIBREOFFICE_PROFILE_DIR: Optional[str] = None  # profile của từng process nằm trong thư mục con <pid>-instance-<n>
+    LIBREOFFICE_WORK_DIR: Optional[str] = None
+
+    # Preview cache
+    PREVIEW_CACHE_DIR: str = "cache/previews"
+    PREVIEW_CACHE_MAX_MB: int = 2048
+    PREVIEW_ETAG_MEMO_MAX_ENTRIES: int = 4096  # số ETag nhớ trong RAM của mỗi process
+
+    # Parse cache (text đã trích xuất, theo hash file)
+    PARSE_CACHE_DIR: str = "cache/parsed"
+    PARSE_CACHE_MAX_MB: int = 1024
+
+    # Chunking văn bản pháp luật
+    CHUNK_MAX_TOKENS: int = 512
+
+    # Tìm kiếm BM25
+    SEARCH_INDEX_DIR: str = "index/bm25"
+    SEARCH_FOLD_DIACRITICS: bool = True
+    SEARCH_BM25_K1: float = 1.2
+    SEARCH_BM25_B: float = 0.75
+
+    # Vector index
+    VECTOR_INDEX_DIR: str = "index/vectors"
+    VECTOR_DTYPE: str = "float16"  # float16 | float32
+    VECTOR_IVF_MIN_VECTORS: int = 50000
+    VECTOR_IVF_NLIST: int = 0  # 0 = 4 * sqrt(n)
+    VECTOR_IVF_NPROBE: int = 8
+    VECTOR_COMPACT_MIN_SEGMENTS: int = 8
+    VECTOR_COMPACT_INTERVAL_SECONDS: int = 3600
+    EMBEDDING_BACKEND: str = "hashing"  # hoặc "module.path:ClassName"
+    EMBEDDING_DIM: int = 384
+
+    # Cập nhật index theo sự kiện approve/reject
+    INDEX_EVENT_BATCH_DELAY_SECONDS: int = 5
+    INDEX_EVENT_BATCH_SIZE: int = 500
+    INDEX_EVENT_SWEEP_INTERVAL_SECONDS: int = 60
+    SEARCH_COMPACT_MIN_SEGMENTS: int = 8
     
     class Config:
         env_file = ".env"
@@ -5,8 +5,10 @@ from app.core.config import get_settings
 from app.schemas.user import UserRole
 
 from app.models.user import User
-from app.database import get_db
+from app.database import get_async_db, get_db
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 
@@ -18,15 +20,7 @@ class TokenData(BaseModel):
     username: str
     role: UserRole
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
-) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Invalid credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def _email_from_token(token: str, credentials_exception: HTTPException) -> str:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: str = payload.get("sub")
@@ -34,12 +28,40 @@ def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    return email
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db),
+) -> User:
+    credentials_exception = _credentials_exception()
+    email = _email_from_token(token, credentials_exception)
 
     user = db.query(User).filter(User.email == email).first()
     if user is None:
         raise credentials_exception
     return user
 
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db),
+) -> User:
+    """Như get_current_user nhưng cho route `async def` (không chặn event loop)."""
+    credentials_exception = _credentials_exception()
+    email = _email_from_token(token, credentials_exception)
+
+    user = await db.scalar(select(User).where(User.email == email).limit(1))
+    if user is None:
+        raise credentials_exception
+    return user
+
 def require_role(*allowed_roles: UserRole):
     def role_checker(current_user: User = Depends(get_current_user)):
         if current_user.role not in allowed_roles:
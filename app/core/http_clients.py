@@ -0,0 +1,114 @@
+"""
+HTTP client dùng chung (connection pool, keep-alive) cho các lời gọi ra ngoài.
+
+- get_http_client(name): httpx.Client đồng bộ, một bộ cho mỗi process (Celery
+  worker prefork tạo mới sau fork theo pid).
+- get_async_http_client(name): httpx.AsyncClient cho FastAPI, sống theo lifespan
+  của app (close_async_http_clients() khi shutdown).
+
+Mỗi tên (vd. "ai", "groq") có pool riêng để một upstream chậm không chiếm hết
+kết nối của upstream khác. HTTP/2 bật khi có gói `h2`.
+"""
+import importlib.util
+import os
+import threading
+from collections import Counter
+from typing import Dict
+
+import httpx
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_sync_clients: Dict[str, httpx.Client] = {}
+_sync_pid = None
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+_lock = threading.Lock()
+_requests = Counter()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    # Timeout đọc đặt theo từng request; ở đây chỉ là mặc định
+    return httpx.Timeout(60.0, connect=settings.HTTP_CONNECT_TIMEOUT)
+
+
+def _count(key: str):
+    def hook(request):
+        _requests[key] += 1
+    return hook
+
+
+def get_http_client(name: str) -> httpx.Client:
+    global _sync_pid
+    with _lock:
+        if _sync_pid != os.getpid():
+            # Sau fork: không dùng lại socket của process cha
+            _sync_clients.clear()
+            _sync_pid = os.getpid()
+        client = _sync_clients.get(name)
+        if client is None:
+            client = _sync_clients[name] = httpx.Client(
+                limits=_limits(),
+                timeout=_timeout(),
+                http2=HTTP2_AVAILABLE,
+                event_hooks={"request": [_count(f"sync:{name}")]},
+            )
+        return client
+
+
+def get_async_http_client(name: str) -> httpx.AsyncClient:
+    with _lock:
+        client = _async_clients.get(name)
+        if client is None or client.is_closed:
+            counter = _count(f"async:{name}")
+
+            async def hook(request):
+                counter(request)
+
+            client = _async_clients[name] = httpx.AsyncClient(
+                limits=_limits(),
+                timeout=_timeout(),
+                http2=HTTP2_AVAILABLE,
+                event_hooks={"request": [hook]},
+            )
+        return client
+
+
+async def close_async_http_clients() -> None:
+    with _lock:
+        clients = list(_async_clients.values())
+        _async_clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def _pool_stats(client) -> dict:
+    # httpx không có API công khai cho trạng thái pool -> đọc từ httpcore nếu có
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    idle = sum(1 for conn in connections if conn.is_idle())
+    return {"connections": len(connections), "idle": idle, "active": len(connections) - idle}
+
+
+def http_client_stats() -> dict:
+    """Thống kê pool của process hiện tại."""
+    with _lock:
+        sync_clients = dict(_sync_clients) if _sync_pid == os.getpid() else {}
+        async_clients = dict(_async_clients)
+    stats = {"http2": HTTP2_AVAILABLE, "max_connections": settings.HTTP_MAX_CONNECTIONS, "clients": {}}
+    for kind, clients in (("sync", sync_clients), ("async", async_clients)):
+        for name, client in clients.items():
+            key = f"{kind}:{name}"
+            stats["clients"][key] = {"requests": _requests[key], **_pool_stats(client)}
+    return stats
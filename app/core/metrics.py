@@ -0,0 +1,55 @@
+"""
+Bộ đếm đơn giản dùng chung giữa API và Celery worker.
+
+Bộ đếm nằm trong một hash Redis; khi Redis không có thì cộng vào bộ nhớ của
+process hiện tại (snapshot() gộp cả hai).
+"""
+import threading
+from collections import Counter
+from typing import Dict
+
+from app.core.redis_client import RedisError, get_async_redis, get_redis, mark_redis_down
+
+METRICS_KEY = "rag:metrics"
+
+_local = Counter()
+_local_lock = threading.Lock()
+
+
+def incr(name: str, amount: int = 1) -> None:
+    client = get_redis()
+    if client is not None:
+        try:
+            client.hincrby(METRICS_KEY, name, amount)
+            return
+        except RedisError as e:
+            mark_redis_down(e)
+    with _local_lock:
+        _local[name] += amount
+
+
+async def incr_async(name: str, amount: int = 1) -> None:
+    """Như incr nhưng dùng client redis.asyncio, để code async không chặn event loop."""
+    client = get_async_redis()
+    if client is not None:
+        try:
+            await client.hincrby(METRICS_KEY, name, amount)
+            return
+        except RedisError as e:
+            mark_redis_down(e)
+    with _local_lock:
+        _local[name] += amount
+
+
+def snapshot(prefix: str = "") -> Dict[str, int]:
+    counters = Counter()
+    client = get_redis()
+    if client is not None:
+        try:
+            for name, value in client.hgetall(METRICS_KEY).items():
+                counters[name.decode()] += int(value)
+        except RedisError as e:
+            mark_redis_down(e)
+    with _local_lock:
+        counters.update(_local)
+    return {name: counters[name] for name in sorted(counters) if name.startswith(prefix)}
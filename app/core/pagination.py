@@ -0,0 +1,62 @@
+"""
+Phân trang keyset (seek) bằng cursor.
+
+Cursor là JSON (giá trị cột sắp xếp + id của hàng cuối trang) mã hóa base64
+URL-safe; client chỉ việc gửi lại nguyên văn. Trang tiếp theo lọc theo
+(sort_col, id) > (giá trị, id) nên chi phí không tăng theo độ sâu trang như OFFSET.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _ordering(sort_col, descending: bool) -> str:
+    return f"{sort_col.key}:{'desc' if descending else 'asc'}"
+
+
+def encode_cursor(sort_col, sort_value: Any, last_id: int, descending: bool = False) -> str:
+    if isinstance(sort_value, datetime):
+        sort_value = {"dt": sort_value.isoformat()}
+    raw = json.dumps([_ordering(sort_col, descending), sort_value, last_id], separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, Any, int]:
+    """Giải mã cursor thành (thứ tự sắp xếp, giá trị, id); cursor hỏng -> HTTP 400."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ordering, sort_value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if isinstance(sort_value, dict):
+            sort_value = datetime.fromisoformat(sort_value["dt"])
+        return ordering, sort_value, int(last_id)
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(sort_col, id_col, cursor: Optional[str], descending: bool = False):
+    """Điều kiện "sau cursor" cho thứ tự (sort_col, id_col); None nếu là trang đầu."""
+    if not cursor:
+        return None
+    ordering, sort_value, last_id = decode_cursor(cursor)
+    if ordering != _ordering(sort_col, descending):
+        raise HTTPException(status_code=400, detail="Cursor does not match the requested sort order")
+    if sort_col is id_col:
+        return id_col < last_id if descending else id_col > last_id
+    # Điều kiện phạm vi thừa (>= / <=) giúp mọi engine dùng được index (sort_col, id)
+    if descending:
+        return and_(sort_col <= sort_value, or_(sort_col < sort_value, id_col < last_id))
+    return and_(sort_col >= sort_value, or_(sort_col > sort_value, id_col > last_id))
+
+
+def keyset_order(sort_col, id_col, descending: bool = False):
+    if sort_col is id_col:
+        return (id_col.desc(),) if descending else (id_col.asc(),)
+    if descending:
+        return sort_col.desc(), id_col.desc()
+    return sort_col.asc(), id_col.asc()
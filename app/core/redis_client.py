@@ -0,0 +1,81 @@
+"""
+Kết nối Redis dùng chung cho cache, bộ đếm và khóa giữa các process.
+
+URL lấy từ REDIS_URL, nếu không có thì dùng result backend của Celery khi đó là
+Redis. Redis là tùy chọn: get_redis() trả None khi thiếu thư viện, chưa cấu hình
+hoặc vừa lỗi kết nối (tạm bỏ qua REDIS_RETRY_SECONDS), caller tự dùng phương án cục bộ.
+"""
+import threading
+import time
+from typing import Optional
+
+from app.core.config import get_settings
+
+try:
+    import redis
+    from redis.exceptions import RedisError
+except ImportError:  # redis là optional
+    redis = None
+
+    class RedisError(Exception):
+        pass
+
+settings = get_settings()
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+_down_until = 0.0
+
+
+def redis_url() -> Optional[str]:
+    if settings.REDIS_URL:
+        return settings.REDIS_URL
+    backend = getattr(settings, "CELERY_RESULT_BACKEND", None) or "redis://localhost:6379/0"
+    return backend if backend.startswith(("redis://", "rediss://")) else None
+
+
+def get_redis():
+    """Client Redis dùng chung (connection pool tự tạo lại sau fork), hoặc None."""
+    global _client
+    if redis is None or time.monotonic() < _down_until:
+        return None
+    url = redis_url()
+    if not url:
+        return None
+    with _client_lock:
+        if _client is None:
+            _client = redis.Redis.from_url(
+                url,
+                socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                health_check_interval=30,
+            )
+        return _client
+
+
+def get_async_redis():
+    """Client redis.asyncio cho code async (không đặt socket_timeout để dùng được lệnh BLOCK)."""
+    global _async_client
+    if redis is None or time.monotonic() < _down_until:
+        return None
+    url = redis_url()
+    if not url:
+        return None
+    with _client_lock:
+        if _async_client is None:
+            import redis.asyncio as redis_asyncio
+            _async_client = redis_asyncio.Redis.from_url(
+                url,
+                socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                health_check_interval=30,
+            )
+        return _async_client
+
+
+def mark_redis_down(error: Exception) -> None:
+    """Gọi khi một lệnh Redis lỗi: tạm ngừng dùng Redis để request không bị chậm theo."""
+    global _down_until
+    if time.monotonic() >= _down_until:
+        print(f"[redis] unavailable, falling back to local state for {settings.REDIS_RETRY_SECONDS}s: {error}")
+    _down_until = time.monotonic() + settings.REDIS_RETRY_SECONDS
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 from contextlib import contextmanager
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import get_settings
 
@@ -15,3 +16,51 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# ==== Async (route `async def`) ====
+# Route async mà dùng Session đồng bộ sẽ chặn event loop trong lúc chờ DB; các route
+# này dùng AsyncSession. Celery task và route `def` vẫn dùng SessionLocal ở trên.
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def async_database_url(url: str) -> str:
+    """Suy ra URL async từ DATABASE_URL (vd. mysql+pymysql:// -> mysql+aiomysql://)."""
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver known for {parsed.drivername}; set ASYNC_DATABASE_URL")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+_async_engine = None
+_async_sessionmaker = None
+
+
+def get_async_sessionmaker():
+    """Tạo engine async khi cần lần đầu (worker Celery không phải cài driver async)."""
+    global _async_engine, _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        _async_engine = create_async_engine(
+            settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL),
+            pool_pre_ping=True,
+        )
+        # expire_on_commit=False: đọc lại thuộc tính sau commit không phát sinh I/O ngầm
+        _async_sessionmaker = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker
+
+
+async def dispose_async_engine():
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Enum, ForeignKey, DateTime, func
+from sqlalchemy import Column, Integer, String, Text, Enum, ForeignKey, DateTime, Index, UniqueConstraint, func
 from sqlalchemy.orm import relationship
 from app.database import Base
 import enum
@@ -11,12 +11,20 @@ class SenderType(str, enum.Enum):
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # Sidebar: session của user, mới hoạt động nhất trước, phân trang keyset theo (updated_at, id)
+        Index("ix_chat_sessions_user_updated_at_id", "user_id", "updated_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     title = Column(String(255), nullable=True)
     created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    # Thời điểm tin nhắn cuối; phi chuẩn hóa cùng 2 cột dưới, cập nhật trong cùng
+    # transaction mỗi khi thêm ChatMessage (chat_service.touch_session), đổi tên không đổi thứ tự
+    updated_at = Column(DateTime, default=func.now())
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_preview = Column(String(255), nullable=True)
 
     user = relationship("User", back_populates="chat_sessions")
     messages = relationship("ChatMessage", back_populates="session", cascade="all, delete")
@@ -24,11 +32,18 @@ class ChatSession(Base):
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Lịch sử chat: lọc theo session, phân trang keyset ngược theo (timestamp, id)
+        Index("ix_chat_messages_session_timestamp_id", "session_id", "timestamp", "id"),
+        UniqueConstraint("idempotency_key", name="uq_chat_messages_idempotency_key"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("chat_sessions.id", ondelete="CASCADE"), nullable=False)
     sender = Column(Enum(SenderType), nullable=False)
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=func.now())
+    # Khóa chống ghi trùng (vd. id task Celery) khi task được giao lại
+    idempotency_key = Column(String(64), nullable=True)
 
     session = relationship("ChatSession", back_populates="messages")
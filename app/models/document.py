@@ -1,7 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Text, ForeignKey, Enum, UniqueConstraint, Index, DateTime, func
+from sqlalchemy.orm import relationship, deferred
 from app.database import Base
-from sqlalchemy.dialects.postgresql import BYTEA
 import enum
 
 class DocumentStatus(str, enum.Enum):
@@ -9,19 +8,74 @@ class DocumentStatus(str, enum.Enum):
     approved = "approved"
     rejected = "rejected"
 
+class IndexAction(str, enum.Enum):
+    add = "add"
+    remove = "remove"
+
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        # Hàng đợi reviewer: lọc theo status, phân trang keyset theo (cột sắp xếp, id)
+        Index("ix_documents_status_id", "status", "id"),
+        Index("ix_documents_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_documents_status_issuer_agency_id", "status", "issuer_agency", "id"),
+        Index("ix_documents_status_document_type_id", "status", "document_type", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     uploader_id = Column(Integer, ForeignKey("users.id"))
     reviewer_id = Column(Integer, ForeignKey("users.id"), nullable=True)
 
     filename = Column(String, nullable=False)
-    file_content = Column(BYTEA, nullable=True)
+    # Nội dung file nằm trong blob store (app/services/blob_store.py), key = SHA-256
+    file_hash = Column(String(64), nullable=True, index=True)
+    file_size = Column(BigInteger, nullable=True)
+    mime_type = Column(String(255), nullable=True)
     status = Column(Enum(DocumentStatus), default=DocumentStatus.pending)
     type = Column(String, nullable=True)
     issuer_agency = Column(String, nullable=True)
     document_type = Column(String, nullable=True)
+    # Text đã trích xuất (NFC), offset của các chunk tính trên chuỗi này.
+    # Deferred: chỉ nạp khi truy cập, danh sách văn bản không kéo theo cả nội dung
+    parsed_content = deferred(Column(Text, nullable=True))
+    created_at = Column(DateTime, default=func.now())
 
     uploader = relationship("User", foreign_keys=[uploader_id])
-    reviewer = relationship("User", foreign_keys=[reviewer_id])
\ No newline at end of file
+    reviewer = relationship("User", foreign_keys=[reviewer_id])
+    chunks = relationship(
+        "DocumentChunk",
+        back_populates="document",
+        cascade="all, delete-orphan",
+        order_by="DocumentChunk.chunk_index",
+    )
+
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+    __table_args__ = (
+        UniqueConstraint("document_id", "chunk_index", name="uq_document_chunks_document_index"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    # phan | chuong | muc | dieu | khoan | diem | preamble
+    level = Column(String(20), nullable=False)
+    # Ví dụ: "Chương II > Mục 1 > Điều 3 > Khoản 2"
+    path = Column(String(512), nullable=False, default="")
+    heading = Column(String(255), nullable=True)
+    start_offset = Column(Integer, nullable=False)
+    end_offset = Column(Integer, nullable=False)
+    token_count = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+
+    document = relationship("Document", back_populates="chunks")
+
+class IndexEvent(Base):
+    """Outbox cho cập nhật index, ghi cùng transaction với việc đổi trạng thái văn bản."""
+    __tablename__ = "index_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Không đặt FK: sự kiện "remove" vẫn phải xử lý được khi văn bản đã bị xóa
+    document_id = Column(Integer, nullable=False)
+    action = Column(Enum(IndexAction), nullable=False)
+    created_at = Column(DateTime, default=func.now())
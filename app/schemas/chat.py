@@ -54,6 +54,8 @@ class ChatSessionSummary(BaseModel):
     title: str
     created_at: datetime
     updated_at: datetime
+    message_count: int = 0
+    last_message_preview: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from datetime import datetime
 from enum import Enum
 
 class DocumentStatus(str, Enum):
@@ -20,6 +21,73 @@ class DocumentOut(BaseModel):
     filename: str
     issuer_agency: str
     document_type: str
+    created_at: Optional[datetime] = None
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class BatchUploadRejected(BaseModel):
+    filename: str
+    reason: str
+
+class BatchUploadOut(BaseModel):
+    batch_id: Optional[str]
+    document_ids: List[int]
+    rejected: List[BatchUploadRejected]
+
+class BatchProgressOut(BaseModel):
+    batch_id: str
+    total: int
+    pending: int
+    running: int
+    succeeded: int
+    failed: int
+    done: bool
+
+class DocumentChunkOut(BaseModel):
+    id: int
+    chunk_index: int
+    level: str
+    path: str
+    heading: Optional[str]
+    start_offset: int
+    end_offset: int
+    token_count: int
+    content: str
+
+    class Config:
+        orm_mode = True
+
+class DocumentSearchHit(BaseModel):
+    document_id: int
+    score: float
+    filename: str
+    issuer_agency: Optional[str]
+    document_type: Optional[str]
+
+class DocumentSearchResponse(BaseModel):
+    query: str
+    index_version: int
+    took_ms: float
+    hits: List[DocumentSearchHit]
+
+class ChunkSearchHit(BaseModel):
+    chunk_id: int
+    document_id: int
+    score: float
+    filename: str
+    path: str
+    heading: Optional[str]
+    content: str
+
+class ChunkSearchResponse(BaseModel):
+    query: str
+    index_version: int
+    took_ms: float
+    hits: List[ChunkSearchHit]
+
+class IndexVersionOut(BaseModel):
+    version: str
+    bm25_version: int
+    vector_version: int
+    pending_events: int
@@ -0,0 +1,201 @@
+"""
+Kiểm soát nhận việc trước khi đẩy task vào Celery (trả 429 + Retry-After thay vì xếp hàng vô hạn).
+
+- Quota mỗi user: token bucket (rate/phút + burst) trong Redis, cập nhật nguyên tử
+  bằng script Lua theo đồng hồ của Redis nên mọi process API dùng chung một bucket.
+  Không có Redis thì mỗi process giữ bucket riêng (giới hạn lỏng hơn, vẫn chặn spam).
+- AI backend đang bị circuit breaker ngắt: trả 503 ngay, không lưu gì.
+- Hệ thống quá tải: số message đang chờ trong hàng đợi broker vượt ngưỡng thì từ chối
+  ngay. Độ dài hàng đợi được nhớ QUEUE_BACKLOG_CACHE_SECONDS để mỗi request không phải
+  hỏi broker.
+"""
+import math
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.core import metrics
+from app.core.celery_app import CHAT_QUEUE, DOCUMENT_QUEUE, celery_app
+from app.core.config import get_settings
+from app.core.redis_client import RedisError, get_async_redis, get_redis, mark_redis_down
+from app.services.ai_guard import breaker_retry_after_async
+
+settings = get_settings()
+
+_PREFIX = "quota:"
+
+
+class Quota(NamedTuple):
+    name: str
+    per_minute: float
+    burst: int
+
+
+CHAT_QUOTA = Quota("chat", settings.CHAT_QUOTA_PER_MINUTE, settings.CHAT_QUOTA_BURST)
+DOCUMENT_QUOTA = Quota("document", settings.DOCUMENT_QUOTA_PER_MINUTE, settings.DOCUMENT_QUOTA_BURST)
+
+# Trả về số giây cần chờ (0 = được phép); bucket không dùng quá thời gian nạp đầy thì hết hạn
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+def _args(quota: Quota, cost: int) -> Tuple[float, int, int]:
+    # Một lô lớn hơn burst không bao giờ qua được -> tính như một lô đầy
+    return quota.per_minute / 60.0, quota.burst, min(cost, quota.burst)
+
+
+# ===== Bucket cục bộ (không có Redis) =====
+_local: Dict[str, Tuple[float, float]] = {}
+_local_lock = threading.Lock()
+
+
+def _take_local(key: str, quota: Quota, cost: int) -> float:
+    rate, burst, cost = _args(quota, cost)
+    now = time.monotonic()
+    with _local_lock:
+        tokens, ts = _local.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - ts) * rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        _local[key] = (tokens, now)
+    return wait
+
+
+def take_token(quota: Quota, subject, cost: int = 1) -> float:
+    """Lấy `cost` token của `subject`; trả 0 nếu được phép, ngược lại số giây cần chờ."""
+    if quota.per_minute <= 0:
+        return 0.0
+    key = f"{_PREFIX}{quota.name}:{subject}"
+    client = get_redis()
+    if client is not None:
+        try:
+            return float(client.eval(_TAKE_SCRIPT, 1, key, *_args(quota, cost)))
+        except RedisError as e:
+            mark_redis_down(e)
+    return _take_local(key, quota, cost)
+
+
+async def take_token_async(quota: Quota, subject, cost: int = 1) -> float:
+    """Như take_token nhưng dùng client redis.asyncio (route async)."""
+    if quota.per_minute <= 0:
+        return 0.0
+    key = f"{_PREFIX}{quota.name}:{subject}"
+    client = get_async_redis()
+    if client is not None:
+        try:
+            return float(await client.eval(_TAKE_SCRIPT, 1, key, *_args(quota, cost)))
+        except RedisError as e:
+            mark_redis_down(e)
+    return _take_local(key, quota, cost)
+
+
+# ===== Độ dài hàng đợi broker =====
+_backlog: Dict[str, Tuple[float, Optional[int]]] = {}
+
+
+def queue_backlog(queue: str) -> Optional[int]:
+    """Số message đang chờ trong hàng đợi (nhớ vài giây); None nếu không hỏi được broker."""
+    cached = _backlog.get(queue)
+    if cached is not None and time.monotonic() - cached[0] < settings.QUEUE_BACKLOG_CACHE_SECONDS:
+        return cached[1]
+    try:
+        with celery_app.connection_for_read() as conn:
+            conn.ensure_connection(max_retries=0)  # broker lỗi thì bỏ qua ngay, không chờ retry
+            size = conn.default_channel.queue_declare(queue=queue, passive=True).message_count
+    except Exception as e:
+        # Hàng đợi chưa được khai báo (chưa có worker) hoặc broker lỗi: không chặn request
+        print(f"[admission] could not read backlog of {queue}: {e}")
+        size = None
+    _backlog[queue] = (time.monotonic(), size)
+    return size
+
+
+def queue_saturated(queue: str, max_backlog: int) -> bool:
+    if max_backlog <= 0:
+        return False
+    backlog = queue_backlog(queue)
+    return backlog is not None and backlog >= max_backlog
+
+
+def _backlog_is_fresh(queue: str) -> bool:
+    cached = _backlog.get(queue)
+    return cached is not None and time.monotonic() - cached[0] < settings.QUEUE_BACKLOG_CACHE_SECONDS
+
+
+# ===== Lỗi trả cho client =====
+def too_many_requests(retry_after: float, detail: str, status_code: int = 429) -> HTTPException:
+    return HTTPException(
+        status_code=status_code,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def _over_quota(wait: float) -> HTTPException:
+    return too_many_requests(wait, "Too many requests, please retry later")
+
+
+def _saturated() -> HTTPException:
+    return too_many_requests(settings.QUEUE_SATURATED_RETRY_AFTER_SECONDS, "Server is busy, please retry later")
+
+
+def reject_if_over_quota(wait: float, quota: Quota) -> None:
+    if wait > 0:
+        metrics.incr(f"admission.{quota.name}.quota_rejected")
+        raise _over_quota(wait)
+
+
+def reject_if_saturated(queue: str, max_backlog: int) -> None:
+    if queue_saturated(queue, max_backlog):
+        metrics.incr(f"admission.{queue}.saturated")
+        raise _saturated()
+
+
+def admit_documents(user_id: int, count: int) -> None:
+    """Chặn upload khi hàng đợi parse đã quá dài hoặc user hết quota (route sync)."""
+    reject_if_saturated(DOCUMENT_QUEUE, settings.DOCUMENT_QUEUE_MAX_BACKLOG)
+    reject_if_over_quota(take_token(DOCUMENT_QUOTA, user_id, count), DOCUMENT_QUOTA)
+
+
+async def admit_chat(user_id: int, enqueue: bool) -> None:
+    """
+    Chặn một lượt chat khi AI backend đang bị ngắt (503), khi user hết quota, hoặc khi
+    lượt này sẽ đi qua Celery (`enqueue`) mà hàng đợi chat đã quá dài.
+    """
+    retry_after = await breaker_retry_after_async()
+    if retry_after > 0:
+        raise too_many_requests(retry_after, "AI service unavailable, please try later.", status_code=503)
+    if enqueue and settings.CHAT_QUEUE_MAX_BACKLOG > 0:
+        if not _backlog_is_fresh(CHAT_QUEUE):
+            await run_in_threadpool(queue_backlog, CHAT_QUEUE)
+        if queue_saturated(CHAT_QUEUE, settings.CHAT_QUEUE_MAX_BACKLOG):
+            await metrics.incr_async(f"admission.{CHAT_QUEUE}.saturated")
+            raise _saturated()
+    wait = await take_token_async(CHAT_QUOTA, user_id)
+    if wait > 0:
+        await metrics.incr_async(f"admission.{CHAT_QUOTA.name}.quota_rejected")
+        raise _over_quota(wait)
@@ -0,0 +1,394 @@
+"""
+Bảo vệ AI backend: giới hạn đồng thời thích ứng + circuit breaker, dùng chung mọi process.
+
+- Giới hạn đồng thời (AIMD theo độ trễ): mỗi lời gọi giữ một slot trong sorted set
+  Redis "ai:limit:inflight" (score = hạn của slot, process chết thì slot tự hết hạn).
+  Lời gọi xong nhanh hơn AI_LATENCY_TARGET_SECONDS -> giới hạn tăng ~1 sau mỗi
+  "cửa sổ" (limit += 1/limit); chậm hơn mục tiêu hoặc lỗi -> nhân AI_LIMIT_DECREASE_FACTOR
+  (tối đa một lần mỗi AI_LIMIT_DECREASE_COOLDOWN_SECONDS). Hết slot thì chờ tối đa
+  AI_LIMITER_MAX_WAIT_SECONDS rồi báo AIUnavailable.
+- Circuit breaker: AI_BREAKER_FAILURE_THRESHOLD lỗi liên tiếp (timeout, lỗi kết nối,
+  5xx/429) -> mở AI_BREAKER_OPEN_SECONDS, mọi lời gọi thất bại ngay. Hết hạn thì nửa mở:
+  chỉ một lời gọi thử, thành công thì đóng lại, lỗi thì mở tiếp.
+
+Không có Redis thì mỗi process giữ trạng thái riêng với cùng thuật toán.
+"""
+import asyncio
+import random
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.core.redis_client import RedisError, get_async_redis, get_redis, mark_redis_down
+
+settings = get_settings()
+
+_INFLIGHT_KEY = "ai:limit:inflight"
+_LIMIT_KEY = "ai:limit"
+_COOLDOWN_KEY = "ai:limit:cooldown"
+_OPEN_KEY = "ai:breaker:open"
+_TRIPPED_KEY = "ai:breaker:tripped"
+_PROBE_KEY = "ai:breaker:probe"
+_FAILURES_KEY = "ai:breaker:failures"
+
+_LIMIT_KEYS = [_INFLIGHT_KEY, _LIMIT_KEY, _COOLDOWN_KEY]
+_BREAKER_KEYS = [_OPEN_KEY, _TRIPPED_KEY, _PROBE_KEY, _FAILURES_KEY]
+
+# Kết quả một lời gọi đối với bộ giới hạn
+OK, DROP, IGNORE = "ok", "drop", "ignore"
+
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+local limit = tonumber(redis.call('GET', KEYS[2]) or ARGV[3])
+if redis.call('ZCARD', KEYS[1]) < math.floor(limit) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[1])
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+local limit = tonumber(redis.call('GET', KEYS[2]) or ARGV[3])
+local outcome = ARGV[2]
+if outcome == 'ok' then
+    -- Chỉ tăng khi giới hạn đang thực sự được dùng, tránh tăng vô hạn lúc vắng
+    if redis.call('ZCARD', KEYS[1]) * 2 >= limit then
+        limit = math.min(tonumber(ARGV[5]), limit + 1 / limit)
+    end
+elseif outcome == 'drop' then
+    if redis.call('SET', KEYS[3], '1', 'NX', 'PX', ARGV[7]) then
+        limit = math.max(tonumber(ARGV[4]), limit * tonumber(ARGV[6]))
+    end
+end
+redis.call('SET', KEYS[2], tostring(limit))
+return tostring(limit)
+"""
+
+# allow: >0 = ms còn mở, 0 = được gọi, -1 = nửa mở và đã có lời gọi thử; peek: ms còn mở
+_BREAKER_SCRIPT = """
+local op = ARGV[1]
+if op == 'allow' or op == 'peek' then
+    local ttl = redis.call('PTTL', KEYS[1])
+    if ttl > 0 then return ttl end
+    if op == 'peek' or redis.call('EXISTS', KEYS[2]) == 0 then return 0 end
+    if redis.call('SET', KEYS[3], '1', 'NX', 'PX', ARGV[5]) then return 0 end
+    return -1
+elseif op == 'success' then
+    redis.call('DEL', KEYS[2], KEYS[3], KEYS[4])
+    return 0
+end
+local trip = redis.call('EXISTS', KEYS[2]) == 1
+if not trip then
+    local failures = redis.call('INCR', KEYS[4])
+    redis.call('PEXPIRE', KEYS[4], ARGV[4])
+    trip = failures >= tonumber(ARGV[2])
+end
+if trip then
+    redis.call('SET', KEYS[1], '1', 'PX', ARGV[3])
+    redis.call('SET', KEYS[2], '1')
+    redis.call('DEL', KEYS[3], KEYS[4])
+    return 1
+end
+return 0
+"""
+
+_SCRIPTS = {"acquire": _ACQUIRE_SCRIPT, "release": _RELEASE_SCRIPT, "breaker": _BREAKER_SCRIPT}
+
+
+class AIUnavailable(RuntimeError):
+    """AI backend đang bị ngắt (breaker mở) hoặc hết slot; thử lại sau retry_after giây."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _slot_ttl_ms() -> int:
+    # Slot của process chết giữa chừng tự hết hạn sau thời gian gọi dài nhất có thể
+    return int((max(settings.AI_REQUEST_TIMEOUT_SECONDS, settings.AI_STREAM_TIMEOUT) + 10) * 1000)
+
+
+def _args(name: str, *head) -> list:
+    if name == "acquire":
+        return [*head, _slot_ttl_ms(), settings.AI_LIMIT_INITIAL]
+    if name == "release":
+        return [
+            *head, settings.AI_LIMIT_INITIAL, settings.AI_LIMIT_MIN, settings.AI_LIMIT_MAX,
+            settings.AI_LIMIT_DECREASE_FACTOR, int(settings.AI_LIMIT_DECREASE_COOLDOWN_SECONDS * 1000),
+        ]
+    return [
+        *head, settings.AI_BREAKER_FAILURE_THRESHOLD, settings.AI_BREAKER_OPEN_SECONDS * 1000,
+        settings.AI_BREAKER_WINDOW_SECONDS * 1000, int(settings.AI_REQUEST_TIMEOUT_SECONDS * 1000),
+    ]
+
+
+def _keys(name: str) -> list:
+    return _BREAKER_KEYS if name == "breaker" else _LIMIT_KEYS
+
+
+# ===== Trạng thái cục bộ (không có Redis), cùng thuật toán với các script =====
+class _LocalState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inflight: Dict[str, float] = {}
+        self.limit = float(settings.AI_LIMIT_INITIAL)
+        self.cooldown_until = 0.0
+        self.open_until = 0.0
+        self.tripped = False
+        self.probe_until = 0.0
+        self.failures = 0
+        self.failures_until = 0.0
+
+    def run(self, name: str, args: list):
+        now = time.monotonic()
+        with self.lock:
+            self.inflight = {token: exp for token, exp in self.inflight.items() if exp > now}
+            return getattr(self, "_" + name)(now, *args)
+
+    def _acquire(self, now, token, ttl_ms, _initial):
+        if len(self.inflight) < int(self.limit):
+            self.inflight[token] = now + ttl_ms / 1000
+            return 1
+        return 0
+
+    def _release(self, now, token, outcome, _initial, low, high, factor, cooldown_ms):
+        self.inflight.pop(token, None)
+        if outcome == OK and len(self.inflight) * 2 >= self.limit:
+            self.limit = min(high, self.limit + 1 / self.limit)
+        elif outcome == DROP and now >= self.cooldown_until:
+            self.cooldown_until = now + cooldown_ms / 1000
+            self.limit = max(low, self.limit * factor)
+        return str(self.limit)
+
+    def _breaker(self, now, op, threshold, open_ms, window_ms, probe_ms):
+        if op in ("allow", "peek"):
+            if self.open_until > now:
+                return int((self.open_until - now) * 1000) or 1
+            if op == "peek" or not self.tripped:
+                return 0
+            if self.probe_until <= now:
+                self.probe_until = now + probe_ms / 1000
+                return 0
+            return -1
+        if op == "success":
+            self.tripped, self.probe_until, self.failures = False, 0.0, 0
+            return 0
+        trip = self.tripped
+        if not trip:
+            self.failures = (self.failures if self.failures_until > now else 0) + 1
+            self.failures_until = now + window_ms / 1000
+            trip = self.failures >= threshold
+        if trip:
+            self.open_until = now + open_ms / 1000
+            self.tripped, self.probe_until, self.failures = True, 0.0, 0
+            return 1
+        return 0
+
+
+_local = _LocalState()
+
+
+def _eval(name: str, *head):
+    args = _args(name, *head)
+    client = get_redis()
+    if client is not None:
+        try:
+            keys = _keys(name)
+            return client.eval(_SCRIPTS[name], len(keys), *keys, *args)
+        except RedisError as e:
+            mark_redis_down(e)
+    return _local.run(name, args)
+
+
+async def _eval_async(name: str, *head):
+    args = _args(name, *head)
+    client = get_async_redis()
+    if client is not None:
+        try:
+            keys = _keys(name)
+            return await client.eval(_SCRIPTS[name], len(keys), *keys, *args)
+        except RedisError as e:
+            mark_redis_down(e)
+    return _local.run(name, args)
+
+
+# ===== Phân loại kết quả lời gọi =====
+def is_backend_failure(exc: BaseException) -> bool:
+    """Lỗi do AI backend quá tải / không phản hồi (tính cho breaker và giảm giới hạn)."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return isinstance(exc, (httpx.TimeoutException, httpx.TransportError))
+
+
+def _outcome(latency: Optional[float], exc: Optional[BaseException]):
+    """(kết quả cho bộ giới hạn, op cho breaker hoặc None)."""
+    if exc is not None:
+        return (DROP, "failure") if is_backend_failure(exc) else (IGNORE, None)
+    if latency is None:
+        return IGNORE, "success"
+    return (OK if latency <= settings.AI_LATENCY_TARGET_SECONDS else DROP), "success"
+
+
+# Các hàm dưới không tự tăng bộ đếm: bản sync gọi metrics.incr, bản async gọi
+# metrics.incr_async để không chặn event loop.
+def _breaker_rejection(wait_ms: int) -> Optional[AIUnavailable]:
+    if wait_ms > 0:
+        return AIUnavailable("AI backend circuit is open", wait_ms / 1000)
+    if wait_ms < 0:
+        return AIUnavailable("AI backend is recovering", 1.0)
+    return None
+
+
+def _limit_reached() -> AIUnavailable:
+    return AIUnavailable("AI backend concurrency limit reached", settings.AI_LIMITER_MAX_WAIT_SECONDS)
+
+
+def _record(breaker_op: Optional[str], tripped) -> List[str]:
+    if breaker_op != "failure":
+        return []
+    if not int(tripped):
+        return ["ai_guard.failures"]
+    print(f"[ai_guard] circuit opened for {settings.AI_BREAKER_OPEN_SECONDS}s")
+    return ["ai_guard.failures", "ai_guard.breaker_opened"]
+
+
+# ===== Bọc lời gọi AI =====
+@contextmanager
+def ai_call_guard(measure_latency: bool = True):
+    """
+    Bọc một lời gọi AI (đồng bộ, worker Celery): kiểm tra breaker, giữ một slot,
+    rồi ghi nhận độ trễ / lỗi. Raise AIUnavailable nếu không được phép gọi.
+
+    Lượt gọi thử (nửa mở) chỉ được nhận sau khi đã có slot: nhận trước mà hết slot
+    thì khóa probe treo tới khi hết hạn và mọi lời gọi bị từ chối dù backend đã khỏe.
+    """
+    # peek trước để breaker mở thì thất bại ngay, không phải chờ slot
+    rejection = _breaker_rejection(int(_eval("breaker", "peek")))
+    if rejection is not None:
+        metrics.incr("ai_guard.rejected_open")
+        raise rejection
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.AI_LIMITER_MAX_WAIT_SECONDS
+    while not int(_eval("acquire", token)):
+        if time.monotonic() >= deadline:
+            metrics.incr("ai_guard.rejected_limit")
+            raise _limit_reached()
+        time.sleep(settings.AI_LIMITER_POLL_SECONDS)
+    rejection = _breaker_rejection(int(_eval("breaker", "allow")))
+    if rejection is not None:
+        _eval("release", token, IGNORE)
+        metrics.incr("ai_guard.rejected_open")
+        raise rejection
+
+    start = time.monotonic()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        outcome, breaker_op = _outcome(time.monotonic() - start if measure_latency else None, error)
+        _eval("release", token, outcome)
+        if breaker_op:
+            for name in _record(breaker_op, _eval("breaker", breaker_op)):
+                metrics.incr(name)
+
+
+@asynccontextmanager
+async def ai_call_guard_async(measure_latency: bool = True):
+    """Như ai_call_guard cho code async (process API); chờ slot bằng asyncio.sleep."""
+    rejection = _breaker_rejection(int(await _eval_async("breaker", "peek")))
+    if rejection is not None:
+        await metrics.incr_async("ai_guard.rejected_open")
+        raise rejection
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.AI_LIMITER_MAX_WAIT_SECONDS
+    while not int(await _eval_async("acquire", token)):
+        if time.monotonic() >= deadline:
+            await metrics.incr_async("ai_guard.rejected_limit")
+            raise _limit_reached()
+        await asyncio.sleep(settings.AI_LIMITER_POLL_SECONDS)
+    rejection = _breaker_rejection(int(await _eval_async("breaker", "allow")))
+    if rejection is not None:
+        await _eval_async("release", token, IGNORE)
+        await metrics.incr_async("ai_guard.rejected_open")
+        raise rejection
+
+    start = time.monotonic()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        outcome, breaker_op = _outcome(time.monotonic() - start if measure_latency else None, error)
+        await _eval_async("release", token, outcome)
+        if breaker_op:
+            for name in _record(breaker_op, await _eval_async("breaker", breaker_op)):
+                await metrics.incr_async(name)
+
+
+async def breaker_retry_after_async() -> float:
+    """Số giây breaker còn mở (0 = đang đóng / nửa mở); không chiếm lượt gọi thử."""
+    return int(await _eval_async("breaker", "peek")) / 1000
+
+
+def backoff_delay(attempt: int) -> float:
+    """Backoff lũy thừa có jitter đầy đủ: ngẫu nhiên trong [0, min(max, base * 2^attempt)]."""
+    ceiling = min(settings.AI_RETRY_BACKOFF_MAX_SECONDS, settings.AI_RETRY_BACKOFF_BASE_SECONDS * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+
+def ai_backend_state() -> dict:
+    """Giới hạn hiện tại, số lời gọi đang chạy và trạng thái breaker (cho /admin/metrics)."""
+    client = get_redis()
+    if client is not None:
+        try:
+            now_ms = int(time.time() * 1000)
+            pipe = client.pipeline()
+            pipe.get(_LIMIT_KEY)
+            pipe.zcount(_INFLIGHT_KEY, now_ms, "+inf")
+            pipe.pttl(_OPEN_KEY)
+            pipe.exists(_TRIPPED_KEY)
+            pipe.get(_FAILURES_KEY)
+            limit, in_flight, open_ms, tripped, failures = pipe.execute()
+            return _state(
+                float(limit) if limit is not None else float(settings.AI_LIMIT_INITIAL),
+                in_flight, max(open_ms, 0) / 1000, bool(tripped), int(failures or 0), "redis",
+            )
+        except RedisError as e:
+            mark_redis_down(e)
+    now = time.monotonic()
+    with _local.lock:
+        return _state(
+            _local.limit,
+            sum(1 for exp in _local.inflight.values() if exp > now),
+            max(_local.open_until - now, 0),
+            _local.tripped,
+            _local.failures if _local.failures_until > now else 0,
+            "local",
+        )
+
+
+def _state(limit, in_flight, open_for, tripped, failures, scope) -> dict:
+    breaker = "open" if open_for > 0 else ("half_open" if tripped else "closed")
+    return {
+        "scope": scope,
+        "limit": round(limit, 2),
+        "in_flight": in_flight,
+        "breaker": breaker,
+        "breaker_open_for_seconds": round(open_for, 1),
+        "consecutive_failures": failures,
+    }
@@ -0,0 +1,125 @@
+"""
+Cache câu trả lời cho các câu hỏi lặp lại.
+
+Key = SHA-256 của (câu hỏi đã chuẩn hóa, fingerprint lịch sử gửi kèm, version
+corpus đã index). Câu hỏi chuẩn hóa bằng NFC + casefold + gộp khoảng trắng và bỏ
+dấu câu cuối, nên "Thủ tục đăng ký tạm trú?" và "thủ tục  đăng ký tạm trú" trùng
+key; duyệt/gỡ văn bản làm đổi version nên câu trả lời cũ tự hết hiệu lực.
+
+Backend: Redis (TTL theo key + sorted set thời điểm truy cập để evict LRU khi
+vượt ANSWER_CACHE_MAX_ENTRIES) hoặc LRU trong bộ nhớ process khi không có Redis
+(khi đó chỉ các câu trả lời sinh ngay trong process API mới được cache).
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.core.redis_client import RedisError, get_redis, mark_redis_down
+from app.services.index_events import corpus_version
+from app.services.vi_text import normalize_text
+
+settings = get_settings()
+
+_LRU_KEY = "answer_cache:lru"
+
+
+def normalize_question(question: str) -> str:
+    return normalize_text(question).rstrip(" ?.!…")
+
+
+def answer_cache_key(question: str, chat_history: List[Dict[str, str]]) -> str:
+    history = json.dumps(
+        [[item["role"], normalize_text(item["content"])] for item in chat_history],
+        ensure_ascii=False,
+    )
+    raw = "\x1f".join((normalize_question(question), history, corpus_version()))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _MemoryAnswerCache:
+    def __init__(self):
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + settings.ANSWER_CACHE_TTL_SECONDS, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.ANSWER_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+
+class _RedisAnswerCache:
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key: str) -> Optional[dict]:
+        raw = self.client.get(f"answer_cache:{key}")
+        if raw is None:
+            return None
+        self.client.zadd(_LRU_KEY, {key: time.time()})
+        return json.loads(raw)
+
+    def put(self, key: str, value: dict) -> None:
+        pipe = self.client.pipeline()
+        pipe.set(f"answer_cache:{key}", json.dumps(value, ensure_ascii=False), ex=settings.ANSWER_CACHE_TTL_SECONDS)
+        pipe.zadd(_LRU_KEY, {key: time.time()})
+        pipe.zcard(_LRU_KEY)
+        size = pipe.execute()[-1]
+        excess = size - settings.ANSWER_CACHE_MAX_ENTRIES
+        if excess > 0:
+            # Evict các key lâu không dùng nhất (key hết TTL cũng rơi ra ở đây)
+            oldest = [member for member, _ in self.client.zpopmin(_LRU_KEY, excess)]
+            if oldest:
+                self.client.delete(*[f"answer_cache:{member.decode()}" for member in oldest])
+
+
+_memory_cache = _MemoryAnswerCache()
+
+
+def _with_fallback(method: str, *args):
+    client = get_redis()
+    if client is not None:
+        try:
+            return getattr(_RedisAnswerCache(client), method)(*args)
+        except RedisError as e:
+            mark_redis_down(e)
+    return getattr(_memory_cache, method)(*args)
+
+
+def get_cached_answer(key: str, bypass: bool = False) -> Optional[dict]:
+    """Câu trả lời đã cache ({"answer": ...}) hoặc None; bypass=True bỏ qua cache (vẫn đếm)."""
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    if bypass:
+        metrics.incr("answer_cache.bypass")
+        return None
+    value = _with_fallback("get", key)
+    metrics.incr("answer_cache.hit" if value is not None else "answer_cache.miss")
+    return value
+
+
+def store_answer(key: Optional[str], result: dict) -> None:
+    """Lưu kết quả của AI nếu là câu trả lời hợp lệ."""
+    if not key or not settings.ANSWER_CACHE_ENABLED:
+        return
+    if not isinstance(result, dict) or result.get("error") or not result.get("answer"):
+        return
+    _with_fallback("put", key, {"answer": result["answer"], "cached_at": int(time.time())})
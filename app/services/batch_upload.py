@@ -0,0 +1,116 @@
+"""
+Tách các file trong một lần upload hàng loạt (nhiều file và/hoặc file ZIP).
+
+Mỗi entry ZIP được đọc dạng stream (zipfile giải nén dần khi đọc) và ghi thẳng
+vào blob store, không giải nén toàn bộ archive vào RAM hay ra đĩa.
+"""
+import mimetypes
+import os
+import zipfile
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+
+from app.core.celery_app import celery_app
+from app.core.config import get_settings
+from app.services.blob_store import BlobTooLargeError, StoredBlob, get_blob_store
+
+settings = get_settings()
+
+# Trong ZIP chỉ lấy định dạng parse được, bỏ qua file rác (Thumbs.db, .DS_Store, ...)
+ARCHIVE_ALLOWED_SUFFIXES = (".pdf", ".docx", ".doc")
+
+
+class StoredUpload(NamedTuple):
+    filename: str
+    content_type: str
+    blob: StoredBlob
+
+
+class RejectedUpload(NamedTuple):
+    filename: str
+    reason: str
+
+
+def is_zip_upload(filename: str, content_type: Optional[str]) -> bool:
+    return filename.lower().endswith(".zip") or content_type in ("application/zip", "application/x-zip-compressed")
+
+
+def _guess_type(filename: str, content_type: Optional[str] = None) -> str:
+    return content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def _store(filename: str, src: BinaryIO, content_type: Optional[str] = None):
+    try:
+        blob = get_blob_store().save_stream(src, max_size=settings.UPLOAD_MAX_FILE_SIZE)
+    except BlobTooLargeError:
+        return RejectedUpload(filename, f"File size exceeds {settings.UPLOAD_MAX_FILE_SIZE // (1024 * 1024)}MB limit")
+    return StoredUpload(filename, _guess_type(filename, content_type), blob)
+
+
+def _iter_archive(archive_name: str, fileobj: BinaryIO, limit: int) -> Iterator:
+    try:
+        zf = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        yield RejectedUpload(archive_name, "Invalid ZIP archive")
+        return
+
+    with zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            name = os.path.basename(info.filename)
+            if not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                continue
+            display = f"{archive_name}/{info.filename}"
+            if not name.lower().endswith(ARCHIVE_ALLOWED_SUFFIXES):
+                yield RejectedUpload(display, "Unsupported file type")
+                continue
+            if limit <= 0:
+                yield RejectedUpload(display, "Too many files in batch")
+                continue
+            # file_size trong header có thể sai (zip bomb) -> save_stream vẫn chặn theo số byte thật
+            if info.file_size > settings.UPLOAD_MAX_FILE_SIZE:
+                yield RejectedUpload(display, f"File size exceeds {settings.UPLOAD_MAX_FILE_SIZE // (1024 * 1024)}MB limit")
+                continue
+            try:
+                with zf.open(info) as src:
+                    result = _store(name, src)
+            except (zipfile.BadZipFile, RuntimeError, NotImplementedError, OSError) as e:
+                # CRC sai, entry mã hóa, phương thức nén không hỗ trợ, ...
+                result = RejectedUpload(display, f"Could not read entry: {e}")
+            if isinstance(result, StoredUpload):
+                limit -= 1
+            yield result
+
+
+def store_uploads(files, max_files: int):
+    """
+    Lưu các file upload (UploadFile) vào blob store.
+    Trả về (danh sách StoredUpload, danh sách RejectedUpload).
+    """
+    stored: List[StoredUpload] = []
+    rejected: List[RejectedUpload] = []
+    for upload in files:
+        filename = upload.filename or "upload"
+        if is_zip_upload(filename, upload.content_type):
+            entries = _iter_archive(filename, upload.file, max_files - len(stored))
+        elif len(stored) >= max_files:
+            entries = [RejectedUpload(filename, "Too many files in batch")]
+        else:
+            entries = [_store(filename, upload.file, upload.content_type)]
+        for entry in entries:
+            (stored if isinstance(entry, StoredUpload) else rejected).append(entry)
+    return stored, rejected
+
+
+def _owner_key(batch_id: str) -> str:
+    return f"upload-batch-owner-{batch_id}"
+
+
+def save_batch_owner(batch_id: str, user_id: int) -> None:
+    """Ghi người upload của batch cạnh GroupResult (cùng result backend, cùng hạn result_expires)."""
+    celery_app.backend.set(_owner_key(batch_id), str(user_id))
+
+
+def batch_owner(batch_id: str) -> Optional[int]:
+    raw = celery_app.backend.get(_owner_key(batch_id))
+    return int(raw) if raw is not None else None
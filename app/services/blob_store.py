@@ -0,0 +1,201 @@
+"""
+Blob store đánh địa chỉ theo nội dung (SHA-256) cho file upload.
+
+- LocalBlobStore: lưu trên filesystem (mặc định).
+- S3BlobStore: backend tương thích S3 (AWS, MinIO, ... qua S3_ENDPOINT_URL).
+
+Bảng `documents` chỉ giữ hash, kích thước và MIME type; bytes nằm ở đây.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+class BlobTooLargeError(ValueError):
+    """File vượt quá giới hạn kích thước cho phép."""
+
+
+class StoredBlob(NamedTuple):
+    sha256: str
+    size: int
+
+
+def _copy_hashed(src: BinaryIO, dst: BinaryIO, max_size: Optional[int], chunk_size: int) -> StoredBlob:
+    """Copy theo từng chunk, vừa ghi vừa tính SHA-256; không giữ cả file trong RAM."""
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise BlobTooLargeError(f"File exceeds {max_size} bytes")
+        digest.update(chunk)
+        dst.write(chunk)
+    return StoredBlob(digest.hexdigest(), size)
+
+
+class BlobStore:
+    """Interface chung cho các backend lưu blob."""
+
+    def save_stream(self, src: BinaryIO, max_size: Optional[int] = None) -> StoredBlob:
+        raise NotImplementedError
+
+    def exists(self, sha256: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, sha256: str) -> None:
+        raise NotImplementedError
+
+    def persistent_path(self, sha256: str) -> Optional[Path]:
+        """Đường dẫn local bền vững (nếu backend có), dùng để stream thẳng không cần copy."""
+        return None
+
+    @contextmanager
+    def open_local(self, sha256: str, suffix: str = "") -> Iterator[Path]:
+        """Trả về đường dẫn local tới blob (kèm đuôi file nếu cần cho parser/converter)."""
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str, chunk_size: int):
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        (self.root / "tmp").mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256[2:4] / sha256
+
+    def save_stream(self, src: BinaryIO, max_size: Optional[int] = None) -> StoredBlob:
+        tmp_path = self.root / "tmp" / uuid.uuid4().hex
+        try:
+            with open(tmp_path, "wb") as out:
+                blob = _copy_hashed(src, out, max_size, self.chunk_size)
+                out.flush()
+                os.fsync(out.fileno())
+
+            target = self.path_for(blob.sha256)
+            if target.exists():
+                # Dedup: nội dung đã có sẵn, bỏ bản tạm
+                tmp_path.unlink()
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, target)
+            return blob
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def exists(self, sha256: str) -> bool:
+        return self.path_for(sha256).exists()
+
+    def delete(self, sha256: str) -> None:
+        path = self.path_for(sha256)
+        if path.exists():
+            path.unlink()
+
+    def persistent_path(self, sha256: str) -> Optional[Path]:
+        path = self.path_for(sha256)
+        return path if path.exists() else None
+
+    @contextmanager
+    def open_local(self, sha256: str, suffix: str = "") -> Iterator[Path]:
+        path = self.path_for(sha256)
+        if not path.exists():
+            raise FileNotFoundError(f"Blob {sha256} not found")
+        if not suffix:
+            yield path
+            return
+
+        # Parser/LibreOffice nhận dạng theo đuôi file -> tạo hardlink có đuôi trong thư mục tạm
+        work_dir = Path(tempfile.mkdtemp(prefix="blob-"))
+        linked = work_dir / f"{sha256}{suffix}"
+        try:
+            try:
+                os.link(path, linked)
+            except OSError:
+                shutil.copyfile(path, linked)
+            yield linked
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class S3BlobStore(BlobStore):
+    def __init__(self, bucket: str, chunk_size: int, endpoint_url: Optional[str] = None,
+                 access_key: Optional[str] = None, secret_key: Optional[str] = None,
+                 region: Optional[str] = None, prefix: str = "blobs/"):
+        import boto3  # chỉ cần khi dùng backend S3
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region,
+        )
+
+    def key_for(self, sha256: str) -> str:
+        return f"{self.prefix}{sha256[:2]}/{sha256}"
+
+    def save_stream(self, src: BinaryIO, max_size: Optional[int] = None) -> StoredBlob:
+        # Cần biết hash trước khi đặt key -> spool ra file tạm rồi mới upload
+        with tempfile.NamedTemporaryFile(prefix="blob-") as spool:
+            blob = _copy_hashed(src, spool, max_size, self.chunk_size)
+            spool.flush()
+            if not self.exists(blob.sha256):
+                self.client.upload_file(spool.name, self.bucket, self.key_for(blob.sha256))
+        return blob
+
+    def exists(self, sha256: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key_for(sha256))
+            return True
+        except ClientError:
+            return False
+
+    def delete(self, sha256: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.key_for(sha256))
+
+    @contextmanager
+    def open_local(self, sha256: str, suffix: str = "") -> Iterator[Path]:
+        work_dir = Path(tempfile.mkdtemp(prefix="blob-"))
+        local = work_dir / f"{sha256}{suffix}"
+        try:
+            self.client.download_file(self.bucket, self.key_for(sha256), str(local))
+            yield local
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+@lru_cache()
+def get_blob_store() -> BlobStore:
+    backend = settings.BLOB_STORE_BACKEND.lower()
+    if backend == "local":
+        return LocalBlobStore(settings.BLOB_STORE_DIR, settings.UPLOAD_CHUNK_SIZE)
+    if backend == "s3":
+        return S3BlobStore(
+            bucket=settings.S3_BUCKET,
+            chunk_size=settings.UPLOAD_CHUNK_SIZE,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            access_key=settings.S3_ACCESS_KEY_ID,
+            secret_key=settings.S3_SECRET_ACCESS_KEY,
+            region=settings.S3_REGION,
+        )
+    raise ValueError(f"Unknown BLOB_STORE_BACKEND: {settings.BLOB_STORE_BACKEND}")
@@ -0,0 +1,223 @@
+"""
+Cửa sổ lịch sử hội thoại gửi kèm câu hỏi cho AI backend.
+
+Lấy các tin nhắn gần nhất của session (mới nhất trước) cho tới khi hết ngân sách
+CHAT_HISTORY_TOKEN_BUDGET token hoặc CHAT_HISTORY_MAX_MESSAGES tin nhắn, trả về
+theo thứ tự thời gian. Mỗi session có một cache (Redis list, hoặc bộ nhớ process)
+chứa đoạn cuối hội thoại: tin nhắn mới được append vào cache khi lưu, nên dựng
+cửa sổ không phải quét lại DB. Cache miss chỉ đọc ngược từ DB đến khi đủ ngân sách.
+
+Cache đếm số tin nhắn đã ghi nhận và được so với ChatSession.message_count khi đọc:
+lệch (tin bot lưu ở worker không thấy cache bộ nhớ của API, append bị bỏ khi Redis
+tạm lỗi) thì nạp lại từ DB.
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import get_settings
+from app.core.redis_client import RedisError, get_redis, mark_redis_down
+from app.models.chat import ChatMessage
+from app.services.chunking_service import count_tokens
+
+settings = get_settings()
+
+# (message_id, role, content, tokens)
+HistoryEntry = Tuple[int, str, str, int]
+# (số tin nhắn của session mà cache đã ghi nhận, các entry cuối)
+CachedHistory = Tuple[int, List[HistoryEntry]]
+
+_ROLES = {"user": "user", "bot": "assistant"}
+
+
+def _entry(message_id: int, sender, content: str) -> HistoryEntry:
+    sender = getattr(sender, "value", sender)
+    return message_id, _ROLES.get(sender, sender), content, count_tokens(content)
+
+
+# ===== Cache =====
+class _MemoryHistoryCache:
+    def __init__(self, max_sessions: int = 10000):
+        self._sessions: "OrderedDict[int, CachedHistory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_sessions = max_sessions
+
+    def get(self, session_id: int) -> Optional[CachedHistory]:
+        with self._lock:
+            cached = self._sessions.get(session_id)
+            if cached is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            return cached[0], list(cached[1])
+
+    def fill(self, session_id: int, count: int, entries: List[HistoryEntry]) -> None:
+        with self._lock:
+            self._sessions[session_id] = (count, list(entries))
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def append(self, session_id: int, entry: HistoryEntry) -> None:
+        with self._lock:
+            cached = self._sessions.get(session_id)
+            if cached is None:
+                return  # chưa cache -> lần đọc sau tự nạp từ DB
+            count, entries = cached
+            entries.append(entry)
+            del entries[:-settings.CHAT_HISTORY_MAX_MESSAGES]
+            self._sessions[session_id] = (count + 1, entries)
+
+    def drop(self, session_id: int) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+# Append + tăng bộ đếm trong một bước, chỉ khi session đã được cache
+_APPEND_SCRIPT = """
+if redis.call('RPUSHX', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[2]), -1)
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+
+class _RedisHistoryCache:
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def _keys(session_id: int) -> Tuple[str, str]:
+        return f"chat:history:{session_id}", f"chat:history:{session_id}:count"
+
+    def get(self, session_id: int) -> Optional[CachedHistory]:
+        key, count_key = self._keys(session_id)
+        pipe = self.client.pipeline()
+        pipe.lrange(key, 0, -1)
+        pipe.get(count_key)
+        raw, count = pipe.execute()
+        if not raw or count is None:
+            return None
+        # "[]" là marker để phân biệt "đã cache, hội thoại rỗng" với "chưa cache"
+        return int(count), [tuple(entry) for entry in map(json.loads, raw) if entry]
+
+    def fill(self, session_id: int, count: int, entries: List[HistoryEntry]) -> None:
+        key, count_key = self._keys(session_id)
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        pipe.rpush(key, "[]", *[json.dumps(entry, ensure_ascii=False) for entry in entries])
+        pipe.set(count_key, count, ex=settings.CHAT_HISTORY_CACHE_TTL_SECONDS)
+        pipe.expire(key, settings.CHAT_HISTORY_CACHE_TTL_SECONDS)
+        pipe.execute()
+
+    def append(self, session_id: int, entry: HistoryEntry) -> None:
+        self.client.eval(
+            _APPEND_SCRIPT, 2, *self._keys(session_id),
+            json.dumps(entry, ensure_ascii=False),
+            settings.CHAT_HISTORY_MAX_MESSAGES + 1,
+            settings.CHAT_HISTORY_CACHE_TTL_SECONDS,
+        )
+
+    def drop(self, session_id: int) -> None:
+        self.client.delete(*self._keys(session_id))
+
+
+_memory_cache = _MemoryHistoryCache()
+
+
+def _cache():
+    client = get_redis()
+    return _RedisHistoryCache(client) if client is not None else _memory_cache
+
+
+def _with_fallback(method: str, *args):
+    cache = _cache()
+    try:
+        return getattr(cache, method)(*args)
+    except RedisError as e:
+        mark_redis_down(e)
+        return getattr(_memory_cache, method)(*args)
+
+
+# ===== API =====
+def _select_recent(session_id: int):
+    return select(ChatMessage.id, ChatMessage.sender, ChatMessage.content)\
+        .where(ChatMessage.session_id == session_id)\
+        .order_by(ChatMessage.id.desc())\
+        .limit(settings.CHAT_HISTORY_MAX_MESSAGES)
+
+
+def _take_budget(rows) -> List[HistoryEntry]:
+    """Lấy từ tin nhắn mới nhất cho tới khi đủ ngân sách; trả về theo thứ tự cũ -> mới."""
+    budget = settings.CHAT_HISTORY_TOKEN_BUDGET
+    entries, used = [], 0
+    for row in rows:
+        entry = _entry(row.id, row.sender, row.content)
+        entries.append(entry)
+        used += entry[3]
+        if used >= budget:
+            break
+    entries.reverse()
+    return entries
+
+
+def _window(entries: List[HistoryEntry]) -> List[Dict[str, str]]:
+    budget = settings.CHAT_HISTORY_TOKEN_BUDGET
+    window, used = [], 0
+    for _, role, content, tokens in reversed(entries[-settings.CHAT_HISTORY_MAX_MESSAGES:]):
+        if used + tokens > budget:
+            break
+        window.append({"role": role, "content": content})
+        used += tokens
+    window.reverse()
+    return window
+
+
+def _fresh_entries(session_id: int, message_count: int) -> Optional[List[HistoryEntry]]:
+    """Entry trong cache nếu cache đã ghi nhận đủ message_count tin nhắn, ngược lại None."""
+    cached = _with_fallback("get", session_id)
+    if cached is None or cached[0] != message_count:
+        return None
+    return cached[1]
+
+
+def get_history_window(db: Session, session_id: int, message_count: int) -> List[Dict[str, str]]:
+    """
+    Lịch sử gửi cho AI: [{"role", "content"}] theo thứ tự thời gian, trong ngân sách token.
+    message_count = ChatSession.message_count hiện tại, dùng để kiểm tra cache.
+    """
+    entries = _fresh_entries(session_id, message_count)
+    if entries is None:
+        entries = _take_budget(db.execute(_select_recent(session_id).execution_options(yield_per=20)))
+        _with_fallback("fill", session_id, message_count, entries)
+    return _window(entries)
+
+
+async def get_history_window_async(db: AsyncSession, session_id: int, message_count: int) -> List[Dict[str, str]]:
+    """
+    Như get_history_window, đọc DB bằng AsyncSession khi cache miss. Cache dùng Redis
+    client sync nên được gọi trong threadpool để không chặn event loop.
+    """
+    entries = await run_in_threadpool(_fresh_entries, session_id, message_count)
+    if entries is None:
+        entries = _take_budget((await db.execute(_select_recent(session_id))).all())
+        await run_in_threadpool(_with_fallback, "fill", session_id, message_count, entries)
+    return _window(entries)
+
+
+def record_message(session_id: int, message_id: int, sender, content: str) -> None:
+    """Gọi sau khi lưu một ChatMessage để cập nhật cache của session."""
+    _with_fallback("append", session_id, _entry(message_id, sender, content))
+
+
+def drop_history(session_id: int) -> None:
+    _with_fallback("drop", session_id)
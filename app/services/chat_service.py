@@ -0,0 +1,160 @@
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.core.pagination import encode_cursor, keyset_filter, keyset_order
+from app.database import SessionLocal
+from app.models.chat import ChatMessage, ChatSession
+from app.services.chat_history import record_message
+from app.services.answer_cache import store_answer
+
+PREVIEW_CHARS = 160
+
+
+def message_preview(content: str) -> str:
+    return " ".join(content.split())[:PREVIEW_CHARS]
+
+
+def touch_session(session_id: int, content: str, timestamp: datetime):
+    """
+    UPDATE đi kèm mỗi lần thêm ChatMessage (chạy trong cùng transaction): đếm tin nhắn,
+    đoạn trích tin cuối và updated_at = thời điểm tin nhắn, để sidebar chỉ cần một truy vấn.
+    """
+    return update(ChatSession)\
+        .where(ChatSession.id == session_id)\
+        .values(
+            message_count=ChatSession.message_count + 1,
+            last_message_preview=message_preview(content),
+            updated_at=timestamp,
+        )
+
+
+def save_bot_message(session_id: int, content: str) -> int:
+    """Lưu câu trả lời của bot; trả về id của ChatMessage."""
+    db = SessionLocal()
+    try:
+        bot_msg = ChatMessage(
+            session_id=session_id,
+            sender="bot",
+            content=content,
+            timestamp=datetime.utcnow()
+        )
+        db.add(bot_msg)
+        db.flush()
+        message_id = bot_msg.id
+        db.execute(touch_session(session_id, content, bot_msg.timestamp))
+        db.commit()
+        record_message(session_id, message_id, "bot", content)
+        return message_id
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def save_bot_message_async(db: AsyncSession, session_id: int, content: str) -> int:
+    """Như save_bot_message nhưng dùng AsyncSession của route async."""
+    bot_msg = ChatMessage(
+        session_id=session_id,
+        sender="bot",
+        content=content,
+        timestamp=datetime.utcnow()
+    )
+    db.add(bot_msg)
+    await db.flush()
+    message_id = bot_msg.id
+    await db.execute(touch_session(session_id, content, bot_msg.timestamp))
+    await db.commit()
+    # Redis client sync: chạy trong threadpool để không chặn event loop
+    await run_in_threadpool(record_message, session_id, message_id, "bot", content)
+    return message_id
+
+
+def finish_chat_turn(
+    payload: dict,
+    result: dict,
+    save: Callable[[int, str], int] = save_bot_message,
+) -> dict:
+    """
+    Lưu câu trả lời của AI (DB + cache lịch sử + cache câu trả lời) và trả về
+    kết quả kèm message_id. Dùng chung cho đường sync và task Celery (worker truyền
+    `save` ghi qua buffer theo lô). Lỗi ghi DB được raise để task Celery retry thay vì
+    được ack khi tin nhắn chưa được lưu.
+    """
+    if not isinstance(result, dict) or "answer" not in result:
+        return result
+    result = dict(result)
+    result["message_id"] = save(payload["session_id"], result["answer"])
+    print(f"[finish_chat_turn] saved bot message for session={payload['session_id']}")
+    store_answer(payload.get("cache_key"), result)
+    return result
+
+
+async def list_session_messages(
+    db: AsyncSession,
+    user_id: int,
+    session_id: int,
+    before: Optional[str] = None,
+    limit: int = 50,
+) -> Tuple[Optional[List[dict]], Optional[str]]:
+    """
+    Một trang tin nhắn của session (mới nhất trước cursor `before`), trả về theo thứ tự
+    thời gian cùng cursor để tải trang cũ hơn. Một truy vấn projection, kiểm tra quyền
+    sở hữu bằng join; trả về (None, None) nếu session không tồn tại / không thuộc user.
+    """
+    query = select(ChatMessage.id, ChatMessage.sender, ChatMessage.content, ChatMessage.timestamp)\
+        .join(ChatSession, ChatSession.id == ChatMessage.session_id)\
+        .where(ChatMessage.session_id == session_id, ChatSession.user_id == user_id)
+    condition = keyset_filter(ChatMessage.timestamp, ChatMessage.id, before, descending=True)
+    if condition is not None:
+        query = query.where(condition)
+    query = query.order_by(*keyset_order(ChatMessage.timestamp, ChatMessage.id, descending=True))\
+        .limit(limit + 1)
+
+    rows = (await db.execute(query)).mappings().all()
+    if not rows:
+        # Trang rỗng: phân biệt "hết tin nhắn" với "không có quyền"
+        owned = await db.scalar(select(ChatSession.id).filter_by(id=session_id, user_id=user_id))
+        return ([], None) if owned else (None, None)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        oldest = rows[-1]
+        next_cursor = encode_cursor(ChatMessage.timestamp, oldest["timestamp"], oldest["id"], descending=True)
+    return [dict(row) for row in reversed(rows)], next_cursor
+
+
+def list_chat_sessions(
+    db: Session,
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+) -> Tuple[List[dict], Optional[str]]:
+    """Sidebar: session mới hoạt động nhất trước (một truy vấn theo index), kèm cursor trang sau."""
+    query = select(
+        ChatSession.id,
+        ChatSession.title,
+        ChatSession.created_at,
+        ChatSession.updated_at,
+        ChatSession.message_count,
+        ChatSession.last_message_preview,
+    ).where(ChatSession.user_id == user_id)
+    condition = keyset_filter(ChatSession.updated_at, ChatSession.id, cursor, descending=True)
+    if condition is not None:
+        query = query.where(condition)
+    query = query.order_by(*keyset_order(ChatSession.updated_at, ChatSession.id, descending=True))\
+        .limit(limit + 1)
+
+    rows = db.execute(query).mappings().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(ChatSession.updated_at, last["updated_at"], last["id"], descending=True)
+    return [dict(row) for row in rows], next_cursor
@@ -0,0 +1,273 @@
+"""
+Stream câu trả lời chat qua Server-Sent Events.
+
+Việc gọi AI chạy thành task nền trong process API, độc lập với kết nối HTTP:
+mỗi token được ghi vào một buffer theo stream_id (Redis Stream nếu có Redis,
+nếu không thì bộ nhớ của process). Response SSE chỉ đọc từ buffer, nên client
+mất kết nối có thể nối lại với Last-Event-ID và nhận tiếp từ token kế tiếp.
+
+Sự kiện: `meta` (session/stream id), `token` ({"delta": ...}), kết thúc bằng
+`done` ({"message_id": ...}) hoặc `error`.
+"""
+import asyncio
+import json
+import re
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import get_settings
+from app.core.http_clients import get_async_http_client
+from app.core.redis_client import RedisError, get_async_redis
+from app.services.ai_guard import ai_call_guard_async
+from app.services.answer_cache import store_answer
+from app.services.chat_service import save_bot_message
+
+settings = get_settings()
+
+TERMINAL_EVENTS = ("done", "error")
+
+# Id hợp lệ của Redis Stream; Last-Event-ID do client gửi có thể là bất kỳ chuỗi nào
+_STREAM_ID_RE = re.compile(r"\d+-\d+")
+
+# (event id, event, data)
+StreamEvent = Tuple[str, str, dict]
+
+
+# ===== Buffer =====
+class _MemoryStream:
+    def __init__(self, meta: dict):
+        self.meta = meta
+        self.events: List[StreamEvent] = []
+        self.created = time.monotonic()
+        self.changed = asyncio.Condition()
+
+
+class MemoryStreamBuffer:
+    """Buffer trong process: reconnect chỉ được khi vào lại đúng process này."""
+
+    def __init__(self):
+        self._streams: Dict[str, _MemoryStream] = {}
+
+    def _purge(self) -> None:
+        deadline = time.monotonic() - settings.CHAT_STREAM_TTL_SECONDS
+        for stream_id in [sid for sid, s in self._streams.items() if s.created < deadline]:
+            del self._streams[stream_id]
+
+    async def create(self, stream_id: str, meta: dict) -> None:
+        self._purge()
+        self._streams[stream_id] = _MemoryStream(meta)
+
+    async def get_meta(self, stream_id: str) -> Optional[dict]:
+        stream = self._streams.get(stream_id)
+        return stream.meta if stream else None
+
+    async def append(self, stream_id: str, event: str, data: dict) -> None:
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            return
+        async with stream.changed:
+            stream.events.append((str(len(stream.events) + 1), event, data))
+            stream.changed.notify_all()
+
+    async def read(self, stream_id: str, after: Optional[str], timeout: float) -> List[StreamEvent]:
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            return []
+        try:
+            start = int(after or 0)
+        except ValueError:
+            start = 0
+        async with stream.changed:
+            if len(stream.events) <= start:
+                try:
+                    await asyncio.wait_for(stream.changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    return []
+            return stream.events[start:]
+
+
+class RedisStreamBuffer:
+    """Buffer dùng Redis Stream: mọi worker API đều đọc được, id sự kiện = id Redis."""
+
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def _key(stream_id: str) -> str:
+        return f"chat:stream:{stream_id}"
+
+    async def create(self, stream_id: str, meta: dict) -> None:
+        key = self._key(stream_id)
+        await self.client.set(f"{key}:meta", json.dumps(meta), ex=settings.CHAT_STREAM_TTL_SECONDS)
+
+    async def get_meta(self, stream_id: str) -> Optional[dict]:
+        raw = await self.client.get(f"{self._key(stream_id)}:meta")
+        return json.loads(raw) if raw else None
+
+    async def append(self, stream_id: str, event: str, data: dict) -> None:
+        key = self._key(stream_id)
+        await self.client.xadd(key, {"event": event, "data": json.dumps(data, ensure_ascii=False)})
+        await self.client.expire(key, settings.CHAT_STREAM_TTL_SECONDS)
+
+    async def read(self, stream_id: str, after: Optional[str], timeout: float) -> List[StreamEvent]:
+        if not after or not _STREAM_ID_RE.fullmatch(after):
+            after = "0-0"  # id không hợp lệ: phát lại từ đầu như buffer bộ nhớ
+        response = await self.client.xread(
+            {self._key(stream_id): after},
+            block=int(timeout * 1000),
+        )
+        events = []
+        for _, entries in response or []:
+            for entry_id, fields in entries:
+                events.append((
+                    entry_id.decode(),
+                    fields[b"event"].decode(),
+                    json.loads(fields[b"data"]),
+                ))
+        return events
+
+
+_buffer = None
+
+
+async def get_stream_buffer():
+    """Chọn backend một lần cho mỗi process: Redis nếu ping được, nếu không thì bộ nhớ."""
+    global _buffer
+    if _buffer is None:
+        client = get_async_redis()
+        if client is not None:
+            try:
+                await client.ping()
+                _buffer = RedisStreamBuffer(client)
+            except (RedisError, OSError) as e:
+                print(f"[chat_stream] Redis unavailable, streams are process-local: {e}")
+        if _buffer is None:
+            _buffer = MemoryStreamBuffer()
+    return _buffer
+
+
+# ===== Đọc token từ AI backend =====
+def _delta_from(raw: str) -> str:
+    """Một chunk từ AI: JSON {"delta"|"token"|"content": ...}, kiểu OpenAI, hoặc text thuần."""
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return raw
+    if isinstance(data, str):
+        return data
+    if not isinstance(data, dict):
+        return ""
+    for field in ("delta", "token", "content", "text"):
+        if isinstance(data.get(field), str):
+            return data[field]
+    choices = data.get("choices")
+    if choices:
+        return (choices[0].get("delta") or {}).get("content") or ""
+    return ""
+
+
+async def iter_ai_deltas(response: httpx.Response) -> AsyncIterator[str]:
+    """Đọc token theo content-type; backend không stream (JSON) thì trả cả câu trả lời một lần."""
+    content_type = response.headers.get("content-type", "")
+    if "text/event-stream" in content_type:
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            raw = line[5:].strip()
+            if raw == "[DONE]":
+                break
+            yield _delta_from(raw)
+    elif "ndjson" in content_type or "jsonl" in content_type:
+        async for line in response.aiter_lines():
+            if line.strip():
+                yield _delta_from(line)
+    elif "application/json" in content_type:
+        data = json.loads(await response.aread())
+        yield data.get("answer", "") if isinstance(data, dict) else ""
+    else:
+        async for text in response.aiter_text():
+            yield text
+
+
+async def _produce(stream_id: str, session_id: int, payload: dict, cached_answer: Optional[str] = None) -> None:
+    buffer = await get_stream_buffer()
+    parts = []
+    try:
+        if cached_answer is not None:
+            parts.append(cached_answer)
+            await buffer.append(stream_id, "token", {"delta": cached_answer})
+        else:
+            timeout = httpx.Timeout(settings.AI_STREAM_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+            client = get_async_http_client("ai")
+            url = settings.AI_STREAM_URL or settings.AI_API_URL
+            request_body = {
+                "question": payload["question"],
+                "chat_history": payload.get("chat_history", []),
+                "stream": True,
+            }
+            # Giữ slot suốt thời gian stream; thời lượng stream không dùng làm tín hiệu độ trễ
+            async with ai_call_guard_async(measure_latency=False), \
+                    client.stream("POST", url, json=request_body, timeout=timeout) as response:
+                response.raise_for_status()
+                async for delta in iter_ai_deltas(response):
+                    if delta:
+                        parts.append(delta)
+                        await buffer.append(stream_id, "token", {"delta": delta})
+        answer = "".join(parts)
+        message_id = await run_in_threadpool(save_bot_message, session_id, answer)
+        if cached_answer is None:
+            await run_in_threadpool(store_answer, payload.get("cache_key"), {"answer": answer})
+        await buffer.append(stream_id, "done", {"message_id": message_id, "cached": cached_answer is not None})
+    except Exception as e:
+        print(f"[chat_stream] stream {stream_id} failed: {e}")
+        try:
+            await buffer.append(stream_id, "error", {"error": "AI service unavailable, please try later."})
+        except Exception as append_err:
+            # Buffer (Redis) lỗi: reader chỉ nhận keep-alive tới khi stream hết hạn
+            print(f"[chat_stream] could not publish error for stream {stream_id}: {append_err}")
+
+
+_running = set()
+
+
+async def start_stream(session_id: int, user_id: int, payload: dict, cached_answer: Optional[str] = None) -> str:
+    """Tạo stream và chạy việc gọi AI ở nền (hoặc phát lại câu trả lời đã cache); trả về stream_id."""
+    stream_id = uuid.uuid4().hex
+    buffer = await get_stream_buffer()
+    await buffer.create(stream_id, {"session_id": session_id, "user_id": user_id})
+    await buffer.append(stream_id, "meta", {"session_id": session_id, "stream_id": stream_id})
+    task = asyncio.create_task(_produce(stream_id, session_id, payload, cached_answer))
+    # Giữ tham chiếu để task không bị GC khi client ngắt kết nối
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return stream_id
+
+
+async def get_stream_meta(stream_id: str) -> Optional[dict]:
+    return await (await get_stream_buffer()).get_meta(stream_id)
+
+
+def _format_event(event_id: str, event: str, data: dict) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def sse_events(stream_id: str, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+    """Sinh các sự kiện SSE sau `last_event_id`, gửi comment heartbeat khi không có token mới."""
+    buffer = await get_stream_buffer()
+    after = last_event_id
+    while True:
+        events = await buffer.read(stream_id, after, timeout=settings.CHAT_STREAM_HEARTBEAT_SECONDS)
+        if not events:
+            if await buffer.get_meta(stream_id) is None:
+                return  # stream đã hết hạn
+            yield ": keep-alive\n\n"
+            continue
+        for event_id, event, data in events:
+            yield _format_event(event_id, event, data)
+            after = event_id
+            if event in TERMINAL_EVENTS:
+                return
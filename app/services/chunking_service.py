@@ -0,0 +1,165 @@
+"""
+Chia văn bản pháp luật thành các chunk theo cấu trúc:
+Phần > Chương > Mục > Điều > Khoản > Điểm.
+
+Mặc định mỗi Điều là một chunk. Điều dài hơn CHUNK_MAX_TOKENS được tách
+theo Khoản, rồi theo Điểm; đoạn vẫn quá dài thì cắt theo dòng. Offset là
+vị trí ký tự trong `Document.parsed_content`.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# Thứ tự cấp: số nhỏ hơn là cấp cao hơn
+LEVELS = ["phan", "chuong", "muc", "dieu", "khoan", "diem"]
+_RANK = {name: rank for rank, name in enumerate(LEVELS)}
+
+_ROMAN = r"[IVXLCDM]+"
+_HEADING_PATTERNS = [
+    ("phan", re.compile(rf"^(?:PHẦN|Phần)\s+(THỨ\s+[^\s]+|Thứ\s+[^\s]+|{_ROMAN}|\d+)\b")),
+    ("chuong", re.compile(rf"^(?:CHƯƠNG|Chương)\s+({_ROMAN}|\d+)\b")),
+    ("muc", re.compile(r"^(?:MỤC|Mục)\s+(\d+)\b")),
+    ("dieu", re.compile(r"^Điều\s+(\d+[a-zđ]?)\s*[.:]")),
+    ("khoan", re.compile(r"^(\d+)\.\s+\S")),
+    ("diem", re.compile(r"^([a-zđ])\)\s+\S")),
+]
+_LABELS = {
+    "phan": "Phần",
+    "chuong": "Chương",
+    "muc": "Mục",
+    "dieu": "Điều",
+    "khoan": "Khoản",
+    "diem": "Điểm",
+}
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Ước lượng số token: mỗi âm tiết/từ hoặc dấu câu là một token."""
+    return len(_TOKEN_RE.findall(text))
+
+
+@dataclass
+class _Node:
+    level: Optional[str]
+    label: str
+    start: int
+    end: int = 0
+    children: List["_Node"] = field(default_factory=list)
+
+
+@dataclass
+class Chunk:
+    chunk_index: int
+    level: str
+    path: str
+    heading: str
+    start_offset: int
+    end_offset: int
+    token_count: int
+    content: str
+
+
+def _detect_heading(line: str, parent_level: Optional[str]) -> Optional[tuple]:
+    stripped = line.strip()
+    for level, pattern in _HEADING_PATTERNS:
+        match = pattern.match(stripped)
+        if not match:
+            continue
+        # "1." / "a)" chỉ là Khoản / Điểm khi nằm trong Điều / Khoản
+        if level == "khoan" and parent_level not in ("dieu", "khoan", "diem"):
+            continue
+        if level == "diem" and parent_level not in ("dieu", "khoan", "diem"):
+            continue
+        return level, f"{_LABELS[level]} {match.group(1)}"
+    return None
+
+
+def _build_tree(text: str) -> _Node:
+    root = _Node(level=None, label="", start=0, end=len(text))
+    stack = [root]
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        current_level = stack[-1].level
+        detected = _detect_heading(line, current_level)
+        if detected:
+            level, label = detected
+            start = offset + (len(line) - len(line.lstrip()))
+            while len(stack) > 1 and _RANK[stack[-1].level] >= _RANK[level]:
+                stack.pop().end = start
+            node = _Node(level=level, label=label, start=start)
+            stack[-1].children.append(node)
+            stack.append(node)
+        offset += len(line)
+    while len(stack) > 1:
+        stack.pop().end = len(text)
+    return root
+
+
+class _Emitter:
+    def __init__(self, text: str, max_tokens: int):
+        self.text = text
+        self.max_tokens = max_tokens
+        self.chunks: List[Chunk] = []
+
+    def emit_span(self, start: int, end: int, level: str, path: List[str]) -> None:
+        if count_tokens(self.text[start:end]) > self.max_tokens:
+            self._emit_windows(start, end, level, path)
+        else:
+            self._append(start, end, level, path)
+
+    def _emit_windows(self, start: int, end: int, level: str, path: List[str]) -> None:
+        """Cắt đoạn quá dài theo ranh giới dòng, mỗi cửa sổ <= max_tokens (trừ dòng đơn quá dài)."""
+        window_start = start
+        window_tokens = 0
+        offset = start
+        for line in self.text[start:end].splitlines(keepends=True):
+            line_tokens = count_tokens(line)
+            if window_tokens and window_tokens + line_tokens > self.max_tokens:
+                self._append(window_start, offset, level, path)
+                window_start, window_tokens = offset, 0
+            window_tokens += line_tokens
+            offset += len(line)
+        self._append(window_start, end, level, path)
+
+    def _append(self, start: int, end: int, level: str, path: List[str]) -> None:
+        raw = self.text[start:end]
+        content = raw.strip()
+        if not content:
+            return
+        start += len(raw) - len(raw.lstrip())
+        self.chunks.append(Chunk(
+            chunk_index=len(self.chunks),
+            level=level,
+            path=" > ".join(path),
+            heading=content.splitlines()[0][:255],
+            start_offset=start,
+            end_offset=start + len(content),
+            token_count=count_tokens(content),
+            content=content,
+        ))
+
+    def emit_node(self, node: _Node, path: List[str]) -> None:
+        node_path = path + [node.label] if node.label else path
+        level = node.level or "preamble"
+        fits = count_tokens(self.text[node.start:node.end]) <= self.max_tokens
+        # Chunk tối thiểu là một Điều; cấp cao hơn luôn tách xuống con nếu có
+        if not node.children or (fits and node.level and _RANK[node.level] >= _RANK["dieu"]):
+            self.emit_span(node.start, node.end, level, node_path)
+            return
+        # Phần mở đầu trước node con đầu tiên (tiêu đề Chương, lời dẫn của Điều, ...)
+        self.emit_span(node.start, node.children[0].start, level, node_path)
+        for child in node.children:
+            self.emit_node(child, node_path)
+
+
+def chunk_legal_text(text: str, max_tokens: Optional[int] = None) -> List[Chunk]:
+    if not text:
+        return []
+    emitter = _Emitter(text, max_tokens or settings.CHUNK_MAX_TOKENS)
+    emitter.emit_node(_build_tree(text), [])
+    return emitter.chunks
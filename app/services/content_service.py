@@ -1,27 +1,41 @@
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 import docx2txt
-import fitz
 import pypandoc
-import tempfile
-import os
-import subprocess
 
-# Chỉ định đường dẫn thủ công đến pandoc.exe và soffice.exe
+from app.services.pdf_extraction import extract_pdf_text
+from app.services.libreoffice_pool import (
+    ConversionError,
+    discard_conversion_output,
+    get_libreoffice_pool,
+    new_job_dir,
+)
+
+# Chỉ định đường dẫn thủ công đến pandoc.exe (soffice cấu hình qua LIBREOFFICE_PATH)
 PANDOC_PATH = r"C:\Program Files\Pandoc\pandoc.exe"  # Đảm bảo đúng đường dẫn
-LIBREOFFICE_PATH = r"C:\Program Files\LibreOffice\program\soffice.exe"  # Đường dẫn đến soffice.exe
 
-def parse_file_content(file_path: Union[str, Path]) -> str:
+# parse_* trả về chuỗi lỗi có tiền tố này thay vì raise
+PARSE_ERROR_PREFIXES = ("[ERROR]", "[PDF ERROR]", "[DOCX ERROR]")
+
+def is_parse_error(text: str) -> bool:
+    return bool(text) and text.startswith(PARSE_ERROR_PREFIXES)
+
+def parse_file_content(file_path: Union[str, Path], stats: Optional[dict] = None) -> str:
     path = Path(file_path)
     suffix = path.suffix.lower()
 
     if suffix == ".docx":
         return parse_docx(path)
     elif suffix == ".pdf":
-        return parse_pdf(path)
+        return parse_pdf(path, stats=stats)
     elif suffix == ".doc":
         converted = convert_doc_to_docx(path)
-        return parse_docx(converted) if converted else "[ERROR] Could not convert .doc to .docx"
+        if not converted:
+            return "[ERROR] Could not convert .doc to .docx"
+        try:
+            return parse_docx(converted)
+        finally:
+            discard_conversion_output(converted)
     else:
         return ""
 
@@ -32,33 +46,17 @@ def parse_docx(path: Path) -> str:
     except Exception as e:
         return f"[DOCX ERROR] {str(e)}"
 
-def parse_pdf(path: Path) -> str:
+def parse_pdf(path: Path, stats: Optional[dict] = None) -> str:
     try:
-        doc = fitz.open(str(path))
-        text = ""
-        for page in doc:
-            text += page.get_text("text")
-        return text.strip()
+        return extract_pdf_text(path, stats=stats).strip()
     except Exception as e:
         return f"[PDF ERROR] {str(e)}"
 
 def convert_doc_to_docx_with_libreoffice(doc_path: Path) -> Union[Path, None]:
     try:
-        output_path = Path(tempfile.gettempdir()) / (doc_path.stem + ".docx")
-        result = subprocess.run([
-            LIBREOFFICE_PATH,
-            "--headless",
-            "--convert-to", "docx",
-            "--outdir", str(tempfile.gettempdir()),
-            str(doc_path)
-        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        # Đảm bảo file được flush
-        if output_path.exists():
-            return output_path
-        else:
-            raise Exception("LibreOffice failed to create .docx")
-    except subprocess.CalledProcessError as e:
-        print(f"[LIBREOFFICE ERROR] {str(e.stderr)}")
+        return get_libreoffice_pool().convert(doc_path, "docx")
+    except ConversionError as e:
+        print(f"[LIBREOFFICE ERROR] {str(e)}")
         return None
     except Exception as e:
         print(f"[CONVERT ERROR] {str(e)}")
@@ -68,22 +66,9 @@ def convert_doc_to_pdf(doc_path: Path) -> Union[Path, None]:
     try:
         # Ưu tiên dùng libreoffice để chuyển .doc sang .pdf trực tiếp
         if doc_path.suffix.lower() == ".doc":
-            output_path = Path(tempfile.gettempdir()) / (doc_path.stem + ".pdf")
-            result = subprocess.run([
-                LIBREOFFICE_PATH,
-                "--headless",
-                "--convert-to", "pdf",
-                "--outdir", str(tempfile.gettempdir()),
-                str(doc_path)
-            ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            # Đợi và kiểm tra file tồn tại
-            import time
-            time.sleep(2)  # Tăng thời gian chờ lên 2 giây
-            print(f"LibreOffice conversion to {output_path}, checking existence: {output_path.exists()}")  # Debug log
-            if output_path.exists():
-                return output_path
-            else:
-                raise Exception("LibreOffice failed to convert .doc to .pdf")
+            output_path = get_libreoffice_pool().convert(doc_path, "pdf")
+            print(f"LibreOffice conversion to {output_path}")  # Debug log
+            return output_path
 
         # Nếu là .docx, dùng pandoc
         elif doc_path.suffix.lower() == ".docx":
@@ -94,11 +79,14 @@ def convert_doc_to_pdf(doc_path: Path) -> Union[Path, None]:
             if not pandoc_path or pandoc_path == "pandoc":
                 raise Exception(f"Failed to set pandoc path to {PANDOC_PATH}")
             print(f"Using pandoc at: {pandoc_path}")  # Debug log
-            output_path = Path(tempfile.gettempdir()) / (doc_path.stem + ".pdf")
+            output_path = new_job_dir() / (doc_path.stem + ".pdf")
             print(f"Converting {doc_path} to {output_path}")  # Debug log
             pypandoc.convert_file(str(doc_path), 'pdf', outputfile=str(output_path))
             print(f"Conversion completed, checking existence: {output_path.exists()}")  # Debug log
-            return output_path if output_path.exists() else None
+            if output_path.exists():
+                return output_path
+            discard_conversion_output(output_path)
+            return None
         else:
             raise Exception("Unsupported file format")
     except Exception as e:
@@ -114,11 +102,15 @@ def convert_doc_to_docx(doc_path: Path) -> Union[Path, None]:
         if not pandoc_path or pandoc_path == "pandoc":
             return convert_doc_to_docx_with_libreoffice(doc_path)
         print(f"Using pandoc at: {pandoc_path}")  # Debug log
-        output_path = Path(tempfile.gettempdir()) / (doc_path.stem + ".docx")
+        output_path = new_job_dir() / (doc_path.stem + ".docx")
         print(f"Converting {doc_path} to {output_path}")  # Debug log
-        pypandoc.convert_file(str(doc_path), 'docx', outputfile=str(output_path), extra_args=["--extract-media=."])
+        pypandoc.convert_file(str(doc_path), 'docx', outputfile=str(output_path),
+                              extra_args=[f"--extract-media={output_path.parent}"])
         print(f"Conversion to .docx completed, checking existence: {output_path.exists()}")  # Debug log
-        return output_path if output_path.exists() else convert_doc_to_docx_with_libreoffice(doc_path)
+        if output_path.exists():
+            return output_path
+        discard_conversion_output(output_path)
+        return convert_doc_to_docx_with_libreoffice(doc_path)
     except Exception as e:
         print(f"[CONVERT ERROR] {str(e)}")
-        return convert_doc_to_docx_with_libreoffice(doc_path)
\ No newline at end of file
+        return convert_doc_to_docx_with_libreoffice(doc_path)
@@ -0,0 +1,137 @@
+"""
+Cache trên đĩa có giới hạn dung lượng, evict theo LRU.
+
+Mỗi entry là một file; thời điểm truy cập gần nhất được ghi vào mtime,
+nên nhiều process (API, Celery worker) dùng chung một thư mục cache.
+Ghi qua file tạm + os.replace để reader không bao giờ thấy file dở dang.
+
+Tổng dung lượng được cộng dồn trong bộ nhớ khi ghi/xóa, nên mỗi lần ghi không phải
+quét cả thư mục. Chỉ quét lại (và evict) khi tổng vượt max_bytes hoặc sau
+rescan_seconds, để thấy cả thay đổi của các process khác. Evict xuống còn
+EVICT_TARGET_RATIO * max_bytes để lần quét sau không đến ngay.
+"""
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Union
+
+
+EVICT_TARGET_RATIO = 0.9
+
+
+class DiskLRUCache:
+    def __init__(self, root: Union[str, Path], max_bytes: int, rescan_seconds: float = 300.0):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.rescan_seconds = rescan_seconds
+        self.tmp_dir = self.root / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._total: Optional[int] = None  # None = chưa quét
+        self._scanned_at = 0.0
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self.path_for(key)
+        try:
+            # Đánh dấu vừa dùng cho LRU
+            os.utime(path, None)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put_file(self, key: str, src: Union[str, Path], move: bool = False) -> Path:
+        tmp = self.tmp_dir / uuid.uuid4().hex
+        try:
+            if move:
+                shutil.move(str(src), tmp)
+            else:
+                shutil.copyfile(src, tmp)
+            return self._commit(key, tmp)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    def put_bytes(self, key: str, data: bytes) -> Path:
+        tmp = self.tmp_dir / uuid.uuid4().hex
+        try:
+            tmp.write_bytes(data)
+            return self._commit(key, tmp)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    def delete(self, key: str) -> None:
+        path = self.path_for(key)
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return
+        self._add(-size)
+
+    def _commit(self, key: str, tmp: Path) -> Path:
+        target = self.path_for(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        size = tmp.stat().st_size
+        try:
+            replaced = target.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp, target)
+        self._add(size - replaced)
+        self.evict()
+        return target
+
+    def _add(self, delta: int) -> None:
+        with self._lock:
+            if self._total is not None:
+                self._total = max(0, self._total + delta)
+
+    def _entries(self):
+        for bucket in self.root.iterdir():
+            if not bucket.is_dir() or bucket == self.tmp_dir:
+                continue
+            for entry in bucket.iterdir():
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry, st.st_size, st.st_mtime
+
+    def _stale(self) -> bool:
+        return self._total is None or time.monotonic() - self._scanned_at > self.rescan_seconds
+
+    def size(self) -> int:
+        """Tổng dung lượng (theo số cộng dồn; quét thư mục khi chưa có hoặc đã cũ)."""
+        with self._lock:
+            if self._stale():
+                self._total = sum(size for _, size, _ in self._entries())
+                self._scanned_at = time.monotonic()
+            return self._total
+
+    def evict(self) -> None:
+        """Khi tổng dung lượng vượt max_bytes: quét lại và xóa các entry lâu không dùng nhất."""
+        with self._lock:
+            if not self._stale() and self._total <= self.max_bytes:
+                return
+            entries = list(self._entries())
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                target = int(self.max_bytes * EVICT_TARGET_RATIO)
+                entries.sort(key=lambda e: e[2])
+                for path, size, _ in entries:
+                    if total <= target:
+                        break
+                    try:
+                        path.unlink()
+                    except FileNotFoundError:
+                        pass  # process khác đã xóa
+                    total -= size
+            self._total = total
+            self._scanned_at = time.monotonic()
@@ -0,0 +1,89 @@
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.pagination import encode_cursor, keyset_filter, keyset_order
+from app.models.document import Document, DocumentChunk, DocumentStatus
+from app.services.search_index import IndexableDoc
+from app.services.vector_index import IndexableChunk
+
+
+def iter_indexable_documents(db: Session, document_ids: Optional[List[int]] = None,
+                             batch_size: int = 200) -> Iterator[IndexableDoc]:
+    """Duyệt các văn bản đã duyệt có parsed_content, chỉ lấy các cột cần để index."""
+    query = db.query(
+        Document.id,
+        Document.parsed_content,
+        Document.issuer_agency,
+        Document.document_type,
+    ).filter(
+        Document.status == DocumentStatus.approved,
+        Document.parsed_content.isnot(None),
+    )
+    if document_ids is not None:
+        query = query.filter(Document.id.in_(document_ids))
+    for row in query.order_by(Document.id).yield_per(batch_size):
+        yield row.id, row.parsed_content, row.issuer_agency, row.document_type
+
+
+def iter_indexable_chunks(db: Session, document_ids: Optional[List[int]] = None,
+                          batch_size: int = 500) -> Iterator[IndexableChunk]:
+    """Duyệt chunk của các văn bản đã duyệt (chunk_id, document_id, content)."""
+    query = db.query(DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.content)\
+        .join(Document, Document.id == DocumentChunk.document_id)\
+        .filter(Document.status == DocumentStatus.approved)
+    if document_ids is not None:
+        query = query.filter(DocumentChunk.document_id.in_(document_ids))
+    for row in query.order_by(DocumentChunk.id).yield_per(batch_size):
+        yield row.id, row.document_id, row.content
+
+
+# Cột dùng được để sắp xếp hàng đợi duyệt (mỗi cột có index (status, cột, id))
+QUEUE_SORT_COLUMNS = {
+    "id": Document.id,
+    "created_at": Document.created_at,
+    "issuer_agency": Document.issuer_agency,
+    "document_type": Document.document_type,
+}
+
+# Chỉ các cột metadata của DocumentOut, không nạp parsed_content
+_QUEUE_COLUMNS = (
+    Document.id,
+    Document.uploader_id,
+    Document.reviewer_id,
+    Document.status,
+    Document.type,
+    Document.filename,
+    Document.issuer_agency,
+    Document.document_type,
+    Document.created_at,
+)
+
+
+def list_pending_documents(db: Session, issuer_agency: Optional[str] = None, document_type: Optional[str] = None,
+                           uploaded_from: Optional[datetime] = None, uploaded_to: Optional[datetime] = None,
+                           sort: str = "id", descending: bool = False, cursor: Optional[str] = None,
+                           limit: int = 50) -> Tuple[list, Optional[str]]:
+    """Một trang của hàng đợi duyệt; trả về (các hàng, cursor trang sau hoặc None)."""
+    sort_col = QUEUE_SORT_COLUMNS[sort]
+    query = db.query(*_QUEUE_COLUMNS).filter(Document.status == DocumentStatus.pending)
+    if issuer_agency is not None:
+        query = query.filter(Document.issuer_agency == issuer_agency)
+    if document_type is not None:
+        query = query.filter(Document.document_type == document_type)
+    if uploaded_from is not None:
+        query = query.filter(Document.created_at >= uploaded_from)
+    if uploaded_to is not None:
+        query = query.filter(Document.created_at < uploaded_to)
+    after = keyset_filter(sort_col, Document.id, cursor, descending)
+    if after is not None:
+        query = query.filter(after)
+
+    # Lấy dư một hàng để biết còn trang sau hay không
+    rows = query.order_by(*keyset_order(sort_col, Document.id, descending)).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(sort_col, getattr(last, sort), last.id, descending)
@@ -0,0 +1,82 @@
+"""
+Hàm embedding cho vector index.
+
+Mặc định dùng HashingEmbedder: feature hashing trên âm tiết + bigram,
+hoàn toàn tất định, không cần mạng hay GPU. Có thể thay bằng embedder khác
+qua EMBEDDING_BACKEND="module.path:ClassName" (class nhận `dim` và có
+`embed(texts) -> np.ndarray`).
+"""
+import hashlib
+import importlib
+import math
+from collections import Counter
+from functools import lru_cache
+from typing import List, Sequence
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.services.vi_text import index_terms
+
+settings = get_settings()
+
+
+class Embedder:
+    """Interface: trả về ma trận float32 (len(texts) x dim), mỗi hàng đã chuẩn hóa L2."""
+
+    name = "base"
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    name = "hashing-v1"
+
+    def __init__(self, dim: int):
+        super().__init__(dim)
+        self._bucket_cache = {}
+
+    def _bucket(self, term: str):
+        cached = self._bucket_cache.get(term)
+        if cached is None:
+            digest = int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+            # Bit cao quyết định dấu để giảm va chạm cộng dồn
+            cached = (digest % self.dim, 1.0 if digest >> 63 else -1.0)
+            if len(self._bucket_cache) < 1_000_000:
+                self._bucket_cache[term] = cached
+        return cached
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term, tf in Counter(index_terms(text or "", fold=True)).items():
+                idx, sign = self._bucket(term)
+                out[row, idx] += sign * (1.0 + math.log(tf))
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+def _load_backend(spec: str, dim: int) -> Embedder:
+    module_name, _, class_name = spec.partition(":")
+    cls = getattr(importlib.import_module(module_name), class_name)
+    return cls(dim)
+
+
+@lru_cache()
+def get_embedder() -> Embedder:
+    backend = settings.EMBEDDING_BACKEND
+    if backend == "hashing":
+        return HashingEmbedder(settings.EMBEDDING_DIM)
+    return _load_backend(backend, settings.EMBEDDING_DIM)
+
+
+def embed_in_batches(texts: List[str], batch_size: int = 256) -> np.ndarray:
+    embedder = get_embedder()
+    if not texts:
+        return np.zeros((0, embedder.dim), dtype=np.float32)
+    return np.vstack([embedder.embed(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
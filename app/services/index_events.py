@@ -0,0 +1,63 @@
+"""
+Sự kiện cập nhật index (outbox).
+
+approve/reject ghi một IndexEvent trong cùng transaction với việc đổi trạng thái,
+nên sự kiện không bị mất kể cả khi broker lỗi. Task process_index_events_task gom
+các sự kiện đang chờ thành một lô: mỗi văn bản trong lô được đồng bộ lại theo
+trạng thái hiện tại trong DB (bản cũ bị tombstone, nếu đang approved thì thêm
+bản mới), toàn bộ lô ghi thành một segment cho mỗi index.
+"""
+from typing import Iterable, List, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.document import IndexAction, IndexEvent
+from app.services import search_index, vector_index
+from app.services.index_files import manifest_version
+
+
+def record_index_event(db: Session, document_id: int, action: IndexAction) -> None:
+    """Thêm sự kiện vào session; caller commit cùng thay đổi trạng thái."""
+    db.add(IndexEvent(document_id=document_id, action=action))
+
+
+def claim_index_events(db: Session, limit: int) -> List[IndexEvent]:
+    """
+    Lấy một lô sự kiện cũ nhất. Trên PostgreSQL các hàng bị khóa tới khi commit
+    và worker khác bỏ qua chúng (SKIP LOCKED).
+    """
+    return db.query(IndexEvent)\
+        .order_by(IndexEvent.id.asc())\
+        .limit(limit)\
+        .with_for_update(skip_locked=True)\
+        .all()
+
+
+def split_events(events: Iterable[IndexEvent]) -> Tuple[Set[int], Set[int]]:
+    """Trả về (doc cần thêm, doc cần gỡ); sự kiện sau cùng của mỗi doc quyết định."""
+    last = {}
+    for event in events:
+        last[event.document_id] = event.action
+    adds = {doc_id for doc_id, action in last.items() if action == IndexAction.add}
+    return adds, set(last) - adds
+
+
+def pending_index_events(db: Session) -> int:
+    return db.query(IndexEvent.id).count()
+
+
+def index_versions() -> dict:
+    """Version của hai index, đọc từ manifest (không nạp segment vào process)."""
+    return {
+        "bm25": manifest_version(search_index.index_root()),
+        "vector": manifest_version(vector_index.index_root()),
+    }
+
+
+def corpus_version() -> str:
+    """
+    Version của toàn bộ corpus đã index, đổi mỗi khi một trong hai index đổi.
+    Dùng làm một phần key cho cache phụ thuộc vào kết quả truy hồi.
+    """
+    versions = index_versions()
+    return f"{versions['bm25']}.{versions['vector']}"
@@ -0,0 +1,118 @@
+"""
+Tiện ích dùng chung cho các index lưu trên đĩa dạng segment (BM25, vector).
+
+Mỗi index là một thư mục gồm các segment bất biến `seg-*` và `manifest.json`
+liệt kê segment đang dùng. Manifest được ghi bằng os.replace nên reader luôn
+thấy một trạng thái nhất quán; writer giữ file lock để API và worker không
+ghi chồng lên nhau.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MANIFEST = "manifest.json"
+
+
+def read_manifest(root: Path, default: Optional[dict] = None) -> dict:
+    path = root / MANIFEST
+    if not path.exists():
+        return dict(default or {"version": 0, "segments": []})
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(root: Path, manifest: dict) -> None:
+    tmp = root / f".{MANIFEST}.{uuid.uuid4().hex}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, root / MANIFEST)
+
+
+def manifest_stamp(root: Path):
+    """Dấu hiệu thay đổi của manifest (None nếu chưa có index)."""
+    try:
+        st = (root / MANIFEST).stat()
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def manifest_version(root: Path) -> int:
+    """
+    Version ghi trong manifest, chỉ đọc lại file khi manifest_stamp đổi. Dùng khi
+    chỉ cần version (vd key cache) mà không muốn nạp cả index vào process.
+    """
+    stamp = manifest_stamp(root)
+    if stamp is None:
+        return 0
+    key = str(root)
+    with _versions_lock:
+        cached = _versions.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+    try:
+        version = read_manifest(root).get("version", 0)
+    except (OSError, ValueError):
+        # Manifest vừa bị thay giữa stat và open: lần gọi sau đọc lại
+        return cached[1] if cached is not None else 0
+    with _versions_lock:
+        _versions[key] = (stamp, version)
+    return version
+
+
+_thread_write_locks = {}
+_thread_write_locks_guard = threading.Lock()
+
+
+@contextmanager
+def index_write_lock(root: Path) -> Iterator[None]:
+    """Chỉ một writer (API hoặc worker) sửa index tại một thời điểm."""
+    root.mkdir(parents=True, exist_ok=True)
+    with _thread_write_locks_guard:
+        thread_lock = _thread_write_locks.setdefault(str(root.resolve()), threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(root / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def new_segment_dir(root: Path) -> tuple:
+    """Tạo thư mục tạm cho segment mới; trả về (tên, thư mục tạm)."""
+    name = f"seg-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+    tmp_dir = root / f".{name}"
+    tmp_dir.mkdir(parents=True)
+    return name, tmp_dir
+
+
+def publish_segment(root: Path, name: str, tmp_dir: Path) -> None:
+    os.replace(tmp_dir, root / name)
+
+
+def remove_unused_segments(root: Path, manifest: dict) -> None:
+    in_use = {seg["name"] for seg in manifest["segments"]}
+    for entry in root.iterdir():
+        if entry.is_dir() and entry.name.startswith("seg-") and entry.name not in in_use:
+            shutil.rmtree(entry, ignore_errors=True)
@@ -0,0 +1,327 @@
+"""
+Pool các instance LibreOffice headless chạy lâu dài để convert .doc.
+
+- Mỗi instance có user profile và pipe UNO riêng, đặt tên theo pid + số thứ tự:
+  API và các process con của worker Celery (prefork) đều có pool riêng mà không
+  tranh nhau profile hay kết nối nhầm soffice của process khác.
+- Job đi qua một queue; mỗi job ghi ra thư mục output riêng.
+- Có python-uno: instance giữ kết nối UNO, job chỉ load/store document.
+  Không có uno: mỗi job chạy soffice one-shot trên profile của instance (không có
+  instance chạy lâu dài). python-uno đi kèm LibreOffice (gói hệ thống, vd. python3-uno
+  trên Debian/Ubuntu), không cài được qua pip; virtualenv cần --system-site-packages.
+- Job quá LIBREOFFICE_JOB_TIMEOUT: instance bị kill và khởi động lại.
+  Instance cũng được recycle sau LIBREOFFICE_MAX_JOBS_PER_INSTANCE job.
+"""
+import atexit
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from pathlib import Path
+from typing import Optional, Union
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    HAS_UNO = True
+except ImportError:
+    HAS_UNO = False
+
+# Filter LibreOffice cho từng định dạng đích
+EXPORT_FILTERS = {
+    "pdf": "writer_pdf_Export",
+    "docx": "MS Word 2007 XML",
+}
+
+_JOB_DIR_PREFIX = "lo-job-"
+
+
+class ConversionError(RuntimeError):
+    """LibreOffice không convert được file."""
+
+
+def _prop(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def _kill_process_tree(proc: subprocess.Popen) -> None:
+    if proc.poll() is not None:
+        return
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        pass
+
+
+def new_job_dir() -> Path:
+    work_root = settings.LIBREOFFICE_WORK_DIR or None
+    if work_root:
+        os.makedirs(work_root, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix=_JOB_DIR_PREFIX, dir=work_root))
+
+
+def discard_conversion_output(path: Optional[Union[str, Path]]) -> None:
+    """Xóa file output cùng thư mục job của nó."""
+    if not path:
+        return
+    path = Path(path)
+    if path.parent.name.startswith(_JOB_DIR_PREFIX):
+        shutil.rmtree(path.parent, ignore_errors=True)
+    elif path.exists():
+        path.unlink()
+
+
+class _Job:
+    def __init__(self, src: Path, target_ext: str):
+        self.src = src
+        self.target_ext = target_ext
+        self.future: Future = Future()
+
+
+class _Instance:
+    """Một process soffice với profile và pipe UNO riêng."""
+
+    def __init__(self, index: int, profile_root: Path):
+        self.index = index
+        self.pipe_name = f"rag-lo-{os.getpid()}-{index}"
+        self.profile_dir = profile_root / f"{os.getpid()}-instance-{index}"
+        self.proc: Optional[subprocess.Popen] = None
+        self.desktop = None
+        self.jobs_done = 0
+        self.busy_since: Optional[float] = None
+
+    @property
+    def profile_url(self) -> str:
+        return self.profile_dir.resolve().as_uri()
+
+    def _popen_kwargs(self) -> dict:
+        kwargs = {"stdout": subprocess.DEVNULL, "stderr": subprocess.PIPE}
+        if hasattr(os, "setsid"):
+            kwargs["start_new_session"] = True
+        return kwargs
+
+    def start(self) -> None:
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        self.jobs_done = 0
+        if not HAS_UNO:
+            return
+
+        self.proc = subprocess.Popen([
+            settings.LIBREOFFICE_PATH,
+            "--headless", "--invisible", "--nologo", "--norestore", "--nodefault", "--nolockcheck",
+            f"-env:UserInstallation={self.profile_url}",
+            f"--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext",
+        ], **self._popen_kwargs())
+
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx
+        )
+        deadline = time.monotonic() + settings.LIBREOFFICE_STARTUP_TIMEOUT
+        while True:
+            try:
+                ctx = resolver.resolve(
+                    f"uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"
+                )
+                self.desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+                print(f"[LibreOfficePool] instance {self.index} ready on pipe {self.pipe_name}")
+                return
+            except Exception:
+                if self.proc.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise ConversionError(f"LibreOffice instance {self.index} failed to start")
+                time.sleep(0.2)
+
+    def stop(self) -> None:
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass
+            self.desktop = None
+        if self.proc is not None:
+            _kill_process_tree(self.proc)
+            self.proc = None
+
+    def restart(self) -> None:
+        self.stop()
+        self.start()
+
+    def is_alive(self) -> bool:
+        if not HAS_UNO:
+            return True
+        return self.proc is not None and self.proc.poll() is None and self.desktop is not None
+
+    def convert(self, src: Path, target_ext: str, out_dir: Path) -> Path:
+        output_path = out_dir / f"{src.stem}.{target_ext}"
+        if HAS_UNO:
+            self._convert_uno(src, output_path, EXPORT_FILTERS[target_ext])
+        else:
+            self._convert_oneshot(src, target_ext, out_dir)
+        if not output_path.exists() or output_path.stat().st_size == 0:
+            raise ConversionError(f"LibreOffice produced no output for {src.name}")
+        return output_path
+
+    def _convert_uno(self, src: Path, output_path: Path, filter_name: str) -> None:
+        # storeToURL chạy đồng bộ: khi hàm trả về là file đã ghi xong
+        doc = self.desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(str(src.resolve())), "_blank", 0, (_prop("Hidden", True),)
+        )
+        if doc is None:
+            raise ConversionError(f"LibreOffice could not open {src.name}")
+        try:
+            doc.storeToURL(uno.systemPathToFileUrl(str(output_path.resolve())), (_prop("FilterName", filter_name),))
+        finally:
+            doc.close(True)
+
+    def _convert_oneshot(self, src: Path, target_ext: str, out_dir: Path) -> None:
+        proc = subprocess.Popen([
+            settings.LIBREOFFICE_PATH,
+            "--headless", "--norestore", "--nolockcheck",
+            f"-env:UserInstallation={self.profile_url}",
+            "--convert-to", target_ext,
+            "--outdir", str(out_dir),
+            str(src),
+        ], **self._popen_kwargs())
+        self.proc = proc
+        try:
+            # Hoàn tất = process thoát (không sleep đoán thời gian)
+            _, stderr = proc.communicate(timeout=settings.LIBREOFFICE_JOB_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            _kill_process_tree(proc)
+            raise ConversionError(f"LibreOffice timed out converting {src.name}")
+        finally:
+            self.proc = None
+        if proc.returncode != 0:
+            raise ConversionError(f"LibreOffice exited with {proc.returncode}: {stderr.decode(errors='ignore')}")
+
+
+class LibreOfficePool:
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self.jobs: "queue.Queue[Optional[_Job]]" = queue.Queue()
+        self.profile_root = Path(settings.LIBREOFFICE_PROFILE_DIR or tempfile.mkdtemp(prefix="lo-profiles-"))
+        self.instances = [_Instance(i, self.profile_root) for i in range(self.size)]
+        self.pid = os.getpid()
+        self._closed = False
+        if not HAS_UNO:
+            print("[LibreOfficePool] python-uno not available, every job runs a one-shot soffice")
+        self._threads = [
+            threading.Thread(target=self._worker, args=(inst,), name=f"lo-worker-{inst.index}", daemon=True)
+            for inst in self.instances
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._watchdog = threading.Thread(target=self._watch, name="lo-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def submit(self, src: Union[str, Path], target_ext: str) -> Future:
+        if target_ext not in EXPORT_FILTERS:
+            raise ValueError(f"Unsupported target format: {target_ext}")
+        job = _Job(Path(src), target_ext)
+        self.jobs.put(job)
+        return job.future
+
+    def convert(self, src: Union[str, Path], target_ext: str, timeout: Optional[float] = None) -> Path:
+        """Convert đồng bộ; trả về file output trong thư mục job riêng."""
+        # Thời gian chờ trong queue + thời gian chạy job
+        timeout = timeout or settings.LIBREOFFICE_JOB_TIMEOUT * 2
+        future = self.submit(src, target_ext)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise ConversionError(f"Conversion of {Path(src).name} timed out")
+
+    def _worker(self, inst: _Instance) -> None:
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                inst.stop()
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue
+
+            out_dir = None
+            try:
+                if not inst.is_alive() or inst.jobs_done >= settings.LIBREOFFICE_MAX_JOBS_PER_INSTANCE:
+                    inst.restart()
+                out_dir = new_job_dir()
+                inst.busy_since = time.monotonic()
+                output = inst.convert(job.src, job.target_ext, out_dir)
+                inst.jobs_done += 1
+                job.future.set_result(output)
+            except Exception as e:
+                print(f"[LibreOfficePool] instance {inst.index} failed on {job.src.name}: {e}")
+                if out_dir is not None:
+                    shutil.rmtree(out_dir, ignore_errors=True)
+                # Instance có thể đã bị treo/kill -> lần sau khởi động lại
+                inst.stop()
+                job.future.set_exception(e if isinstance(e, ConversionError) else ConversionError(str(e)))
+            finally:
+                inst.busy_since = None
+
+    def _watch(self) -> None:
+        """Kill instance có job chạy quá timeout; lệnh UNO đang treo sẽ lỗi và worker tự recycle."""
+        while not self._closed:
+            time.sleep(1)
+            now = time.monotonic()
+            for inst in self.instances:
+                started = inst.busy_since
+                if started and now - started > settings.LIBREOFFICE_JOB_TIMEOUT and inst.proc is not None:
+                    print(f"[LibreOfficePool] instance {inst.index} wedged, killing")
+                    _kill_process_tree(inst.proc)
+
+    def shutdown(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self.jobs.put(None)
+        for thread in self._threads:
+            thread.join(timeout=10)
+        for inst in self.instances:
+            inst.stop()
+            # Profile gắn với pid nên không dùng lại được sau khi process thoát
+            shutil.rmtree(inst.profile_dir, ignore_errors=True)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "queued": self.jobs.qsize(),
+            "busy": sum(1 for inst in self.instances if inst.busy_since),
+            "uno": HAS_UNO,
+        }
+
+
+_pool: Optional[LibreOfficePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_libreoffice_pool() -> LibreOfficePool:
+    """Pool dùng chung trong process (tạo lại sau fork, vd. Celery prefork)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = LibreOfficePool(settings.LIBREOFFICE_POOL_SIZE)
+            atexit.register(_pool.shutdown)
+        return _pool
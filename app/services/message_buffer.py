@@ -0,0 +1,194 @@
+"""
+Ghi tin nhắn bot theo lô trong worker Celery (write-behind + group commit).
+
+Task gọi save() rồi chờ: một thread nền gom các tin nhắn của mọi task đang chạy
+trong process và ghi cả lô trong một transaction (bulk INSERT + một UPDATE
+chat_sessions cho mỗi session) khi đủ MESSAGE_BUFFER_MAX_ROWS hoặc sau
+MESSAGE_BUFFER_FLUSH_MS kể từ tin đầu tiên. save() chỉ trả về khi lô đã commit, nên
+với task_acks_late task chỉ được ack sau khi tin nhắn đã nằm trong DB (at-least-once).
+
+Mỗi tin có idempotency key (vd. id của task Celery): task bị giao lại sau khi worker
+chết sẽ không tạo tin nhắn trùng mà nhận lại id của tin đã ghi.
+
+Gom lô chỉ có tác dụng khi nhiều task chạy đồng thời trong một process (pool
+threads/gevent); với prefork mỗi process con tự ghi tin của mình.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.database import SessionLocal
+from app.models.chat import ChatMessage, ChatSession, SenderType
+from app.services.chat_history import record_message
+from app.services.chat_service import message_preview
+
+settings = get_settings()
+
+
+@dataclass
+class _Pending:
+    session_id: int
+    content: str
+    key: str
+    timestamp: datetime
+    future: Future = field(default_factory=Future)
+
+
+class MessageWriteBuffer:
+    def __init__(self, max_rows: int, flush_interval: float):
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self._pending: List[_Pending] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="message-write-buffer", daemon=True)
+        self._thread.start()
+
+    def save(self, session_id: int, content: str, key: Optional[str] = None) -> int:
+        """Đưa tin nhắn bot vào lô kế tiếp; chờ tới khi lô commit và trả về id ChatMessage."""
+        item = _Pending(session_id, content, key or uuid.uuid4().hex, datetime.utcnow())
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("message buffer is closed")
+            self._pending.append(item)
+            if len(self._pending) == 1 or len(self._pending) >= self.max_rows:
+                self._cond.notify()
+        return item.future.result(timeout=settings.MESSAGE_BUFFER_WAIT_SECONDS)
+
+    def close(self) -> None:
+        """Ghi nốt các tin còn trong buffer rồi dừng thread (gọi khi worker tắt)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=settings.MESSAGE_BUFFER_WAIT_SECONDS)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return  # đã đóng và không còn gì để ghi
+                # Chờ lô đầy, tối đa flush_interval kể từ khi tin đầu tiên vào buffer
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.max_rows and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_rows]
+                del self._pending[:self.max_rows]
+            self._flush(batch)
+
+    def _flush(self, batch: List[_Pending]) -> None:
+        try:
+            try:
+                ids = _write_batch(batch)
+            except IntegrityError:
+                # Hiếm: một key vừa được process khác ghi (task bị giao lại) -> ghi từng tin
+                ids = {}
+                for item in batch:
+                    ids.update(_write_batch([item]))
+        except Exception as e:
+            for item in batch:
+                item.future.set_exception(e)
+            return
+        metrics.incr("message_buffer.flushes")
+        metrics.incr("message_buffer.rows", len(batch))
+        for item in batch:
+            item.future.set_result(ids[item.key])
+
+
+def _write_batch(batch: List[_Pending]) -> Dict[str, int]:
+    """Một transaction: bỏ key đã có, bulk INSERT phần còn lại, cập nhật chat_sessions; trả về key -> id."""
+    keys = [item.key for item in batch]
+    db = SessionLocal()
+    try:
+        ids = dict(db.execute(
+            select(ChatMessage.idempotency_key, ChatMessage.id).where(ChatMessage.idempotency_key.in_(keys))
+        ).all())
+        new: Dict[str, _Pending] = {}
+        for item in batch:
+            if item.key not in ids:
+                new.setdefault(item.key, item)
+        if not new:
+            return ids
+
+        db.execute(insert(ChatMessage), [
+            {
+                "session_id": item.session_id,
+                "sender": SenderType.bot,
+                "content": item.content,
+                "timestamp": item.timestamp,
+                "idempotency_key": key,
+            }
+            for key, item in new.items()
+        ])
+        inserted = dict(db.execute(
+            select(ChatMessage.idempotency_key, ChatMessage.id).where(ChatMessage.idempotency_key.in_(list(new)))
+        ).all())
+
+        # Một UPDATE (executemany) cho mọi session trong lô, như touch_session nhưng cộng dồn
+        touched: Dict[int, dict] = {}
+        for item in new.values():
+            row = touched.setdefault(item.session_id, {"b_id": item.session_id, "b_count": 0})
+            row["b_count"] += 1
+            row["b_preview"] = message_preview(item.content)
+            row["b_at"] = item.timestamp
+        sessions = ChatSession.__table__
+        db.connection().execute(
+            update(sessions)
+            .where(sessions.c.id == bindparam("b_id"))
+            .values(
+                message_count=sessions.c.message_count + bindparam("b_count"),
+                last_message_preview=bindparam("b_preview"),
+                updated_at=bindparam("b_at"),
+            ),
+            list(touched.values()),
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    for key, item in new.items():
+        record_message(item.session_id, inserted[key], "bot", item.content)
+    ids.update(inserted)
+    return ids
+
+
+_buffer: Optional[MessageWriteBuffer] = None
+_buffer_pid = None
+_buffer_lock = threading.Lock()
+
+
+def get_message_buffer() -> MessageWriteBuffer:
+    """Buffer của process hiện tại (tạo lại sau fork: thread không đi theo process con)."""
+    global _buffer, _buffer_pid
+    with _buffer_lock:
+        if _buffer is None or _buffer_pid != os.getpid():
+            _buffer = MessageWriteBuffer(
+                settings.MESSAGE_BUFFER_MAX_ROWS,
+                settings.MESSAGE_BUFFER_FLUSH_MS / 1000,
+            )
+            _buffer_pid = os.getpid()
+        return _buffer
+
+
+def close_message_buffer() -> None:
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = (_buffer, None) if _buffer_pid == os.getpid() else (None, _buffer)
+    if buffer is not None:
+        buffer.close()
@@ -0,0 +1,57 @@
+"""
+Cache kết quả parse theo hash nội dung file.
+
+Key = SHA-256 của file + đuôi file (quyết định parser) + PARSER_VERSION, nên
+upload trùng nội dung dưới tên khác hoặc task retry không phải parse lại.
+Text (đã chuẩn hóa NFC) được nén zlib và lưu trong DiskLRUCache.
+Bản PDF convert từ .doc được cache riêng trong preview_service.
+"""
+import threading
+import zlib
+from typing import Optional
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.services.disk_cache import DiskLRUCache
+
+settings = get_settings()
+
+# Tăng khi đổi logic parse / chuẩn hóa text để bỏ qua cache cũ
+PARSER_VERSION = "1"
+
+_cache: Optional[DiskLRUCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_parse_cache() -> DiskLRUCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskLRUCache(settings.PARSE_CACHE_DIR, settings.PARSE_CACHE_MAX_MB * 1024 * 1024)
+        return _cache
+
+
+def _cache_key(file_hash: str, suffix: str) -> str:
+    return f"{file_hash}-{suffix.lower().lstrip('.') or 'none'}-text-v{PARSER_VERSION}"
+
+
+def get_parsed_text(file_hash: str, suffix: str) -> Optional[str]:
+    path = get_parse_cache().get(_cache_key(file_hash, suffix))
+    if path is not None:
+        try:
+            text = zlib.decompress(path.read_bytes()).decode("utf-8")
+            metrics.incr("parse_cache.hit")
+            return text
+        except (OSError, zlib.error, UnicodeDecodeError) as e:
+            # Entry bị evict giữa chừng hoặc hỏng -> coi như miss
+            print(f"[parse_cache] dropping unreadable entry for {file_hash}: {e}")
+            get_parse_cache().delete(_cache_key(file_hash, suffix))
+    metrics.incr("parse_cache.miss")
+    return None
+
+
+def put_parsed_text(file_hash: str, suffix: str, text: str) -> None:
+    try:
+        get_parse_cache().put_bytes(_cache_key(file_hash, suffix), zlib.compress(text.encode("utf-8"), 1))
+    except OSError as e:
+        print(f"[parse_cache] could not store {file_hash}: {e}")
@@ -0,0 +1,107 @@
+"""
+Engine trích xuất text PDF theo trang, chạy song song trên process pool.
+
+- Chia file thành các dải trang, mỗi process mở file và trích một dải.
+- `iter_pdf_pages` yield text từng trang theo đúng thứ tự.
+- Số dải đang chạy/đợi được giới hạn theo PDF_EXTRACT_MEMORY_CAP_MB,
+  nên file 800 trang không làm phình RAM của worker.
+- Pool là của billiard (thư viện process của Celery): process con của worker prefork
+  là daemon, multiprocessing chuẩn không cho chúng tạo process con, billiard thì cho.
+"""
+import os
+from pathlib import Path
+from typing import Iterator, List, Optional, Union
+
+import fitz
+from billiard import Pool
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# Ước lượng ban đầu cho một trang văn bản pháp luật (~4KB text)
+_DEFAULT_PAGE_BYTES = 4 * 1024
+
+
+def _extract_range(path: str, start: int, stop: int) -> List[str]:
+    """Chạy trong process con: trích text các trang [start, stop)."""
+    with fitz.open(path) as doc:
+        return [doc[i].get_text("text") for i in range(start, stop)]
+
+
+def count_pages(path: Union[str, Path]) -> int:
+    with fitz.open(str(path)) as doc:
+        return doc.page_count
+
+
+def _iter_serial(path: str) -> Iterator[str]:
+    with fitz.open(path) as doc:
+        for page in doc:
+            yield page.get_text("text")
+
+
+def iter_pdf_pages(
+    path: Union[str, Path],
+    workers: Optional[int] = None,
+    pages_per_task: Optional[int] = None,
+    memory_cap_bytes: Optional[int] = None,
+) -> Iterator[str]:
+    """Yield text của từng trang theo thứ tự trang."""
+    path = str(path)
+    workers = workers or settings.PDF_EXTRACT_WORKERS or os.cpu_count() or 1
+    pages_per_task = max(1, pages_per_task or settings.PDF_EXTRACT_PAGES_PER_TASK)
+    memory_cap_bytes = memory_cap_bytes or settings.PDF_EXTRACT_MEMORY_CAP_MB * 1024 * 1024
+
+    total = count_pages(path)
+    if workers <= 1 or total < settings.PDF_EXTRACT_MIN_PARALLEL_PAGES:
+        yield from _iter_serial(path)
+        return
+
+    ranges = [(start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task)]
+    page_bytes = _DEFAULT_PAGE_BYTES
+    seen_pages = seen_bytes = 0
+
+    try:
+        pool = Pool(processes=min(workers, len(ranges)))
+    except OSError as e:
+        # Không tạo được process con -> chạy tuần tự
+        print(f"[pdf_extraction] could not start worker pool, extracting serially: {e}")
+        yield from _iter_serial(path)
+        return
+
+    pending = {}
+    finished = False
+    next_submit = next_yield = 0
+    try:
+        while next_yield < len(ranges):
+            # Giới hạn số dải in-flight: các dải xong trước phải nằm chờ trong RAM
+            # tới lượt yield, nên tổng bytes ước lượng không vượt memory cap
+            max_inflight = max(1, memory_cap_bytes // (page_bytes * pages_per_task))
+            while next_submit < len(ranges) and len(pending) < max_inflight:
+                start, stop = ranges[next_submit]
+                pending[next_submit] = pool.apply_async(_extract_range, (path, start, stop))
+                next_submit += 1
+
+            pages = pending.pop(next_yield).get()
+            next_yield += 1
+
+            seen_pages += len(pages)
+            seen_bytes += sum(len(p) for p in pages) * 2
+            page_bytes = max(1, seen_bytes // max(1, seen_pages))
+
+            yield from pages
+        finished = True
+    finally:
+        if finished:
+            pool.close()
+        else:
+            pool.terminate()  # lỗi hoặc caller bỏ dở generator: bỏ các dải còn lại
+        pool.join()
+
+
+def extract_pdf_text(path: Union[str, Path], stats: Optional[dict] = None) -> str:
+    """Ghép text các trang bằng một lần join (tránh nối chuỗi bậc hai)."""
+    pages = list(iter_pdf_pages(path))
+    if stats is not None:
+        stats["pages"] = len(pages)
+    return "".join(pages)
@@ -0,0 +1,131 @@
+"""
+Preview tài liệu cho reviewer, sinh một lần và cache trên đĩa.
+
+- .doc: convert sang PDF qua LibreOffice pool, lưu trong cache LRU theo hash file.
+- Định dạng khác: preview chính là file gốc; blob store local thì stream
+  thẳng blob, backend khác (S3) thì cache một bản local.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.models.document import Document
+from app.services.blob_store import get_blob_store
+from app.services.content_service import convert_doc_to_pdf
+from app.services.disk_cache import DiskLRUCache
+from app.services.libreoffice_pool import discard_conversion_output
+
+settings = get_settings()
+
+# Tăng khi đổi cách sinh preview để bỏ qua cache cũ
+PREVIEW_VERSION = "1"
+
+
+class PreviewNotAvailable(RuntimeError):
+    """Không sinh được preview cho tài liệu."""
+
+
+class Preview(NamedTuple):
+    path: Path
+    media_type: str
+    etag: str
+
+
+_cache: Optional[DiskLRUCache] = None
+_cache_lock = threading.Lock()
+# LRU (giới hạn PREVIEW_ETAG_MEMO_MAX_ENTRIES) để bộ nhớ không tăng theo số file preview
+_etag_memo: "OrderedDict[tuple, str]" = OrderedDict()
+_etag_lock = threading.Lock()
+
+
+def get_preview_cache() -> DiskLRUCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskLRUCache(settings.PREVIEW_CACHE_DIR, settings.PREVIEW_CACHE_MAX_MB * 1024 * 1024)
+        return _cache
+
+
+def _needs_conversion(doc: Document) -> bool:
+    return (doc.type or "").lower() == ".doc"
+
+
+def _cache_key(doc: Document) -> str:
+    variant = "pdf" if _needs_conversion(doc) else "orig"
+    return f"{doc.file_hash}-{variant}-v{PREVIEW_VERSION}"
+
+
+def _content_etag(path: Path) -> str:
+    """ETag mạnh = SHA-256 nội dung; nhớ theo (inode, size) vì file cache chỉ bị thay bằng os.replace."""
+    st = path.stat()
+    memo_key = (str(path), st.st_ino, st.st_size)
+    with _etag_lock:
+        etag = _etag_memo.get(memo_key)
+        if etag is not None:
+            _etag_memo.move_to_end(memo_key)
+            return etag
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    etag = f'"{digest.hexdigest()}"'
+    with _etag_lock:
+        _etag_memo[memo_key] = etag
+        _etag_memo.move_to_end(memo_key)
+        while len(_etag_memo) > settings.PREVIEW_ETAG_MEMO_MAX_ENTRIES:
+            _etag_memo.popitem(last=False)
+    return etag
+
+
+def _build_preview(doc: Document, cache: DiskLRUCache, key: str) -> Path:
+    store = get_blob_store()
+    with store.open_local(doc.file_hash, suffix=doc.type or "") as local_path:
+        if not _needs_conversion(doc):
+            return cache.put_file(key, local_path)
+
+        converted = convert_doc_to_pdf(local_path)
+        if not converted or not converted.exists():
+            raise PreviewNotAvailable("Could not convert .doc to PDF")
+        try:
+            return cache.put_file(key, converted, move=True)
+        finally:
+            discard_conversion_output(converted)
+
+
+def get_preview(doc: Document) -> Preview:
+    """Trả về preview đã có hoặc sinh mới (chặn tới khi xong)."""
+    if not doc.file_hash:
+        raise PreviewNotAvailable("File content not found")
+
+    if not _needs_conversion(doc):
+        blob_path = get_blob_store().persistent_path(doc.file_hash)
+        if blob_path is not None:
+            # Blob đã là nội dung preview, key = SHA-256 nội dung -> dùng luôn làm ETag
+            return Preview(blob_path, doc.mime_type or "application/octet-stream", f'"{doc.file_hash}"')
+
+    cache = get_preview_cache()
+    key = _cache_key(doc)
+    path = cache.get(key)
+    if path is None:
+        metrics.incr("preview_cache.miss")
+        path = _build_preview(doc, cache, key)
+    else:
+        metrics.incr("preview_cache.hit")
+
+    if _needs_conversion(doc):
+        return Preview(path, "application/pdf", _content_etag(path))
+    return Preview(path, doc.mime_type or "application/octet-stream", f'"{doc.file_hash}"')
+
+
+def warm_preview(doc: Document) -> bool:
+    """Sinh sẵn preview (gọi từ pipeline xử lý document)."""
+    try:
+        get_preview(doc)
+        return True
+    except Exception as e:
+        print(f"[preview] could not pre-render document {doc.id}: {e}")
+        return False
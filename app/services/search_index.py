@@ -0,0 +1,281 @@
+"""
+Index BM25 nhúng trong process cho văn bản đã duyệt.
+
+Index gồm các segment bất biến, mỗi segment là một thư mục:
+- terms.txt + term_offsets.npy: từ điển term -> khoảng trong mảng postings
+- postings_docs.npy (uint32) / postings_tf.npy (uint16): postings dạng mảng
+- doc_ids.npy, doc_len.npy, issuer_agency.npy, document_type.npy: dữ liệu theo doc
+Các mảng được memory-map khi đọc. manifest.json (xem index_files) liệt kê
+segment đang dùng, doc đã xóa (tombstone) và số version.
+"""
+import heapq
+import json
+import math
+import threading
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.services import index_files
+from app.services.vi_text import has_diacritics, index_terms, normalize_text, query_terms
+
+settings = get_settings()
+
+# (document_id, parsed_content, issuer_agency, document_type)
+IndexableDoc = Tuple[int, str, Optional[str], Optional[str]]
+
+
+class SearchHit(NamedTuple):
+    document_id: int
+    score: float
+
+
+def index_root() -> Path:
+    return Path(settings.SEARCH_INDEX_DIR)
+
+
+def read_manifest(root: Optional[Path] = None) -> dict:
+    return index_files.read_manifest(
+        root or index_root(),
+        default={"version": 0, "segments": [], "fold_diacritics": settings.SEARCH_FOLD_DIACRITICS},
+    )
+
+
+def _category_key(value: Optional[str]) -> str:
+    return normalize_text(value or "")
+
+
+# ===== Ghi segment =====
+def write_segment(docs: Iterable[IndexableDoc], root: Optional[Path] = None, fold: Optional[bool] = None) -> Optional[str]:
+    """Ghi một segment mới từ các doc; trả về tên segment (None nếu không có doc)."""
+    root = root or index_root()
+    fold = settings.SEARCH_FOLD_DIACRITICS if fold is None else fold
+
+    # Postings gom thành 3 mảng phẳng (term, doc, tf), nhóm theo term bằng một lần argsort
+    term_ids: Dict[str, int] = {}
+    posting_terms, posting_docs, posting_tfs = array("I"), array("I"), array("I")
+    doc_ids, doc_len = array("q"), array("I")
+    agency_codes, type_codes = array("i"), array("i")
+    categories = {"issuer_agency": {}, "document_type": {}}
+
+    for local_id, (doc_id, text, agency, doc_type) in enumerate(docs):
+        terms = index_terms(text or "", fold=fold)
+        doc_ids.append(doc_id)
+        doc_len.append(len(terms))
+        agency_codes.append(categories["issuer_agency"].setdefault(_category_key(agency), len(categories["issuer_agency"])))
+        type_codes.append(categories["document_type"].setdefault(_category_key(doc_type), len(categories["document_type"])))
+        for term, tf in Counter(terms).items():
+            term_id = term_ids.get(term)
+            if term_id is None:
+                term_id = term_ids[term] = len(term_ids)
+            posting_terms.append(term_id)
+            posting_docs.append(local_id)
+            posting_tfs.append(tf)
+
+    if not doc_ids:
+        return None
+
+    name, tmp_dir = index_files.new_segment_dir(root)
+
+    terms_by_id = list(term_ids)
+    order = sorted(range(len(terms_by_id)), key=terms_by_id.__getitem__)
+    terms_sorted = [terms_by_id[i] for i in order]
+    rank = np.empty(len(order), dtype=np.uint32)
+    rank[order] = np.arange(len(order), dtype=np.uint32)
+
+    term_rank = rank[np.frombuffer(posting_terms, dtype=np.uint32)]
+    # stable: trong cùng term, doc giữ thứ tự tăng dần
+    perm = np.argsort(term_rank, kind="stable")
+    postings_docs = np.frombuffer(posting_docs, dtype=np.uint32)[perm]
+    postings_tf = np.minimum(np.frombuffer(posting_tfs, dtype=np.uint32)[perm], 65535).astype(np.uint16)
+    offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_rank, minlength=len(order)), out=offsets[1:])
+
+    with open(tmp_dir / "terms.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(terms_sorted))
+    np.save(tmp_dir / "term_offsets.npy", offsets)
+    np.save(tmp_dir / "postings_docs.npy", postings_docs)
+    np.save(tmp_dir / "postings_tf.npy", postings_tf)
+    np.save(tmp_dir / "doc_ids.npy", np.frombuffer(doc_ids, dtype=np.int64))
+    np.save(tmp_dir / "doc_len.npy", np.frombuffer(doc_len, dtype=np.uint32))
+    np.save(tmp_dir / "issuer_agency.npy", np.frombuffer(agency_codes, dtype=np.int32))
+    np.save(tmp_dir / "document_type.npy", np.frombuffer(type_codes, dtype=np.int32))
+    with open(tmp_dir / "categories.json", "w", encoding="utf-8") as f:
+        json.dump(categories, f, ensure_ascii=False)
+
+    index_files.publish_segment(root, name, tmp_dir)
+    return name
+
+
+def rebuild_index(docs: Iterable[IndexableDoc], root: Optional[Path] = None) -> dict:
+    """Dựng lại toàn bộ index thành một segment và tăng version."""
+    root = root or index_root()
+    with index_files.index_write_lock(root):
+        manifest = read_manifest(root)
+        name = write_segment(docs, root)
+        manifest["segments"] = [{"name": name, "deleted": []}] if name else []
+        manifest["version"] = manifest.get("version", 0) + 1
+        manifest["fold_diacritics"] = settings.SEARCH_FOLD_DIACRITICS
+        index_files.write_manifest(root, manifest)
+        index_files.remove_unused_segments(root, manifest)
+        return manifest
+
+
+def _tombstone(root: Path, manifest: dict, document_ids: set) -> bool:
+    """Đánh dấu xóa các doc có mặt trong segment; trả về True nếu manifest đổi."""
+    changed = False
+    wanted = np.fromiter(document_ids, dtype=np.int64)
+    for seg in manifest["segments"]:
+        deleted = set(seg.get("deleted", []))
+        seg_docs = np.load(root / seg["name"] / "doc_ids.npy", mmap_mode="r")
+        present = {int(doc_id) for doc_id in wanted[np.isin(wanted, seg_docs)]} - deleted
+        if present:
+            seg["deleted"] = sorted(deleted | present)
+            changed = True
+    return changed
+
+
+def apply_changes(add: Iterable[IndexableDoc], remove_ids: Iterable[int] = (),
+                  root: Optional[Path] = None) -> dict:
+    """
+    Cập nhật tăng dần: tombstone các doc trong `remove_ids` và bản cũ của các doc
+    trong `add`, rồi ghi các doc mới thành một segment. Version chỉ tăng khi index đổi.
+    """
+    root = root or index_root()
+    docs = list(add)
+    replaced = {int(doc_id) for doc_id in remove_ids} | {doc[0] for doc in docs}
+    with index_files.index_write_lock(root):
+        manifest = read_manifest(root)
+        changed = bool(replaced) and _tombstone(root, manifest, replaced)
+        # Segment mới dùng cùng chế độ bỏ dấu với index hiện có
+        name = write_segment(docs, root, fold=manifest.get("fold_diacritics"))
+        if name:
+            manifest["segments"].append({"name": name, "deleted": []})
+            changed = True
+        if changed:
+            manifest["version"] = manifest.get("version", 0) + 1
+            index_files.write_manifest(root, manifest)
+        return manifest
+
+
+# ===== Đọc / tìm kiếm =====
+class _Segment:
+    def __init__(self, seg_dir: Path, deleted: Iterable[int]):
+        with open(seg_dir / "terms.txt", encoding="utf-8") as f:
+            self.terms = {term: i for i, term in enumerate(f.read().split("\n"))}
+        self.offsets = np.load(seg_dir / "term_offsets.npy", mmap_mode="r")
+        self.postings_docs = np.load(seg_dir / "postings_docs.npy", mmap_mode="r")
+        self.postings_tf = np.load(seg_dir / "postings_tf.npy", mmap_mode="r")
+        self.doc_ids = np.load(seg_dir / "doc_ids.npy")
+        self.doc_len = np.load(seg_dir / "doc_len.npy").astype(np.float32)
+        self.issuer_agency = np.load(seg_dir / "issuer_agency.npy", mmap_mode="r")
+        self.document_type = np.load(seg_dir / "document_type.npy", mmap_mode="r")
+        with open(seg_dir / "categories.json", encoding="utf-8") as f:
+            self.categories = json.load(f)
+
+        deleted = np.fromiter(deleted, dtype=np.int64)
+        self.live = ~np.isin(self.doc_ids, deleted) if len(deleted) else np.ones(len(self.doc_ids), dtype=bool)
+        self.live_docs = int(self.live.sum())
+        self.live_len = float(self.doc_len[self.live].sum())
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        idx = self.terms.get(term)
+        if idx is None:
+            return None
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        return self.postings_docs[start:end], self.postings_tf[start:end]
+
+    def df(self, term: str) -> int:
+        idx = self.terms.get(term)
+        return 0 if idx is None else int(self.offsets[idx + 1] - self.offsets[idx])
+
+    def filter_mask(self, issuer_agency: Optional[str], document_type: Optional[str]) -> Optional[np.ndarray]:
+        mask = self.live
+        for field, value in (("issuer_agency", issuer_agency), ("document_type", document_type)):
+            if value is None:
+                continue
+            code = self.categories[field].get(_category_key(value))
+            if code is None:
+                return None
+            mask = mask & (getattr(self, field) == code)
+        return mask
+
+    def top_k(self, weighted_terms: Dict[str, float], mask: np.ndarray, avgdl: float,
+              k: int, k1: float, b: float) -> List[SearchHit]:
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for term, weight in weighted_terms.items():
+            posting = self.postings(term)
+            if posting is None:
+                continue
+            docs, tf = posting
+            tf = tf.astype(np.float32)
+            norm = k1 * (1.0 - b + b * self.doc_len[docs] / avgdl)
+            # doc_id trong một posting là duy nhất nên cộng theo index an toàn
+            scores[docs] += weight * tf * (k1 + 1.0) / (tf + norm)
+        scores[~mask] = 0.0
+        candidates = np.flatnonzero(scores)
+        return heapq.nlargest(
+            k,
+            (SearchHit(int(doc_id), float(score))
+             for doc_id, score in zip(self.doc_ids[candidates], scores[candidates])),
+            key=lambda hit: hit.score,
+        )
+
+
+class SearchIndex:
+    def __init__(self, root: Path, manifest: dict):
+        self.root = root
+        self.version = manifest.get("version", 0)
+        self.fold_diacritics = manifest.get("fold_diacritics", False)
+        self.segments = [_Segment(root / seg["name"], seg.get("deleted", [])) for seg in manifest["segments"]]
+        self.num_docs = sum(seg.live_docs for seg in self.segments)
+        total_len = sum(seg.live_len for seg in self.segments)
+        self.avgdl = total_len / self.num_docs if self.num_docs else 1.0
+
+    def idf(self, term: str) -> float:
+        # df gồm cả doc đã tombstone cho tới khi compact; sai số nhỏ, chấp nhận được
+        df = sum(seg.df(term) for seg in self.segments)
+        return math.log(1.0 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 10, issuer_agency: Optional[str] = None,
+               document_type: Optional[str] = None, fold: Optional[bool] = None) -> List[SearchHit]:
+        if not self.num_docs:
+            return []
+        if fold is None:
+            # Truy vấn gõ không dấu -> so khớp trên term đã bỏ dấu
+            fold = self.fold_diacritics and not has_diacritics(normalize_text(query))
+        fold = fold and self.fold_diacritics
+
+        counts = Counter(query_terms(query, fold=fold))
+        weighted = {term: qtf * self.idf(term) for term, qtf in counts.items()}
+        k1, b = settings.SEARCH_BM25_K1, settings.SEARCH_BM25_B
+
+        hits: List[SearchHit] = []
+        for seg in self.segments:
+            mask = seg.filter_mask(issuer_agency, document_type)
+            if mask is None:
+                continue
+            hits.extend(seg.top_k(weighted, mask, self.avgdl, k, k1, b))
+        return heapq.nlargest(k, hits, key=lambda hit: hit.score)
+
+
+_loaded: Optional[SearchIndex] = None
+_loaded_stamp = None
+_load_lock = threading.Lock()
+
+
+def get_search_index() -> Optional[SearchIndex]:
+    """Index dùng chung trong process; tự nạp lại khi manifest thay đổi."""
+    global _loaded, _loaded_stamp
+    stamp = index_files.manifest_stamp(index_root())
+    if stamp is None:
+        return None
+    with _load_lock:
+        if _loaded is None or stamp != _loaded_stamp:
+            _loaded = SearchIndex(index_root(), read_manifest())
+            _loaded_stamp = stamp
+        return _loaded
@@ -0,0 +1,70 @@
+"""
+Hàng đợi đặt tiêu đề session chat.
+
+Session mới nhận ngay tiêu đề tạm (fallback); việc gọi LLM chạy trong Celery.
+Các yêu cầu đang chờ được gom trong một Redis list để một task đặt tiêu đề cho
+nhiều session bằng một request. Không có Redis thì mỗi yêu cầu đi thẳng vào
+tham số của task (không gom lô).
+"""
+import json
+from typing import List, Optional
+
+from app.core.config import get_settings
+from app.core.redis_client import RedisError, get_redis, mark_redis_down
+
+settings = get_settings()
+
+PENDING_KEY = "chat:titles:pending"
+SCHEDULED_KEY = "chat:titles:scheduled"
+
+
+def title_request(session_id: int, messages: List[str], fallback: str) -> dict:
+    return {"session_id": session_id, "messages": messages[:5], "fallback": fallback}
+
+
+def push_pending(item: dict) -> Optional[bool]:
+    """
+    Thêm yêu cầu vào hàng đợi chung. Trả về True nếu caller cần lên lịch task
+    (chưa có task nào đang chờ), False nếu đã có, None nếu không có Redis.
+    """
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        pipe = client.pipeline()
+        pipe.rpush(PENDING_KEY, json.dumps(item, ensure_ascii=False))
+        pipe.set(SCHEDULED_KEY, 1, nx=True, ex=settings.SESSION_TITLE_BATCH_DELAY_SECONDS + 60)
+        _, scheduled_now = pipe.execute()
+        return bool(scheduled_now)
+    except RedisError as e:
+        mark_redis_down(e)
+        return None
+
+
+def drain_pending(limit: int) -> List[dict]:
+    """Lấy tối đa `limit` yêu cầu (nguyên tử) và bỏ cờ đã lên lịch."""
+    client = get_redis()
+    if client is None:
+        return []
+    try:
+        # Bỏ cờ trước: yêu cầu đến sau lúc này sẽ tự lên lịch task mới
+        client.delete(SCHEDULED_KEY)
+        pipe = client.pipeline(transaction=True)
+        pipe.lrange(PENDING_KEY, 0, limit - 1)
+        pipe.ltrim(PENDING_KEY, limit, -1)
+        raw, _ = pipe.execute()
+        return [json.loads(item) for item in raw]
+    except RedisError as e:
+        mark_redis_down(e)
+        return []
+
+
+def pending_count() -> int:
+    client = get_redis()
+    if client is None:
+        return 0
+    try:
+        return client.llen(PENDING_KEY)
+    except RedisError as e:
+        mark_redis_down(e)
+        return 0
@@ -0,0 +1,209 @@
+"""
+Gộp các lời gọi AI giống hệt nhau đang chạy cùng lúc (single-flight).
+
+Key là answer_cache_key của lượt chat (câu hỏi chuẩn hóa + lịch sử + version
+corpus). Request đầu tiên làm leader và gọi AI; các request trùng key đến trong
+lúc đó chờ và dùng chung kết quả, mỗi request vẫn tự lưu ChatMessage cho session
+của mình.
+
+- Trong một process: dict key -> lượt gọi đang chạy (thread hoặc asyncio).
+- Giữa các process API / worker Celery: khóa Redis SET NX "ai:flight:<key>"; leader
+  ghi kết quả vào "ai:flight:<key>:result" (TTL ngắn), follower poll key đó. Chỉ câu
+  trả lời thành công mới được ghi: lỗi chỉ nhả khóa để lượt sau (vd worker Celery thử
+  lại) gọi AI lần nữa. Leader chết giữa chừng thì khóa hết hạn và follower tự lên làm leader.
+bypass=True (bypass_cache của client) bỏ qua single-flight, luôn gọi AI.
+Không có Redis thì chỉ gộp trong process.
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.core.redis_client import RedisError, get_async_redis, get_redis, mark_redis_down
+
+settings = get_settings()
+
+_PREFIX = "ai:flight:"
+
+# Chỉ xóa khóa nếu vẫn là của mình (khóa có thể đã hết hạn và bị leader khác lấy)
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _keys(key: str) -> Tuple[str, str]:
+    return _PREFIX + key, _PREFIX + key + ":result"
+
+
+def _enabled(key: Optional[str]) -> bool:
+    return bool(key) and settings.SINGLE_FLIGHT_ENABLED
+
+
+def _shareable(result) -> bool:
+    # Không lưu {"error": ...}: lượt gọi sau (worker thử lại, câu hỏi lặp lại) phải gọi lại AI
+    return isinstance(result, dict) and "answer" in result
+
+
+# ===== Bản đồng bộ (worker Celery) =====
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[dict] = None
+
+
+_flights: Dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+
+
+def run_single_flight(key: Optional[str], fetch: Callable[[], dict], bypass: bool = False) -> Tuple[dict, bool]:
+    """
+    Chạy fetch() một lần cho mỗi key đang bay; trả về (kết quả, là_leader).
+    fetch() phải tự bắt lỗi và trả dict (vd {"error": ...}) để follower cũng nhận được.
+    """
+    if bypass or not _enabled(key):
+        return fetch(), True
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        flight.done.wait(settings.SINGLE_FLIGHT_LOCK_TTL_SECONDS)
+        if flight.result is not None:
+            metrics.incr("single_flight.follower")
+            return flight.result, False
+        return fetch(), True
+
+    try:
+        flight.result, leader = _run_shared(key, fetch)
+        return flight.result, leader
+    finally:
+        flight.done.set()
+        with _flights_lock:
+            _flights.pop(key, None)
+
+
+def _run_shared(key: str, fetch: Callable[[], dict]) -> Tuple[dict, bool]:
+    client = get_redis()
+    if client is None:
+        metrics.incr("single_flight.leader")
+        return fetch(), True
+
+    lock_key, result_key = _keys(key)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_LOCK_TTL_SECONDS
+    try:
+        while True:
+            # Đọc kết quả trước: leader vừa xong thì khóa đã trống nhưng không được gọi lại AI
+            raw = client.get(result_key)
+            if raw is not None:
+                metrics.incr("single_flight.follower")
+                return json.loads(raw), False
+            if client.set(lock_key, token, nx=True, ex=settings.SINGLE_FLIGHT_LOCK_TTL_SECONDS):
+                break
+            if time.monotonic() > deadline:
+                break
+            time.sleep(settings.SINGLE_FLIGHT_POLL_SECONDS)
+    except RedisError as e:
+        mark_redis_down(e)
+        client = None
+
+    metrics.incr("single_flight.leader")
+    result = fetch()
+    if client is None:
+        return result, True
+    try:
+        if _shareable(result):
+            client.set(result_key, json.dumps(result, ensure_ascii=False), ex=settings.SINGLE_FLIGHT_RESULT_TTL_SECONDS)
+        client.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+    except RedisError as e:
+        mark_redis_down(e)
+    return result, True
+
+
+# ===== Bản async (process API) =====
+_async_flights: Dict[str, asyncio.Future] = {}
+
+
+async def run_single_flight_async(
+    key: Optional[str], fetch: Callable[[], Awaitable[dict]], bypass: bool = False
+) -> Tuple[dict, bool]:
+    """Như run_single_flight nhưng cho coroutine; chờ bằng asyncio, không chặn event loop."""
+    if bypass or not _enabled(key):
+        return await fetch(), True
+
+    flight = _async_flights.get(key)
+    if flight is not None:
+        try:
+            result = await asyncio.wait_for(asyncio.shield(flight), settings.SINGLE_FLIGHT_LOCK_TTL_SECONDS)
+            await metrics.incr_async("single_flight.follower")
+            return result, False
+        except asyncio.TimeoutError:
+            return await fetch(), True
+        except asyncio.CancelledError:
+            # Leader bị hủy (tắt server) thì tự gọi; còn chính mình bị hủy thì dừng
+            if not flight.cancelled():
+                raise
+            return await fetch(), True
+
+    flight = _async_flights[key] = asyncio.get_running_loop().create_future()
+    try:
+        result, leader = await _run_shared_async(key, fetch)
+        flight.set_result(result)
+        return result, leader
+    except asyncio.CancelledError:
+        flight.cancel()
+        raise
+    except Exception as e:
+        flight.set_exception(e)
+        # Follower nhận lỗi qua future; tránh cảnh báo "exception was never retrieved"
+        flight.exception()
+        raise
+    finally:
+        _async_flights.pop(key, None)
+
+
+async def _run_shared_async(key: str, fetch: Callable[[], Awaitable[dict]]) -> Tuple[dict, bool]:
+    client = get_async_redis()
+    if client is None:
+        await metrics.incr_async("single_flight.leader")
+        return await fetch(), True
+
+    lock_key, result_key = _keys(key)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_LOCK_TTL_SECONDS
+    try:
+        while True:
+            raw = await client.get(result_key)
+            if raw is not None:
+                await metrics.incr_async("single_flight.follower")
+                return json.loads(raw), False
+            if await client.set(lock_key, token, nx=True, ex=settings.SINGLE_FLIGHT_LOCK_TTL_SECONDS):
+                break
+            if time.monotonic() > deadline:
+                break
+            await asyncio.sleep(settings.SINGLE_FLIGHT_POLL_SECONDS)
+    except RedisError as e:
+        mark_redis_down(e)
+        client = None
+
+    await metrics.incr_async("single_flight.leader")
+    result = await fetch()
+    if client is None:
+        return result, True
+    try:
+        if _shareable(result):
+            await client.set(result_key, json.dumps(result, ensure_ascii=False), ex=settings.SINGLE_FLIGHT_RESULT_TTL_SECONDS)
+        await client.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+    except RedisError as e:
+        mark_redis_down(e)
+    return result, True
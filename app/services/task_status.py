@@ -0,0 +1,190 @@
+"""
+Đọc trạng thái task Celery cho API: long-poll và tra nhiều task một lần.
+
+Result backend Redis của Celery ghi mỗi lần đổi trạng thái bằng SET + PUBLISH lên
+kênh trùng tên key ("celery-task-meta-<id>"). Long-poll đăng ký kênh đó rồi chờ
+message thay vì sleep/poll: mỗi process API dùng MỘT kết nối pub/sub, một task nền
+đọc message và đánh thức các request đang chờ đúng kênh.
+
+Backend không phải Redis (hoặc Redis lỗi) thì trả ngay trạng thái hiện tại qua
+AsyncResult, client tự gọi lại như trước.
+"""
+import asyncio
+from typing import Dict, List, Optional, Set
+
+from celery.result import AsyncResult
+from starlette.concurrency import run_in_threadpool
+
+from app.core.celery_app import RESULT_BACKEND, celery_app
+from app.core.config import get_settings
+from app.core.redis_client import RedisError
+
+settings = get_settings()
+
+READY_STATES = {"SUCCESS", "FAILURE", "REVOKED"}
+
+
+def status_payload(task_id: str, status: str, result=None) -> dict:
+    """Dạng trả về của /tasks (giữ nguyên như trước: answer / error khi task trả dict)."""
+    payload = {"task_id": task_id, "status": status}
+    if status == "SUCCESS" and isinstance(result, dict):
+        payload["answer"] = result.get("answer")
+        payload["error"] = result.get("error")
+    elif status == "FAILURE":
+        payload["error"] = str(result)
+    return payload
+
+
+def _meta_payload(task_id: str, raw: Optional[bytes]) -> dict:
+    if raw is None:
+        return status_payload(task_id, "PENDING")
+    meta = celery_app.backend.decode_result(raw)
+    return status_payload(task_id, meta["status"], meta.get("result"))
+
+
+def _read_sync(task_id: str) -> dict:
+    res = AsyncResult(task_id, app=celery_app)
+    return status_payload(task_id, res.status, res.result)
+
+
+def read_task_states(task_ids: List[str]) -> List[str]:
+    """
+    Trạng thái của nhiều task trong một round trip (MGET trên result backend key-value);
+    backend khác thì đọc từng task.
+    """
+    backend = celery_app.backend
+    if not hasattr(backend, "mget"):
+        return [AsyncResult(task_id, app=celery_app).state for task_id in task_ids]
+    raws = backend.mget([backend.get_key_for_task(task_id) for task_id in task_ids])
+    return [backend.decode_result(raw)["status"] if raw else "PENDING" for raw in raws]
+
+
+class _TaskWatcher:
+    """Một kết nối pub/sub dùng chung; mỗi kênh có một tập future của các request đang chờ."""
+
+    def __init__(self, client):
+        self.client = client
+        self.pubsub = client.pubsub()
+        self.waiters: Dict[bytes, Set[asyncio.Future]] = {}
+        self.reader: Optional[asyncio.Task] = None
+
+    async def read(self, key: bytes) -> Optional[bytes]:
+        return await self.client.get(key)
+
+    async def mget(self, keys: List[bytes]) -> List[Optional[bytes]]:
+        return await self.client.mget(keys)
+
+    async def watch(self, key: bytes) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        waiters = self.waiters.setdefault(key, set())
+        waiters.add(future)
+        if len(waiters) == 1:
+            try:
+                await self.pubsub.subscribe(key)
+            except BaseException:
+                await self.unwatch(key, future)
+                raise
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.create_task(self._read_messages())
+        return future
+
+    async def unwatch(self, key: bytes, future: asyncio.Future) -> None:
+        waiters = self.waiters.get(key)
+        if waiters is None:
+            return
+        waiters.discard(future)
+        if not waiters:
+            del self.waiters[key]
+            await self.pubsub.unsubscribe(key)
+
+    async def _read_messages(self) -> None:
+        try:
+            while self.waiters:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                for future in self.waiters.get(message["channel"], ()):
+                    if not future.done():
+                        future.set_result(message["data"])
+        except (RedisError, OSError) as e:
+            for waiters in self.waiters.values():
+                for future in waiters:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def close(self) -> None:
+        if self.reader is not None:
+            self.reader.cancel()
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+_watcher: Optional[_TaskWatcher] = None
+
+
+def _get_watcher() -> Optional[_TaskWatcher]:
+    global _watcher
+    if not RESULT_BACKEND.startswith(("redis://", "rediss://")):
+        return None
+    if _watcher is None:
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            return None
+        # Kết nối riêng tới đúng Redis của result backend (có thể khác REDIS_URL)
+        _watcher = _TaskWatcher(redis_asyncio.Redis.from_url(
+            RESULT_BACKEND, socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        ))
+    return _watcher
+
+
+async def close_task_watcher() -> None:
+    global _watcher
+    if _watcher is not None:
+        await _watcher.close()
+        _watcher = None
+
+
+async def get_task_status(task_id: str, wait: float = 0) -> dict:
+    """
+    Trạng thái hiện tại; với wait > 0 và task chưa xong thì chờ tới khi trạng thái đổi
+    (message pub/sub từ result backend) hoặc hết `wait` giây.
+    """
+    watcher = _get_watcher()
+    if watcher is None:
+        return await run_in_threadpool(_read_sync, task_id)
+
+    key = celery_app.backend.get_key_for_task(task_id)
+    try:
+        if wait <= 0:
+            return _meta_payload(task_id, await watcher.read(key))
+
+        # Đăng ký trước rồi mới đọc: thay đổi xảy ra giữa hai bước vẫn không bị lỡ
+        future = await watcher.watch(key)
+        try:
+            current = _meta_payload(task_id, await watcher.read(key))
+            if current["status"] in READY_STATES:
+                return current
+            try:
+                raw = await asyncio.wait_for(asyncio.shield(future), wait)
+            except asyncio.TimeoutError:
+                return current
+            return _meta_payload(task_id, raw)
+        finally:
+            await watcher.unwatch(key, future)
+    except (RedisError, OSError) as e:
+        print(f"[tasks] result backend unavailable for long-poll: {e}")
+        return await run_in_threadpool(_read_sync, task_id)
+
+
+async def get_task_statuses(task_ids: List[str]) -> List[dict]:
+    """Trạng thái của nhiều task trong một round trip (MGET)."""
+    watcher = _get_watcher()
+    if watcher is None:
+        return await run_in_threadpool(lambda: [_read_sync(task_id) for task_id in task_ids])
+    try:
+        raws = await watcher.mget([celery_app.backend.get_key_for_task(task_id) for task_id in task_ids])
+    except (RedisError, OSError) as e:
+        print(f"[tasks] result backend unavailable for batch status: {e}")
+        return await run_in_threadpool(lambda: [_read_sync(task_id) for task_id in task_ids])
+    return [_meta_payload(task_id, raw) for task_id, raw in zip(task_ids, raws)]
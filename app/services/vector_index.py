@@ -0,0 +1,344 @@
+"""
+Vector index (dense retrieval) trên các chunk của văn bản đã duyệt.
+
+- Mỗi segment lưu ma trận vector (float16/float32, .npy memory-map) cùng
+  chunk_id / document_id tương ứng. Vector đã chuẩn hóa L2 nên cosine = tích vô hướng.
+- Tìm kiếm brute-force theo block: một phép nhân ma trận cho cả batch truy vấn,
+  chọn top-k bằng argpartition.
+- Segment lớn (>= VECTOR_IVF_MIN_VECTORS) được compact thành IVF: k-means
+  chia vector thành các list liền kề, truy vấn chỉ quét `nprobe` list gần nhất.
+- Thêm văn bản = ghi segment mới (append-only); gỡ văn bản = tombstone theo
+  document_id trong manifest; compact gộp segment và bỏ hàng đã xóa.
+"""
+import math
+import threading
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.services import index_files
+from app.services.embeddings import embed_in_batches, get_embedder
+
+settings = get_settings()
+
+# (chunk_id, document_id, text)
+IndexableChunk = Tuple[int, int, str]
+
+_BLOCK_ROWS = 65536
+
+
+class VectorHit(NamedTuple):
+    chunk_id: int
+    document_id: int
+    score: float
+
+
+def index_root() -> Path:
+    return Path(settings.VECTOR_INDEX_DIR)
+
+
+def read_manifest(root: Optional[Path] = None) -> dict:
+    embedder = get_embedder()
+    return index_files.read_manifest(root or index_root(), default={
+        "version": 0,
+        "segments": [],
+        "dim": embedder.dim,
+        "embedder": embedder.name,
+        "dtype": settings.VECTOR_DTYPE,
+    })
+
+
+# ===== Top-k helpers =====
+def _topk_columns(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k theo từng cột của ma trận (n x b). Trả về (chỉ số k' x b, điểm k' x b), đã sắp giảm dần."""
+    n = scores.shape[0]
+    k = min(k, n)
+    if k == 0:
+        return np.zeros((0, scores.shape[1]), dtype=np.int64), np.zeros((0, scores.shape[1]), dtype=np.float32)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=0)[:k]
+    else:
+        idx = np.broadcast_to(np.arange(n)[:, None], scores.shape).copy()
+    vals = np.take_along_axis(scores, idx, axis=0)
+    order = np.argsort(-vals, axis=0, kind="stable")
+    return np.take_along_axis(idx, order, axis=0), np.take_along_axis(vals, order, axis=0)
+
+
+# ===== k-means cho IVF =====
+def _assign(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    out = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), _BLOCK_ROWS):
+        block = np.asarray(x[start:start + _BLOCK_ROWS], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def train_kmeans(x: np.ndarray, nlist: int, iters: int = 10, sample: int = 100_000, seed: int = 0) -> np.ndarray:
+    """Spherical k-means (cosine) trên một mẫu của x."""
+    rng = np.random.default_rng(seed)
+    if len(x) > sample:
+        x = x[np.sort(rng.choice(len(x), sample, replace=False))]
+    x = np.asarray(x, dtype=np.float32)
+    centroids = x[rng.choice(len(x), nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = _assign(x, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        non_empty = counts > 0
+        sums = np.add.reduceat(x[order], starts[non_empty], axis=0)
+        centroids[non_empty] = sums
+        # List rỗng: gieo lại bằng điểm ngẫu nhiên
+        empty = np.flatnonzero(~non_empty)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        np.divide(centroids, norms, out=centroids, where=norms > 0)
+    return centroids
+
+
+# ===== Ghi segment =====
+def _write_segment(root: Path, vectors: np.ndarray, chunk_ids: np.ndarray, doc_ids: np.ndarray,
+                   ivf: bool, dtype: str) -> dict:
+    name, tmp_dir = index_files.new_segment_dir(root)
+    nlist = 0
+    if ivf:
+        nlist = settings.VECTOR_IVF_NLIST or max(1, int(4 * math.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        centroids = train_kmeans(vectors, nlist)
+        assign = _assign(vectors, centroids)
+        # Sắp theo list để mỗi list là một khoảng liền kề trong ma trận
+        order = np.argsort(assign, kind="stable")
+        vectors, chunk_ids, doc_ids = vectors[order], chunk_ids[order], doc_ids[order]
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=nlist), out=list_offsets[1:])
+        np.save(tmp_dir / "centroids.npy", centroids.astype(np.float32))
+        np.save(tmp_dir / "list_offsets.npy", list_offsets)
+
+    np.save(tmp_dir / "vectors.npy", np.asarray(vectors, dtype=dtype))
+    np.save(tmp_dir / "chunk_ids.npy", np.asarray(chunk_ids, dtype=np.int64))
+    np.save(tmp_dir / "doc_ids.npy", np.asarray(doc_ids, dtype=np.int64))
+    index_files.publish_segment(root, name, tmp_dir)
+    return {"name": name, "count": int(len(vectors)), "ivf": bool(ivf), "nlist": nlist, "deleted": []}
+
+
+def _embed_chunks(chunks: Iterable[IndexableChunk]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    chunk_ids, doc_ids, texts = [], [], []
+    for chunk_id, doc_id, text in chunks:
+        chunk_ids.append(chunk_id)
+        doc_ids.append(doc_id)
+        texts.append(text)
+    return (
+        embed_in_batches(texts),
+        np.asarray(chunk_ids, dtype=np.int64),
+        np.asarray(doc_ids, dtype=np.int64),
+    )
+
+
+def _check_compatible(manifest: dict) -> None:
+    embedder = get_embedder()
+    if manifest["segments"] and (manifest["dim"] != embedder.dim or manifest["embedder"] != embedder.name):
+        raise ValueError("Vector index was built with a different embedder; rebuild it first")
+
+
+def _tombstone(root: Path, manifest: dict, document_ids: set) -> bool:
+    """Đánh dấu xóa các document_id có mặt trong segment; trả về True nếu manifest đổi."""
+    changed = False
+    wanted = np.fromiter(document_ids, dtype=np.int64)
+    for seg in manifest["segments"]:
+        deleted = set(seg.get("deleted", []))
+        seg_docs = np.load(root / seg["name"] / "doc_ids.npy", mmap_mode="r")
+        present = {int(doc_id) for doc_id in wanted[np.isin(wanted, seg_docs)]} - deleted
+        if present:
+            seg["deleted"] = sorted(deleted | present)
+            changed = True
+    return changed
+
+
+def apply_changes(add: Iterable[IndexableChunk], remove_document_ids: Iterable[int] = (),
+                  root: Optional[Path] = None) -> dict:
+    """
+    Cập nhật tăng dần: tombstone các văn bản trong `remove_document_ids` và các văn
+    bản có chunk trong `add` (bản cũ), rồi ghi các chunk mới thành một segment.
+    Version chỉ tăng khi nội dung index thật sự thay đổi.
+    """
+    root = root or index_root()
+    vectors, chunk_ids, doc_ids = _embed_chunks(add)
+    replaced = {int(doc_id) for doc_id in remove_document_ids} | {int(doc_id) for doc_id in doc_ids}
+    with index_files.index_write_lock(root):
+        manifest = read_manifest(root)
+        _check_compatible(manifest)
+        changed = bool(replaced) and _tombstone(root, manifest, replaced)
+        if len(vectors):
+            manifest["segments"].append(
+                _write_segment(root, vectors, chunk_ids, doc_ids, ivf=False, dtype=manifest["dtype"])
+            )
+            changed = True
+        if changed:
+            manifest["version"] += 1
+            index_files.write_manifest(root, manifest)
+        return manifest
+
+
+def _live_rows(root: Path, manifest: dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    vectors, chunk_ids, doc_ids = [], [], []
+    for seg in manifest["segments"]:
+        seg_dir = root / seg["name"]
+        seg_docs = np.load(seg_dir / "doc_ids.npy")
+        live = ~np.isin(seg_docs, np.asarray(seg.get("deleted", []), dtype=np.int64))
+        vectors.append(np.load(seg_dir / "vectors.npy", mmap_mode="r")[live])
+        chunk_ids.append(np.load(seg_dir / "chunk_ids.npy")[live])
+        doc_ids.append(seg_docs[live])
+    dim = manifest["dim"]
+    if not vectors:
+        return np.zeros((0, dim), dtype=manifest["dtype"]), np.zeros(0, np.int64), np.zeros(0, np.int64)
+    return np.concatenate(vectors), np.concatenate(chunk_ids), np.concatenate(doc_ids)
+
+
+def compact(root: Optional[Path] = None, min_segments: int = 2) -> dict:
+    """Gộp các segment thành một, bỏ hàng đã tombstone; đủ lớn thì dựng IVF."""
+    root = root or index_root()
+    with index_files.index_write_lock(root):
+        manifest = read_manifest(root)
+        has_deleted = any(seg.get("deleted") for seg in manifest["segments"])
+        if len(manifest["segments"]) < min_segments and not has_deleted:
+            return manifest
+
+        vectors, chunk_ids, doc_ids = _live_rows(root, manifest)
+        segments = []
+        if len(vectors):
+            ivf = len(vectors) >= settings.VECTOR_IVF_MIN_VECTORS
+            segments.append(_write_segment(root, vectors, chunk_ids, doc_ids, ivf=ivf, dtype=manifest["dtype"]))
+        manifest["segments"] = segments
+        manifest["version"] += 1
+        index_files.write_manifest(root, manifest)
+        index_files.remove_unused_segments(root, manifest)
+        return manifest
+
+
+def rebuild(chunks: Iterable[IndexableChunk], root: Optional[Path] = None) -> dict:
+    """Dựng lại toàn bộ index (dùng khi đổi embedder)."""
+    root = root or index_root()
+    vectors, chunk_ids, doc_ids = _embed_chunks(chunks)
+    embedder = get_embedder()
+    with index_files.index_write_lock(root):
+        manifest = read_manifest(root)
+        manifest.update({"dim": embedder.dim, "embedder": embedder.name, "dtype": settings.VECTOR_DTYPE})
+        segments = []
+        if len(vectors):
+            ivf = len(vectors) >= settings.VECTOR_IVF_MIN_VECTORS
+            segments.append(_write_segment(root, vectors, chunk_ids, doc_ids, ivf=ivf, dtype=manifest["dtype"]))
+        manifest["segments"] = segments
+        manifest["version"] += 1
+        index_files.write_manifest(root, manifest)
+        index_files.remove_unused_segments(root, manifest)
+        return manifest
+
+
+# ===== Đọc / tìm kiếm =====
+class _VectorSegment:
+    def __init__(self, seg_dir: Path, meta: dict):
+        self.vectors = np.load(seg_dir / "vectors.npy", mmap_mode="r")
+        self.chunk_ids = np.load(seg_dir / "chunk_ids.npy")
+        self.doc_ids = np.load(seg_dir / "doc_ids.npy")
+        deleted = np.asarray(meta.get("deleted", []), dtype=np.int64)
+        self.dead = np.isin(self.doc_ids, deleted) if len(deleted) else None
+        self.ivf = meta.get("ivf", False)
+        if self.ivf:
+            self.centroids = np.load(seg_dir / "centroids.npy")
+            self.list_offsets = np.load(seg_dir / "list_offsets.npy")
+
+    def _score_rows(self, rows: Union[slice, np.ndarray], queries: np.ndarray) -> np.ndarray:
+        scores = np.asarray(self.vectors[rows], dtype=np.float32) @ queries.T
+        if self.dead is not None:
+            scores[self.dead[rows]] = -np.inf
+        return scores
+
+    def search(self, queries: np.ndarray, k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Trả về (chỉ số hàng k' x b, điểm k' x b) trong segment."""
+        if self.ivf:
+            return self._search_ivf(queries, k, nprobe)
+
+        best_idx = np.zeros((0, len(queries)), dtype=np.int64)
+        best_val = np.zeros((0, len(queries)), dtype=np.float32)
+        for start in range(0, len(self.vectors), _BLOCK_ROWS):
+            stop = min(start + _BLOCK_ROWS, len(self.vectors))
+            idx, val = _topk_columns(self._score_rows(slice(start, stop), queries), k)
+            best_idx = np.concatenate([best_idx, idx + start])
+            best_val = np.concatenate([best_val, val])
+            if len(best_idx) > k:
+                keep, best_val = _topk_columns(best_val, k)
+                best_idx = np.take_along_axis(best_idx, keep, axis=0)
+        return best_idx, best_val
+
+    def _search_ivf(self, queries: np.ndarray, k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        nprobe = min(nprobe, len(self.centroids))
+        probes, _ = _topk_columns(self.centroids @ queries.T, nprobe)
+        k_out = min(k, len(self.vectors))
+        out_idx = np.zeros((k_out, len(queries)), dtype=np.int64)
+        out_val = np.full((k_out, len(queries)), -np.inf, dtype=np.float32)
+        for q in range(len(queries)):
+            rows = np.concatenate([
+                np.arange(self.list_offsets[p], self.list_offsets[p + 1]) for p in probes[:, q]
+            ])
+            if not len(rows):
+                continue
+            idx, val = _topk_columns(self._score_rows(rows, queries[q:q + 1]), k_out)
+            out_idx[:len(idx), q] = rows[idx[:, 0]]
+            out_val[:len(val), q] = val[:, 0]
+        return out_idx, out_val
+
+
+class VectorIndex:
+    def __init__(self, root: Path, manifest: dict):
+        self.version = manifest.get("version", 0)
+        self.dim = manifest["dim"]
+        self.segments = [_VectorSegment(root / seg["name"], seg) for seg in manifest["segments"]]
+
+    def search_vectors(self, queries: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> List[List[VectorHit]]:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nprobe = nprobe or settings.VECTOR_IVF_NPROBE
+        all_scores, all_chunks, all_docs = [], [], []
+        for seg in self.segments:
+            idx, val = seg.search(queries, k, nprobe)
+            all_scores.append(val)
+            all_chunks.append(seg.chunk_ids[idx])
+            all_docs.append(seg.doc_ids[idx])
+        if not all_scores:
+            return [[] for _ in range(len(queries))]
+
+        scores = np.concatenate(all_scores)
+        chunk_ids = np.concatenate(all_chunks)
+        doc_ids = np.concatenate(all_docs)
+        top, vals = _topk_columns(scores, k)
+        results = []
+        for q in range(len(queries)):
+            results.append([
+                VectorHit(int(chunk_ids[row, q]), int(doc_ids[row, q]), float(score))
+                for row, score in zip(top[:, q], vals[:, q])
+                if np.isfinite(score)
+            ])
+        return results
+
+    def search(self, texts: Sequence[str], k: int = 10, nprobe: Optional[int] = None) -> List[List[VectorHit]]:
+        return self.search_vectors(embed_in_batches(list(texts)), k=k, nprobe=nprobe)
+
+
+_loaded: Optional[VectorIndex] = None
+_loaded_stamp = None
+_load_lock = threading.Lock()
+
+
+def get_vector_index() -> Optional[VectorIndex]:
+    """Index dùng chung trong process; tự nạp lại khi manifest thay đổi."""
+    global _loaded, _loaded_stamp
+    stamp = index_files.manifest_stamp(index_root())
+    if stamp is None:
+        return None
+    with _load_lock:
+        if _loaded is None or stamp != _loaded_stamp:
+            _loaded = VectorIndex(index_root(), read_manifest())
+            _loaded_stamp = stamp
+        return _loaded
@@ -0,0 +1,59 @@
+"""
+Chuẩn hóa và tách token cho tiếng Việt.
+
+Tiếng Việt viết theo âm tiết nên token là âm tiết; bigram âm tiết
+("tạm_trú") giữ lại phần lớn nghĩa của từ ghép mà không cần bộ tách từ.
+"""
+import re
+import unicodedata
+from typing import List
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+# Tiền tố cho term đã bỏ dấu, tách biệt với term có dấu trong cùng index
+FOLDED_PREFIX = "~"
+
+
+def normalize_text(text: str) -> str:
+    """NFC + lowercase (casefold) + gộp khoảng trắng."""
+    text = unicodedata.normalize("NFC", text or "").casefold()
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def fold_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'thủ tục đăng ký' -> 'thu tuc dang ky'."""
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+    return unicodedata.normalize("NFC", stripped.replace("đ", "d").replace("Đ", "D"))
+
+
+def has_diacritics(text: str) -> bool:
+    return fold_diacritics(text) != text
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+def with_bigrams(tokens: List[str]) -> List[str]:
+    return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def index_terms(text: str, fold: bool = False) -> List[str]:
+    """Term để index: âm tiết + bigram; kèm bản bỏ dấu nếu `fold`."""
+    normalized = normalize_text(text)
+    terms = with_bigrams(_TOKEN_RE.findall(normalized))
+    if fold:
+        # Bỏ dấu cả chuỗi một lần (không đổi ranh giới token)
+        folded = _TOKEN_RE.findall(fold_diacritics(normalized))
+        terms += [FOLDED_PREFIX + t for t in with_bigrams(folded)]
+    return terms
+
+
+def query_terms(text: str, fold: bool) -> List[str]:
+    """Term cho truy vấn: có dấu, hoặc chỉ dùng term bỏ dấu khi `fold`."""
+    normalized = normalize_text(text)
+    if fold:
+        return [FOLDED_PREFIX + t for t in with_bigrams(_TOKEN_RE.findall(fold_diacritics(normalized)))]
+    return with_bigrams(_TOKEN_RE.findall(normalized))
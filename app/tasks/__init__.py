@@ -1,2 +1,3 @@
 from . import document_tasks 
-from . import chat_tasks     
\ No newline at end of file
+from . import chat_tasks
+from . import search_tasks
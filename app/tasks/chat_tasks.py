@@ -1,12 +1,19 @@
-from datetime import datetime
 import httpx, traceback
 from sqlalchemy.orm import Session
 from celery.exceptions import MaxRetriesExceededError
+from celery.signals import worker_process_shutdown, worker_shutdown
 
 from app.core.config import get_settings
 from app.core.celery_app import celery_app
+from app.core.http_clients import get_http_client
 from app.database import SessionLocal
-from app.models.chat import ChatMessage
+from app.models.chat import ChatSession
+from app.services.ai_guard import AIUnavailable, ai_call_guard, backoff_delay
+from app.services.chat_service import finish_chat_turn
+from app.services.message_buffer import close_message_buffer, get_message_buffer
+from app.services.single_flight import run_single_flight
+from app.services.session_titles import drain_pending, pending_count, push_pending
+from app.utils import generate_session_titles
 
 settings = get_settings()
 
@@ -18,20 +25,36 @@ def _fetch_ai(payload: dict) -> dict:
     chat_history = payload.get("chat_history", [])
 
     try:
-        # Có thể để timeout=None nếu muốn chờ vô hạn,
-        # nhưng nên giới hạn (ví dụ 120s) để tránh treo worker
-        with httpx.Client(timeout=120.0) as client:
-            print(f"[_fetch_ai] calling AI_API_URL={settings.AI_API_URL} | session={session_id}")
+        client = get_http_client("ai")
+        print(f"[_fetch_ai] calling AI_API_URL={settings.AI_API_URL} | session={session_id}")
+        # Breaker mở / hết slot thì báo AIUnavailable ngay, không dồn thêm lời gọi vào AI
+        with ai_call_guard():
             resp = client.post(settings.AI_API_URL, json={
                 "question": question,
                 "chat_history": chat_history
-            })
+            }, timeout=httpx.Timeout(settings.AI_REQUEST_TIMEOUT_SECONDS, connect=settings.HTTP_CONNECT_TIMEOUT))
             resp.raise_for_status()
-            return resp.json()
+        return resp.json()
+    except AIUnavailable:
+        raise
     except Exception as e:
         raise RuntimeError(f"_fetch_ai failed: {e}")
 
 
+def _buffered_save(task_id: str):
+    """Lưu tin nhắn bot qua buffer của worker; id task làm idempotency key (task giao lại không ghi trùng)."""
+    def save(session_id: int, content: str) -> int:
+        return get_message_buffer().save(session_id, content, key=task_id)
+    return save
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _flush_message_buffer(**kwargs):
+    # Ghi nốt các tin nhắn còn trong buffer trước khi process worker thoát
+    close_message_buffer()
+
+
 # ===== Tasks độc lập (có thể test riêng) =====
 @celery_app.task(bind=True, name="app.tasks.chat.fetch_ai", max_retries=3, default_retry_delay=5)
 def fetch_ai_task(self, payload: dict):
@@ -40,7 +63,8 @@ def fetch_ai_task(self, payload: dict):
         return _fetch_ai(payload)
     except Exception as exc:
         try:
-            delay = (self.request.retries + 1) * 10  # backoff 10s, 20s, 30s
+            # Backoff lũy thừa có jitter; breaker đang mở thì chờ ít nhất tới lúc nó nửa mở
+            delay = max(backoff_delay(self.request.retries), getattr(exc, "retry_after", 0))
             raise self.retry(exc=exc, countdown=delay)
         except MaxRetriesExceededError:
             return {
@@ -53,57 +77,95 @@ def fetch_ai_task(self, payload: dict):
 @celery_app.task(bind=True, name="app.tasks.chat.save_message", max_retries=3, default_retry_delay=5)
 def save_message_task(self, session_id: str, answer: str):
     """Task lưu tin nhắn bot vào DB."""
-    db: Session = SessionLocal()
     try:
-        bot_msg = ChatMessage(
-            session_id=session_id,
-            sender="bot",
-            content=answer,
-            timestamp=datetime.utcnow()
-        )
-        db.add(bot_msg)
-        db.commit()
+        _buffered_save(self.request.id)(session_id, answer)
         print(f"[save_message_task] saved bot message for session={session_id}")
         return {"status": "success"}
     except Exception as db_err:
         print(f"[save_message_task] DB ERROR: {db_err}")
-        db.rollback()
         raise self.retry(exc=db_err)
-    finally:
-        db.close()
 
 
 # ===== Orchestrator (FE chỉ gọi cái này) =====
-@celery_app.task(bind=True, name="app.tasks.chat.call_ai", queue="celery")
-def call_ai_task(self, payload: dict):
-    """Task orchestrator: gọi AI + lưu DB."""
-    session_id = payload["session_id"]
+def _retry_save(task, exc: Exception, **kwargs):
+    """Lưu tin nhắn lỗi (DB / buffer quá hạn): retry với backoff, giữ task id làm idempotency key."""
+    print(f"[{task.name}] DB ERROR: {exc}")
+    return task.retry(exc=exc, countdown=backoff_delay(task.request.retries), **kwargs)
+
+
+@celery_app.task(bind=True, name="app.tasks.chat.call_ai", max_retries=3)
+def call_ai_task(self, payload: dict, result: dict = None):
+    """
+    Task orchestrator: gọi AI + lưu DB. Khi retry vì lỗi lưu, câu trả lời đã có được
+    truyền lại qua `result` nên không gọi lại AI.
+    """
+    if result is not None:
+        try:
+            return finish_chat_turn(payload, result, save=_buffered_save(self.request.id))
+        except Exception as e:
+            raise _retry_save(self, e, kwargs={"result": result})
+
+    def fetch():
+        try:
+            return _fetch_ai(payload)
+        except Exception as e:
+            print(f"[call_ai_task] _fetch_ai failed: {e}")
+            return {"error": "AI service unavailable, please try later."}
+
+    # 1) Gọi AI trực tiếp; câu hỏi trùng đang chạy ở nơi khác thì dùng chung kết quả
+    result, _ = run_single_flight(payload.get("cache_key"), fetch, bypass=payload.get("bypass_cache", False))
 
-    # 1) Gọi AI trực tiếp thay vì gọi task con sync
+    # 2) Lưu DB (tin nhắn riêng cho session này, ghi theo lô), 3) trả kết quả về FE
     try:
-        result = _fetch_ai(payload)
+        return finish_chat_turn(payload, result, save=_buffered_save(self.request.id))
     except Exception as e:
-        print(f"[call_ai_task] _fetch_ai failed: {e}")
-        return {"error": "AI service unavailable, please try later."}
+        raise _retry_save(self, e, kwargs={"result": result})
 
-    # 2) Lưu DB nếu có câu trả lời
-    if isinstance(result, dict) and "answer" in result:
-        db: Session = SessionLocal()
-        try:
-            bot_msg = ChatMessage(
-                session_id=session_id,
-                sender="bot",
-                content=result["answer"],
-                timestamp=datetime.utcnow()
-            )
-            db.add(bot_msg)
-            db.commit()
-            print(f"[call_ai_task] saved bot message for session={session_id}")
-        except Exception as db_err:
-            print(f"[call_ai_task] DB ERROR: {db_err}")
-            db.rollback()
-        finally:
-            db.close()
-
-    # 3) Trả kết quả về FE
-    return result
+
+@celery_app.task(bind=True, name="app.tasks.chat.complete_chat_turn", max_retries=3)
+def complete_chat_turn_task(self, payload: dict, result: dict):
+    """
+    Nhận lượt chat mà API đã gọi AI nhưng quá hạn chờ sync: chỉ lưu kết quả,
+    không gọi lại AI. task_id do API cấp trước nên FE poll như task thường.
+    """
+    try:
+        return finish_chat_turn(payload, result, save=_buffered_save(self.request.id))
+    except Exception as e:
+        raise _retry_save(self, e)
+
+
+# ===== Đặt tiêu đề session (gom lô) =====
+def schedule_session_title(item: dict) -> None:
+    """Đưa session vào hàng đợi đặt tiêu đề; gọi từ API sau khi tạo session."""
+    scheduled = push_pending(item)
+    if scheduled is None:
+        generate_session_titles_task.apply_async(args=[[item]])
+    elif scheduled:
+        # Chờ một chút để các session tạo liền nhau đi chung một request LLM
+        generate_session_titles_task.apply_async(countdown=settings.SESSION_TITLE_BATCH_DELAY_SECONDS)
+
+
+@celery_app.task(bind=True, name="app.tasks.chat.generate_session_titles")
+def generate_session_titles_task(self, items: list = None):
+    """Đặt tiêu đề cho một lô session bằng một request LLM."""
+    items = list(items or []) + drain_pending(settings.SESSION_TITLE_BATCH_SIZE)
+    if not items:
+        return {"status": "idle"}
+
+    titles = generate_session_titles([item["messages"] for item in items])
+    db: Session = SessionLocal()
+    updated = 0
+    try:
+        for item, title in zip(items, titles):
+            # Chỉ thay tiêu đề tạm: người dùng đổi tên trong lúc chờ thì giữ nguyên
+            updated += db.query(ChatSession)\
+                .filter(ChatSession.id == item["session_id"], ChatSession.title == item["fallback"])\
+                .update({"title": title}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+    if pending_count():
+        generate_session_titles_task.apply_async()
+    print(f"[generate_session_titles_task] titled {updated}/{len(items)} sessions")
+    return {"status": "titled", "sessions": len(items), "updated": updated}
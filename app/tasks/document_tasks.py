@@ -1,38 +1,91 @@
 from app.core.celery_app import celery_app
 from app.database import SessionLocal
-from app.models.document import Document, DocumentStatus
-from app.services.content_service import parse_file_content
+from app.models.document import Document, DocumentChunk, DocumentStatus, IndexAction
+from app.services.blob_store import get_blob_store
+from app.services.chunking_service import chunk_legal_text
+from app.services.content_service import parse_file_content, is_parse_error
+from app.services.index_events import record_index_event
+from app.services.parse_cache import get_parsed_text, put_parsed_text
+from app.services.preview_service import warm_preview
+from app.tasks.search_tasks import schedule_index_update
 
 import traceback
 import time
+import unicodedata
+
+def _schedule_preview(document_id: int) -> None:
+    try:
+        warm_preview_task.delay(document_id)
+    except Exception as e:
+        # Không đặt được lịch thì reviewer mở preview sẽ tự sinh (chậm hơn)
+        print(f"[preview] could not schedule pre-render for document {document_id}: {e}")
+
 
 @celery_app.task(bind=True, name="app.tasks.document_tasks.process_document_task", max_retries=3)
-def process_document_task(self, file_path: str, document_id: int):
+def process_document_task(self, document_id: int):
     """
-    Xử lý file upload (parse nội dung, cập nhật DB).
+    Xử lý file upload: lấy file từ blob store, parse nội dung,
+    lưu parsed_content và chia chunk theo cấu trúc văn bản pháp luật.
     """
     db = None
     try:
         start_time = time.time()
         print(f"[DEBUG] Starting process_document_task for document {document_id} at {start_time}")
 
-        content = parse_file_content(file_path)
-        print(f"[DEBUG] Parsed content for document {document_id}, length: {len(content) if content else 0}")
-
         db = SessionLocal()
         doc = db.query(Document).filter(Document.id == document_id).first()
         if not doc:
             print(f"[DEBUG] Document {document_id} not found in database")
             return {"status": "skipped", "reason": "Document not found", "document_id": document_id}
+        if not doc.file_hash:
+            print(f"[DEBUG] Document {document_id} has no stored blob")
+            return {"status": "skipped", "reason": "File content not found", "document_id": document_id}
+
+        parse_stats = {}
+        parse_start = time.time()
+        # Cùng nội dung (upload trùng, task retry) -> lấy text đã parse từ cache
+        content = get_parsed_text(doc.file_hash, doc.type or "")
+        parse_cached = content is not None
+        if not parse_cached:
+            with get_blob_store().open_local(doc.file_hash, suffix=doc.type or "") as file_path:
+                content = parse_file_content(file_path, stats=parse_stats)
+        parse_elapsed = time.time() - parse_start
+        pages = parse_stats.get("pages")
+        pages_per_sec = round(pages / parse_elapsed, 2) if pages and parse_elapsed > 0 else None
+        print(f"[DEBUG] Parsed content for document {document_id}, length: {len(content) if content else 0}, cached: {parse_cached}")
+        if is_parse_error(content):
+            raise RuntimeError(content)
+        if pages:
+            print(f"[DEBUG] Extracted {pages} pages in {parse_elapsed:.2f}s ({pages_per_sec} pages/sec)")
 
         print(f"[DEBUG] Document {document_id} current status: {doc.status}")
         print(f"[DEBUG] Available DocumentStatus values: {[member for member in DocumentStatus.__members__]}")
 
-        if hasattr(doc, "parsed_content"):
-            doc.parsed_content = content
-            print(f"[DEBUG] Updated parsed_content for document {document_id}")
-        else:
-            print(f"[DEBUG] Document {document_id} does not have parsed_content attribute")
+        # Chuẩn hóa NFC trước khi lưu để offset chunk khớp với parsed_content
+        content = unicodedata.normalize("NFC", content or "")
+        if not parse_cached:
+            put_parsed_text(doc.file_hash, doc.type or "", content)
+        doc.parsed_content = content
+        print(f"[DEBUG] Updated parsed_content for document {document_id}")
+
+        chunks = chunk_legal_text(content)
+        # Task có retry -> xóa chunk cũ trước khi ghi lại
+        db.query(DocumentChunk).filter(DocumentChunk.document_id == document_id).delete(synchronize_session=False)
+        db.bulk_insert_mappings(DocumentChunk, [
+            {
+                "document_id": document_id,
+                "chunk_index": chunk.chunk_index,
+                "level": chunk.level,
+                "path": chunk.path[:512],
+                "heading": chunk.heading,
+                "start_offset": chunk.start_offset,
+                "end_offset": chunk.end_offset,
+                "token_count": chunk.token_count,
+                "content": chunk.content,
+            }
+            for chunk in chunks
+        ])
+        print(f"[DEBUG] Stored {len(chunks)} chunks for document {document_id}")
 
         print(f"[DEBUG] Document {document_id} status remains: {doc.status}")
 
@@ -42,7 +95,25 @@ def process_document_task(self, file_path: str, document_id: int):
         db.refresh(doc)
         print(f"[DEBUG] Document {document_id} status after commit: {doc.status}")
 
-        return {"status": "processed", "document_id": document_id}
+        # Văn bản đã approved (duyệt trong lúc đang parse, task retry, upload lại cùng hash):
+        # chunk vừa được ghi lại với id mới -> đồng bộ lại index. Kiểm tra sau commit nên
+        # approve commit trước hay sau lần ghi chunk đều không bị lỡ.
+        if doc.status == DocumentStatus.approved:
+            record_index_event(db, document_id, IndexAction.add)
+            db.commit()
+            schedule_index_update()
+
+        # Sinh sẵn preview ở hàng đợi conversion (LibreOffice) để không giữ worker parse
+        _schedule_preview(document_id)
+
+        return {
+            "status": "processed",
+            "document_id": document_id,
+            "pages": pages,
+            "pages_per_sec": pages_per_sec,
+            "parse_cached": parse_cached,
+            "chunks": len(chunks),
+        }
 
     except Exception as e:
         print(f"[ERROR] Lỗi xử lý document {document_id}: {traceback.format_exc()}")
@@ -51,4 +122,17 @@ def process_document_task(self, file_path: str, document_id: int):
     finally:
         if db:
             db.close()
-            print(f"[DEBUG] Closed database session for document {document_id}")
\ No newline at end of file
+            print(f"[DEBUG] Closed database session for document {document_id}")
+
+
+@celery_app.task(bind=True, name="app.tasks.document_tasks.warm_preview_task")
+def warm_preview_task(self, document_id: int):
+    """Sinh sẵn preview để reviewer mở ngay không phải chờ convert."""
+    db = SessionLocal()
+    try:
+        doc = db.query(Document).filter(Document.id == document_id).first()
+        if not doc:
+            return {"status": "skipped", "reason": "Document not found", "document_id": document_id}
+        return {"status": "warmed" if warm_preview(doc) else "failed", "document_id": document_id}
+    finally:
+        db.close()
@@ -0,0 +1,114 @@
+from app.core.celery_app import celery_app
+from app.database import SessionLocal
+from app.core.config import get_settings
+from app.services.document_service import iter_indexable_chunks, iter_indexable_documents
+from app.services.index_events import claim_index_events, split_events
+from app.services import search_index, vector_index
+
+import time
+
+settings = get_settings()
+
+
+def schedule_index_update() -> None:
+    """Hẹn xử lý các IndexEvent đang chờ (sau approve/reject hoặc khi văn bản approved được parse lại)."""
+    # Trễ vài giây để gom các lần duyệt liên tiếp vào cùng một lô.
+    # Lỗi broker không làm hỏng thao tác: sự kiện đã nằm trong DB, beat sẽ quét lại.
+    try:
+        process_index_events_task.apply_async(countdown=settings.INDEX_EVENT_BATCH_DELAY_SECONDS)
+    except Exception as e:
+        print(f"[index_events] enqueue failed, leaving events for the sweep: {e}")
+
+
+@celery_app.task(bind=True, name="app.tasks.search_tasks.rebuild_search_index_task", max_retries=1)
+def rebuild_search_index_task(self):
+    """Dựng lại toàn bộ index BM25 từ các văn bản đã duyệt."""
+    db = SessionLocal()
+    try:
+        start_time = time.time()
+        manifest = search_index.rebuild_index(iter_indexable_documents(db))
+        elapsed = time.time() - start_time
+        print(f"[search_index] rebuilt version={manifest['version']} in {elapsed:.2f}s")
+        return {"status": "rebuilt", "version": manifest["version"], "elapsed": round(elapsed, 2)}
+    finally:
+        db.close()
+
+
+@celery_app.task(bind=True, name="app.tasks.search_tasks.process_index_events_task", max_retries=3)
+def process_index_events_task(self):
+    """
+    Xử lý các sự kiện approve/reject đang chờ theo lô: một segment mới cho mỗi
+    index, tombstone bản cũ, tăng version một lần cho cả lô.
+    """
+    db = SessionLocal()
+    try:
+        start_time = time.time()
+        events = claim_index_events(db, limit=settings.INDEX_EVENT_BATCH_SIZE)
+        if not events:
+            db.rollback()
+            return {"status": "idle"}
+
+        adds, removes = split_events(events)
+        add_ids = sorted(adds)
+        # Chỉ văn bản còn approved mới được thêm lại; doc khác chỉ bị tombstone
+        bm25 = search_index.apply_changes(iter_indexable_documents(db, add_ids), removes)
+        vectors = vector_index.apply_changes(iter_indexable_chunks(db, add_ids), removes)
+
+        for event in events:
+            db.delete(event)
+        db.commit()
+
+        elapsed = time.time() - start_time
+        print(
+            f"[index_events] applied {len(events)} events (+{len(adds)} -{len(removes)}) "
+            f"bm25_version={bm25['version']} vector_version={vectors['version']} in {elapsed:.2f}s"
+        )
+        if len(events) == settings.INDEX_EVENT_BATCH_SIZE:
+            # Còn sự kiện -> xử lý lô tiếp theo
+            process_index_events_task.delay()
+        return {
+            "status": "applied",
+            "events": len(events),
+            "added": len(adds),
+            "removed": len(removes),
+            "bm25_version": bm25["version"],
+            "vector_version": vectors["version"],
+            "elapsed": round(elapsed, 2),
+        }
+    except Exception as e:
+        db.rollback()
+        raise self.retry(exc=e, countdown=10)
+    finally:
+        db.close()
+
+
+@celery_app.task(bind=True, name="app.tasks.search_tasks.compact_search_index_task")
+def compact_search_index_task(self):
+    """BM25 không lưu text nên compact = dựng lại từ DB khi có nhiều segment."""
+    manifest = search_index.read_manifest()
+    if len(manifest["segments"]) < settings.SEARCH_COMPACT_MIN_SEGMENTS:
+        return {"status": "skipped", "segments": len(manifest["segments"])}
+    return rebuild_search_index_task()
+
+
+@celery_app.task(bind=True, name="app.tasks.search_tasks.compact_vector_index_task")
+def compact_vector_index_task(self):
+    """Gộp segment vector định kỳ (Celery beat)."""
+    start_time = time.time()
+    manifest = vector_index.compact(min_segments=settings.VECTOR_COMPACT_MIN_SEGMENTS)
+    return {
+        "status": "compacted",
+        "segments": len(manifest["segments"]),
+        "version": manifest["version"],
+        "elapsed": round(time.time() - start_time, 2),
+    }
+
+
+@celery_app.task(bind=True, name="app.tasks.search_tasks.rebuild_vector_index_task", max_retries=1)
+def rebuild_vector_index_task(self):
+    db = SessionLocal()
+    try:
+        manifest = vector_index.rebuild(iter_indexable_chunks(db))
+        return {"status": "rebuilt", "version": manifest["version"]}
+    finally:
+        db.close()
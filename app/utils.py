@@ -1,8 +1,9 @@
 from typing import List
-import os, re
-import httpx
+import os, re, json
 from groq import Groq
 
+from app.core.http_clients import get_async_http_client, get_http_client
+
 GROQ_API_URL = os.getenv("GROQ_API")
 GROQ_MODEL = os.getenv("GROQ_MODEL", "qwen/qwen3-32b") 
 
@@ -19,6 +20,20 @@ def capitalize_first_letter(text: str) -> str:
         return text
     return text[0].upper() + text[1:]
 
+def fallback_session_title(messages: List[str]) -> str:
+    """Tiêu đề tạm (không gọi LLM), dùng ngay khi tạo session."""
+    return capitalize_first_letter(_simple_title_fallback(messages))
+
+def _clean_title(title: str, messages: List[str]) -> str:
+    title = re.sub(r"<think>.*?</think>", "", title or "", flags=re.S)
+    title = title.strip().strip(" \"'“”‘’")
+    words = title.split()
+    if len(words) > 12:
+        title = " ".join(words[:12])
+    if len(title) > 80:
+        title = title[:80].rstrip()
+    return capitalize_first_letter(title) if title else fallback_session_title(messages)
+
 async def generate_session_title(messages: List[str]) -> str:
     """
     Gọi GROQ để sinh tiêu đề (~10 từ). Nếu lỗi -> fallback đơn giản.
@@ -38,23 +53,24 @@ async def generate_session_title(messages: List[str]) -> str:
     )
 
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.post(
-                GROQ_API_URL,
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": GROQ_MODEL,
-                    "messages": [
-                        {"role": "system", "content": "Bạn là AI chuyên đặt tiêu đề ngắn gọn cho hội thoại."},
-                        {"role": "user", "content": prompt},
-                    ],
-                    "max_tokens": 24,
-                    "temperature": 0.4,
-                },
-            )
+        client = get_async_http_client("groq")
+        resp = await client.post(
+            GROQ_API_URL,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": GROQ_MODEL,
+                "messages": [
+                    {"role": "system", "content": "Bạn là AI chuyên đặt tiêu đề ngắn gọn cho hội thoại."},
+                    {"role": "user", "content": prompt},
+                ],
+                "max_tokens": 24,
+                "temperature": 0.4,
+            },
+            timeout=15.0,
+        )
         resp.raise_for_status()
         data = resp.json()
         title = (data["choices"][0]["message"]["content"] or "").strip()
@@ -74,3 +90,58 @@ async def generate_session_title(messages: List[str]) -> str:
         return title
     except Exception:
         return capitalize_first_letter(_simple_title_fallback(messages))
+
+
+def generate_session_titles(conversations: List[List[str]]) -> List[str]:
+    """
+    Đặt tiêu đề cho nhiều hội thoại trong MỘT request GROQ (dùng trong Celery).
+    Trả về danh sách cùng thứ tự; hội thoại nào lỗi thì dùng fallback.
+    """
+    fallbacks = [fallback_session_title(messages) for messages in conversations]
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key or not conversations:
+        return fallbacks
+
+    numbered = "\n".join(
+        f"{i + 1}. " + " | ".join(messages[:3])[:500]
+        for i, messages in enumerate(conversations)
+    )
+    prompt = (
+        "Bạn là AI chuyên tạo tiêu đề ngắn gọn cho đoạn hội thoại pháp luật.\n"
+        "Mỗi tiêu đề chỉ gồm 8–12 từ, rõ ràng, súc tích, không dùng dấu chấm cuối.\n"
+        f"Đặt tiêu đề cho {len(conversations)} hội thoại dưới đây. "
+        "Chỉ trả về một mảng JSON các chuỗi, đúng thứ tự, không giải thích.\n\n"
+        f"{numbered}\n\n"
+        "Tiêu đề (JSON):"
+    )
+
+    try:
+        resp = get_http_client("groq").post(
+            GROQ_API_URL,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": GROQ_MODEL,
+                "messages": [
+                    {"role": "system", "content": "Bạn là AI chuyên đặt tiêu đề ngắn gọn cho hội thoại."},
+                    {"role": "user", "content": prompt},
+                ],
+                "max_tokens": 40 * len(conversations),
+                "temperature": 0.4,
+            },
+            timeout=30.0,
+        )
+        resp.raise_for_status()
+        content = resp.json()["choices"][0]["message"]["content"] or ""
+        content = re.sub(r"<think>.*?</think>", "", content, flags=re.S)
+        titles = json.loads(content[content.index("["):content.rindex("]") + 1])
+    except Exception as e:
+        print(f"[generate_session_titles] falling back for {len(conversations)} sessions: {e}")
+        return fallbacks
+
+    return [
+        _clean_title(titles[i], messages) if i < len(titles) and isinstance(titles[i], str) else fallbacks[i]
+        for i, messages in enumerate(conversations)
+    ]
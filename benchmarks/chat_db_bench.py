@@ -0,0 +1,159 @@
+"""
+Benchmark route chat dưới tải đồng thời: độ trễ event loop và p50/p99 mỗi request.
+
+Chạy từ thư mục gốc (cần các biến môi trường bắt buộc của Settings, vd. file .env):
+
+    python -m benchmarks.chat_db_bench --users 40 --turns 5 --db-latency-ms 5
+
+Mỗi user ảo mở một session rồi lặp: POST /chat/ (nhánh async, task Celery được giả
+lập) + GET /chat/session/{id}. DB là một file SQLite tạm; mỗi lệnh SQL bị chèn thêm
+--db-latency-ms để mô phỏng round-trip tới MySQL/Postgres qua mạng. Trong lúc đó một
+task đo độ trễ event loop (thời gian ngủ thực tế - thời gian ngủ yêu cầu).
+
+Script chỉ đi qua HTTP nên chạy được trên cả cây code cũ (Session đồng bộ trong route
+async) lẫn mới (AsyncSession) để so sánh. Lưu ý: SQLite chỉ cho một writer, các kết
+nối async đồng thời phải chờ khóa ghi (busy timeout có backoff) nên đuôi latency khi
+--db-latency-ms 0 cao hơn thực tế trên MySQL/Postgres.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+import httpx
+from sqlalchemy import create_engine
+
+import app.database as database
+from app.api.v1 import chats
+from app.core.security import create_access_token
+from app.database import Base, SessionLocal
+from app.models import chat, document, user  # noqa: F401  (đăng ký bảng)
+from app.models.user import Role, User
+
+DB_LATENCY = 0.0
+
+
+class _SlowCursor(sqlite3.Cursor):
+    def execute(self, *args, **kwargs):
+        time.sleep(DB_LATENCY)  # nhả GIL như khi chờ socket tới DB server
+        return super().execute(*args, **kwargs)
+
+
+class _SlowConnection(sqlite3.Connection):
+    def cursor(self, factory=_SlowCursor):
+        return super().cursor(factory)
+
+
+def setup_database(path: str, users: int):
+    url = f"sqlite:///{path}"
+    connect_args = {"factory": _SlowConnection, "timeout": 30, "check_same_thread": False}
+    plain = create_engine(url)
+    with plain.begin() as conn:
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+    Base.metadata.create_all(plain)
+
+    SessionLocal.configure(bind=plain)
+    db = SessionLocal()
+    role = Role(name="uploader")
+    db.add(role)
+    db.flush()
+    db.add_all([
+        User(username=f"u{i}", fullname=f"u{i}", phone=f"{i}", email=f"u{i}@x.com",
+             hashed_password="x", role_id=role.id)
+        for i in range(users)
+    ])
+    db.commit()
+    db.close()
+
+    # Engine có độ trễ cho cả đường sync lẫn async (nếu cây code có)
+    SessionLocal.configure(bind=create_engine(url, connect_args=connect_args))
+    if hasattr(database, "get_async_sessionmaker"):
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        database.get_async_sessionmaker().configure(
+            bind=create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args=connect_args)
+        )
+
+
+async def probe_loop(stop: asyncio.Event, interval: float, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def user_session(client: httpx.AsyncClient, index: int, turns: int, latencies: list):
+    headers = {"Authorization": "Bearer " + create_access_token({"sub": f"u{index}@x.com"}, timedelta(hours=1))}
+    session_id = None
+    for turn in range(turns):
+        body = {"content": f"câu hỏi số {turn} của user {index}", "session_id": session_id}
+        start = time.perf_counter()
+        resp = await client.post("/chat/", json=body, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        resp.raise_for_status()
+        session_id = resp.json()["session_id"]
+
+        start = time.perf_counter()
+        resp = await client.get(f"/chat/session/{session_id}", headers=headers)
+        latencies.append(time.perf_counter() - start)
+        resp.raise_for_status()
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(args):
+    import main
+
+    lags, latencies = [], []
+    stop = asyncio.Event()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        probe = asyncio.create_task(probe_loop(stop, args.probe_ms / 1000, lags))
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # bỏ log debug của route
+            await asyncio.gather(*[
+                user_session(client, i, args.turns, latencies) for i in range(args.users)
+            ])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await probe
+
+    ms = lambda v: f"{v * 1000:8.1f} ms"
+    print(f"requests: {len(latencies)} in {elapsed:.2f}s ({len(latencies) / elapsed:.0f} req/s)")
+    print(f"latency   p50 {ms(statistics.median(latencies))}  p99 {ms(percentile(latencies, 0.99))}  max {ms(max(latencies))}")
+    print(f"loop lag  p50 {ms(statistics.median(lags))}  p99 {ms(percentile(lags, 0.99))}  max {ms(max(lags))}")
+
+
+def main():
+    global DB_LATENCY
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    parser.add_argument("--probe-ms", type=float, default=10.0)
+    args = parser.parse_args()
+    DB_LATENCY = args.db_latency_ms / 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_database(os.path.join(tmp, "bench.db"), args.users)
+        chats.settings.CHAT_MAX_SYNC_WORDS = 0  # luôn đi nhánh Celery: chỉ đo phần DB của route
+        chats.settings.ANSWER_CACHE_ENABLED = False
+        task = mock.Mock(id="bench-task")
+        with mock.patch.object(chats.call_ai_task, "apply_async", return_value=task), \
+                mock.patch.object(chats, "_schedule_title"), \
+                mock.patch.object(chats, "admit_chat", new=mock.AsyncMock()):  # không tính quota chat
+            asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
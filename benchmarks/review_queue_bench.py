@@ -0,0 +1,90 @@
+"""
+Benchmark hàng đợi duyệt: độ trễ một trang keyset theo độ sâu backlog.
+
+Chạy từ thư mục gốc (cần các biến môi trường bắt buộc của Settings, vd. file .env):
+
+    python -m benchmarks.review_queue_bench --documents 100000 --page-size 50
+
+Dữ liệu tổng hợp trong một file SQLite tạm (mỗi văn bản có ~20KB parsed_content
+để thấy chi phí nếu lỡ nạp cột này). So sánh với cách cũ `query(Document).all()`.
+"""
+import argparse
+import datetime as dt
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import chat, document, user  # noqa: F401  (đăng ký bảng)
+from app.models.document import Document, DocumentStatus
+from app.services.document_service import list_pending_documents
+
+
+def populate(session, n: int, content_size: int) -> None:
+    base = dt.datetime(2025, 1, 1)
+    agencies, types = ["Quốc hội", "Chính phủ", "Bộ Tài chính", "UBND TP"], ["Luật", "Nghị định", "Thông tư"]
+    content = "x" * content_size
+    for start in range(0, n, 5000):
+        session.bulk_insert_mappings(Document, [
+            {
+                "filename": f"doc-{i}.pdf",
+                "type": ".pdf",
+                "status": DocumentStatus.pending if i % 10 else DocumentStatus.approved,
+                "issuer_agency": agencies[i % len(agencies)],
+                "document_type": types[i % len(types)],
+                "created_at": base + dt.timedelta(seconds=i * 37 % n),
+                "parsed_content": content,
+            }
+            for i in range(start, min(start + 5000, n))
+        ])
+        session.commit()
+
+
+def walk(session, sort: str, page_size: int, pages: int):
+    """Đi tuần tự `pages` trang; trả về độ trễ (ms) của trang đầu và các trang sâu nhất."""
+    timings, cursor = [], None
+    for _ in range(pages):
+        start = time.perf_counter()
+        rows, cursor = list_pending_documents(session, sort=sort, cursor=cursor, limit=page_size)
+        timings.append((time.perf_counter() - start) * 1000)
+        if not cursor:
+            break
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--content-size", type=int, default=20_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+
+        start = time.perf_counter()
+        populate(session, args.documents, args.content_size)
+        print(f"populated {args.documents} documents in {time.perf_counter() - start:.1f}s")
+
+        for sort in ("id", "created_at", "issuer_agency"):
+            timings = walk(session, sort, args.page_size, args.pages)
+            tail = timings[-50:]
+            print(
+                f"keyset sort={sort:<13} pages={len(timings):<5} first={timings[0]:.2f}ms "
+                f"median={statistics.median(timings):.2f}ms last50_median={statistics.median(tail):.2f}ms"
+            )
+
+        start = time.perf_counter()
+        rows = session.query(Document).filter(Document.status == DocumentStatus.pending).all()
+        print(f"old .all(): {len(rows)} rows in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
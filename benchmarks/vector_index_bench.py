@@ -0,0 +1,88 @@
+"""
+Benchmark vector index: recall@k và độ trễ của IVF so với brute-force.
+
+Chạy từ thư mục gốc (cần các biến môi trường bắt buộc của Settings, vd. file .env):
+
+    python -m benchmarks.vector_index_bench --vectors 200000 --dim 384 --queries 256
+
+Dữ liệu tổng hợp gồm các cụm Gauss trên mặt cầu (gần với phân bố embedding thật
+hơn là nhiễu đều). Ground truth là kết quả brute-force trên cùng dữ liệu.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.services import index_files
+from app.services.vector_index import VectorIndex, _write_segment
+
+
+def make_data(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    x = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+
+def build_index(root: Path, vectors: np.ndarray, ivf: bool, dtype: str) -> VectorIndex:
+    root.mkdir(parents=True, exist_ok=True)
+    ids = np.arange(len(vectors), dtype=np.int64)
+    seg = _write_segment(root, vectors, ids, ids, ivf=ivf, dtype=dtype)
+    manifest = {"version": 1, "dim": vectors.shape[1], "dtype": dtype, "embedder": "bench", "segments": [seg]}
+    index_files.write_manifest(root, manifest)
+    return VectorIndex(root, manifest)
+
+
+def timed_search(index: VectorIndex, queries: np.ndarray, k: int, batch: int, nprobe: int):
+    results = []
+    latencies = []
+    for start in range(0, len(queries), batch):
+        t0 = time.perf_counter()
+        results.extend(index.search_vectors(queries[start:start + batch], k=k, nprobe=nprobe))
+        latencies.append((time.perf_counter() - t0) * 1000 / len(queries[start:start + batch]))
+    return results, float(np.mean(latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--dtype", default="float16")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    data = make_data(args.vectors + args.queries, args.dim, args.clusters)
+    vectors, queries = data[:args.vectors], data[args.vectors:]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        brute = build_index(Path(tmp) / "brute", vectors, ivf=False, dtype=args.dtype)
+        print(f"build brute-force: {time.perf_counter() - t0:.2f}s")
+        t0 = time.perf_counter()
+        ivf = build_index(Path(tmp) / "ivf", vectors, ivf=True, dtype=args.dtype)
+        print(f"build IVF (nlist={len(ivf.segments[0].centroids)}): {time.perf_counter() - t0:.2f}s")
+
+        truth, brute_ms = timed_search(brute, queries, args.k, args.batch, nprobe=1)
+        print(f"brute-force: {brute_ms:.3f} ms/query (batch={args.batch})")
+        truth_sets = [{hit.chunk_id for hit in hits} for hits in truth]
+
+        for nprobe in args.nprobe:
+            approx, ivf_ms = timed_search(ivf, queries, args.k, args.batch, nprobe=nprobe)
+            recall = np.mean([
+                len(truth_sets[i] & {hit.chunk_id for hit in hits}) / max(1, len(truth_sets[i]))
+                for i, hits in enumerate(approx)
+            ])
+            print(f"IVF nprobe={nprobe:>3}: recall@{args.k}={recall:.3f}  {ivf_ms:.3f} ms/query  "
+                  f"speedup x{brute_ms / ivf_ms:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,27 @@ from fastapi import FastAPI
 from fastapi.openapi.utils import get_openapi
 from app.api.v1 import auth, users, chats, admin, documents
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from app.core.config import get_settings
+from app.core.http_clients import close_async_http_clients
+from app.database import dispose_async_engine
+from app.services.task_status import close_task_watcher
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Lượt chat đã chuyển giao sang Celery đang chờ AI: chờ xong hoặc ghi FAILURE cho task_id
+    await chats.drain_handoffs(get_settings().CHAT_HANDOFF_SHUTDOWN_SECONDS)
+    # Đóng các HTTP client pool dùng chung (AI, Groq), pool DB async và kết nối pub/sub
+    await close_async_http_clients()
+    await dispose_async_engine()
+    await close_task_watcher()
 
 app = FastAPI(
     title="RAG Legal Backend",
     description="API backend for RAG legal document processing",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Include routers
@@ -25,6 +41,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 def custom_openapi():